@@ -0,0 +1,52 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022 Wrangle Ltd
+
+"""Runs the benchmark suite offline::
+
+    python -m benchmarks --rows 100000 --cols 10
+"""
+
+import argparse
+import json
+import sys
+
+from benchmarks import harness, repository_bench
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--cols", type=int, default=10)
+    parser.add_argument("--change-fraction", type=float, default=0.01)
+    parser.add_argument("--history", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--gzip-level",
+        type=int,
+        default=6,
+        help="compression level of CSV responses, 0 disables compression",
+    )
+    parser.add_argument(
+        "--only", action="append", help="name of a benchmark to run, repeatable"
+    )
+    parser.add_argument("--json", help="also write results to this JSON file")
+    args = parser.parse_args(argv)
+
+    results = repository_bench.run(
+        rows=args.rows,
+        cols=args.cols,
+        change_fraction=args.change_fraction,
+        history=args.history,
+        repeat=args.repeat,
+        only=args.only,
+        gzip_level=args.gzip_level,
+    )
+    print(harness.report(results))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump([r.to_dict() for r in results], f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022 Wrangle Ltd
+
+import gc
+import statistics
+import time
+import tracemalloc
+import typing
+
+import attr
+
+
+def percentile(values: typing.List[float], p: float) -> float:
+    """Returns the p-th percentile (0-100) using linear interpolation
+
+    :rtype: float
+    """
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+@attr.s(auto_attribs=True)
+class BenchResult(object):
+    """Result of a single benchmark
+
+    :ivar str name: benchmark name
+    :ivar int items: number of items (rows, commits...) processed by each run
+    :ivar str unit: name of the items
+    :ivar list[float] times: seconds taken by each run
+    :ivar int peak_memory: peak traced memory in bytes during one run
+    :ivar list[float] latencies: latency in seconds of each request made during the timed runs
+    :ivar int bytes_in: bytes received over the wire, i.e. before decompression, per timed run
+    """
+
+    name: str
+    items: int
+    unit: str
+    times: typing.List[float]
+    peak_memory: int = 0
+    latencies: typing.List[float] = attr.ib(factory=list)
+    bytes_in: int = 0
+
+    @property
+    def median(self) -> float:
+        return statistics.median(self.times)
+
+    @property
+    def throughput(self) -> float:
+        """Items per second, based on the median run
+
+        :rtype: float
+        """
+        return self.items / self.median if self.median > 0 else 0.0
+
+    def to_dict(self) -> typing.Dict:
+        return {
+            "name": self.name,
+            "items": self.items,
+            "unit": self.unit,
+            "median": self.median,
+            "min": min(self.times),
+            "throughput": self.throughput,
+            "peak_memory": self.peak_memory,
+            "latency_p50": percentile(self.latencies, 50),
+            "latency_p90": percentile(self.latencies, 90),
+            "latency_p99": percentile(self.latencies, 99),
+            "requests": len(self.latencies),
+            "bytes_in": self.bytes_in,
+        }
+
+
+def measure(
+    name: str,
+    fn: typing.Callable[[], typing.Any],
+    items: int,
+    unit: str = "rows",
+    repeat: int = 3,
+    latencies: typing.List[float] = None,
+    trace_memory: bool = True,
+    bytes_in: typing.List[int] = None,
+) -> BenchResult:
+    """Runs `fn` once under tracemalloc to record peak memory, then `repeat` times for timing
+
+    :param list[float] latencies: optional, a list that request latencies are appended to while
+        `fn` runs, e.g. by a :class:`wrgl.instrument.CallbackInstrumentation`. Only latencies
+        from the timed runs are kept.
+    :param list[int] bytes_in: optional, like `latencies`, a list that bytes received by each
+        request are appended to.
+
+    :rtype: BenchResult
+    """
+    peak = 0
+    if trace_memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            fn()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    else:
+        fn()
+    if latencies is not None:
+        del latencies[:]
+    if bytes_in is not None:
+        del bytes_in[:]
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return BenchResult(
+        name=name,
+        items=items,
+        unit=unit,
+        times=times,
+        peak_memory=peak,
+        latencies=list(latencies) if latencies is not None else [],
+        bytes_in=sum(bytes_in) // repeat if bytes_in and repeat else 0,
+    )
+
+
+def _fmt_bytes(n: float) -> str:
+    for unit in ["B", "KiB", "MiB", "GiB"]:
+        if abs(n) < 1024 or unit == "GiB":
+            return "%.1f %s" % (n, unit)
+        n /= 1024
+    return ""
+
+
+def report(results: typing.List[BenchResult]) -> str:
+    """Formats results as a plain text table
+
+    :rtype: str
+    """
+    header = [
+        "benchmark",
+        "median",
+        "throughput",
+        "peak mem",
+        "reqs",
+        "p50",
+        "p90",
+        "p99",
+        "wire/run",
+    ]
+    lines = []
+    for r in results:
+        d = r.to_dict()
+        lines.append(
+            [
+                r.name,
+                "%.4fs" % d["median"],
+                "%.0f %s/s" % (d["throughput"], r.unit),
+                _fmt_bytes(d["peak_memory"]),
+                str(d["requests"]),
+                "%.1fms" % (d["latency_p50"] * 1000),
+                "%.1fms" % (d["latency_p90"] * 1000),
+                "%.1fms" % (d["latency_p99"] * 1000),
+                _fmt_bytes(d["bytes_in"]),
+            ]
+        )
+    widths = [max(len(row[i]) for row in [header] + lines) for i in range(len(header))]
+    return "\n".join(
+        "  ".join(cell.ljust(w) for cell, w in zip(row, widths))
+        for row in [header] + lines
+    )
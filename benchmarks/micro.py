@@ -0,0 +1,355 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022 Wrangle Ltd
+
+"""Micro-benchmarks of CPU hot paths that do not touch the network::
+
+    python -m benchmarks.micro                      # compare against stored baseline
+    python -m benchmarks.micro --save-baseline      # record a new baseline
+    python -m benchmarks.micro --scale 0.1 --only coldiff_init
+
+Baselines are machine specific; record one on the machine you compare on.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import sys
+import typing
+
+from benchmarks.harness import BenchResult, measure
+from wrgl.coldiff import ColDiff, longest_increasing_list
+from wrgl.commit import CommitTree, Table
+from wrgl.commitgraph import CommitGraph
+from wrgl.diff import DiffResult
+from wrgl.isoformat import fromisoformat
+from wrgl.serialize import json_dumpb, json_dumps, json_loads
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines", "micro.json")
+
+# a case returns the function to time and the number of items it processes
+Case = typing.Callable[[float], typing.Tuple[typing.Callable[[], typing.Any], int, str]]
+
+
+def _scaled(n: int, scale: float) -> int:
+    return max(1, int(n * scale))
+
+
+def diff_payload(n_rows: int) -> bytes:
+    rnd = random.Random(0)
+    row_diff = []
+    for i in range(n_rows):
+        kind = rnd.random()
+        if kind < 0.1:
+            row_diff.append({"off1": i})
+        elif kind < 0.2:
+            row_diff.append({"off2": i})
+        else:
+            row_diff.append({"off1": i, "off2": i})
+    columns = ["id"] + ["col_%d" % i for i in range(1, 10)]
+    return json.dumps(
+        {
+            "tableSum": "%032x" % 1,
+            "oldTableSum": "%032x" % 2,
+            "oldPK": [0],
+            "pk": [0],
+            "oldColumns": columns,
+            "columns": columns,
+            "rowDiff": row_diff,
+        }
+    ).encode("utf8")
+
+
+# longest chain of commits in a generated commit tree. Trees nest one level per commit, so
+# deeper chains would exceed the default recursion limit of the JSON encoders under test.
+COMMIT_CHAIN = 100
+
+
+def _commit_obj(i: int) -> typing.Dict:
+    return {
+        "authorName": "John Doe",
+        "authorEmail": "john@domain.com",
+        "message": "commit %d" % i,
+        "table": {"sum": "%032x" % i, "exist": True},
+        "time": "2022-12-15T08:%02d:%02dZ" % (i // 60 % 60, i % 60),
+        "parents": [],
+    }
+
+
+def commit_tree_payload(n_commits: int) -> bytes:
+    """`n_commits` commits nested the way wrgld returns them. They form linear chains of at
+    most :data:`COMMIT_CHAIN` commits, all merged by a root commit whose checksum is
+    `n_commits`.
+    """
+    heads = dict()
+    for start in range(0, n_commits, COMMIT_CHAIN):
+        head = None
+        for i in range(start, min(start + COMMIT_CHAIN, n_commits)):
+            com = _commit_obj(i)
+            if head is not None:
+                com["parents"] = ["%032x" % (i - 1)]
+                com["parentCommits"] = {"%032x" % (i - 1): head}
+            head = com
+        heads["%032x" % i] = head
+    root = _commit_obj(n_commits)
+    root["parents"] = list(heads)
+    root["parentCommits"] = heads
+    return json.dumps({"sum": "%032x" % n_commits, "root": root}).encode("utf8")
+
+
+def wide_tables(n_cols: int) -> typing.Tuple[Table, Table]:
+    """Two versions of a table where some columns were added, removed and moved"""
+    rnd = random.Random(0)
+    old_cols = ["col_%d" % i for i in range(n_cols)]
+    new_cols = [c for c in old_cols if rnd.random() > 0.02]
+    for _ in range(n_cols // 100):
+        i = rnd.randrange(1, len(new_cols))
+        j = rnd.randrange(1, len(new_cols))
+        new_cols.insert(j, new_cols.pop(i))
+    new_cols += ["new_%d" % i for i in range(n_cols // 50)]
+    return Table(columns=old_cols, pk=[0]), Table(columns=new_cols, pk=[0])
+
+
+def case_json_loads_diff(scale: float):
+    n = _scaled(1000000, scale)
+    payload = diff_payload(n)
+    return lambda: json_loads(payload, DiffResult), n, "rows"
+
+
+def case_json_dumps_diff(scale: float):
+    n = _scaled(1000000, scale)
+    obj = json_loads(diff_payload(n), DiffResult)
+    return lambda: json_dumps(obj), n, "rows"
+
+
+def case_json_dumpb_diff(scale: float):
+    n = _scaled(1000000, scale)
+    obj = json_loads(diff_payload(n), DiffResult)
+    return lambda: json_dumpb(obj), n, "rows"
+
+
+def case_json_loads_commit_tree(scale: float):
+    n = _scaled(10000, scale)
+    payload = commit_tree_payload(n)
+    return lambda: json_loads(payload, CommitTree), n, "commits"
+
+
+def case_json_dumpb_commit_tree(scale: float):
+    n = _scaled(10000, scale)
+    obj = json_loads(commit_tree_payload(n), CommitTree)
+    return lambda: json_dumpb(obj), n, "commits"
+
+
+def case_coldiff_init(scale: float):
+    n = _scaled(5000, scale)
+    old, new = wide_tables(n)
+    return lambda: ColDiff(old, new), n, "columns"
+
+
+def case_combine_rows(scale: float):
+    n = _scaled(5000, scale)
+    old, new = wide_tables(n)
+    cd = ColDiff(old, new)
+    n_rows = 100
+    new_rows = [["v%d" % i for i in range(len(new.columns))]] * n_rows
+    old_rows = [["w%d" % i for i in range(len(old.columns))]] * n_rows
+
+    def run():
+        for r1, r2 in zip(new_rows, old_rows):
+            cd.combine_rows(0, r1, r2)
+
+    return run, n * n_rows, "cells"
+
+
+def case_longest_increasing_list(scale: float):
+    n = _scaled(5000, scale)
+    rnd = random.Random(0)
+    # mostly ordered, as column indices are after a few moves
+    values = list(range(n))
+    for _ in range(n // 100):
+        i = rnd.randrange(n)
+        j = rnd.randrange(n)
+        values.insert(j, values.pop(i))
+    return lambda: longest_increasing_list(values), n, "values"
+
+
+def case_fromisoformat(scale: float):
+    n = _scaled(100000, scale)
+    values = [
+        "2022-%02d-%02dT%02d:%02d:%02dZ" % (1 + i % 12, 1 + i % 28, i % 24, i % 60, i % 60)
+        for i in range(n)
+    ]
+
+    def run():
+        for v in values:
+            fromisoformat(v)
+
+    return run, n, "timestamps"
+
+
+def case_fromisoformat_offset(scale: float):
+    n = _scaled(100000, scale)
+    values = [
+        "2022-%02d-%02dT%02d:%02d:%02d.%06d+%02d:00"
+        % (1 + i % 12, 1 + i % 28, i % 24, i % 60, i % 60, i, i % 12)
+        for i in range(n)
+    ]
+
+    def run():
+        for v in values:
+            fromisoformat(v)
+
+    return run, n, "timestamps"
+
+
+def case_commit_graph(scale: float):
+    n = _scaled(10000, scale)
+    payload = commit_tree_payload(n)
+
+    def run():
+        graph = CommitGraph()
+        graph.add_tree(json.loads(payload))
+        # first-parent walks, which read no commit time
+        for head in graph.parents("%032x" % n):
+            graph.first_parents(head)
+
+    return run, n, "commits"
+
+
+CASES: typing.Dict[str, Case] = {
+    "json_loads_diff": case_json_loads_diff,
+    "json_dumps_diff": case_json_dumps_diff,
+    "json_dumpb_diff": case_json_dumpb_diff,
+    "json_loads_commit_tree": case_json_loads_commit_tree,
+    "json_dumpb_commit_tree": case_json_dumpb_commit_tree,
+    "coldiff_init": case_coldiff_init,
+    "combine_rows": case_combine_rows,
+    "longest_increasing_list": case_longest_increasing_list,
+    "fromisoformat": case_fromisoformat,
+    "fromisoformat_offset": case_fromisoformat_offset,
+    "commit_graph": case_commit_graph,
+}
+
+
+def run(
+    scale: float = 1.0,
+    repeat: int = 3,
+    only: typing.List[str] = None,
+    trace_memory: bool = False,
+) -> typing.List[BenchResult]:
+    """Runs the micro-benchmarks
+
+    :param float scale: multiplies the default sizes (1M row diffs, 5,000 columns, 10,000 commits)
+    :param int repeat: number of timed runs per case
+    :param list[str] only: optional, names of cases to run
+    :param bool trace_memory: also record peak memory. Tracing slows the 1M row cases
+        down several times over, so it is off by default.
+    """
+    results = []
+    for name, case in CASES.items():
+        if only and name not in only:
+            continue
+        fn, items, unit = case(scale)
+        results.append(
+            measure(name, fn, items, unit, repeat=repeat, trace_memory=trace_memory)
+        )
+    return results
+
+
+def load_baseline(path: str = BASELINE_PATH) -> typing.Dict:
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except OSError:
+        return {}
+
+
+def save_baseline(
+    results: typing.List[BenchResult], scale: float, path: str = BASELINE_PATH
+) -> None:
+    baseline = load_baseline(path)
+    baseline.update(
+        {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "scale": scale,
+            "recorded": datetime.date.today().isoformat(),
+        }
+    )
+    cases = baseline.setdefault("cases", {})
+    for r in results:
+        cases[r.name] = r.to_dict()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def compare(
+    results: typing.List[BenchResult], baseline: typing.Dict, threshold: float = 1.2
+) -> typing.Tuple[str, typing.List[str]]:
+    """Compares results against a baseline
+
+    :param float threshold: a case is a regression if its median is this many times slower
+
+    :return: the report and the names of regressed cases
+    :rtype: tuple[str, list[str]]
+    """
+    cases = baseline.get("cases", {})
+    lines = [
+        "%-26s %12s %12s %8s"
+        % ("case", "baseline", "current", "ratio")
+    ]
+    regressions = []
+    for r in results:
+        base = cases.get(r.name, None)
+        if base is None or base.get("items") != r.items:
+            lines.append("%-26s %12s %11.4fs %8s" % (r.name, "-", r.median, "n/a"))
+            continue
+        ratio = r.median / base["median"] if base["median"] > 0 else float("inf")
+        mark = ""
+        if ratio > threshold:
+            mark = "  REGRESSION"
+            regressions.append(r.name)
+        elif ratio < 1 / threshold:
+            mark = "  faster"
+        lines.append(
+            "%-26s %11.4fs %11.4fs %7.2fx%s"
+            % (r.name, base["median"], r.median, ratio, mark)
+        )
+    return "\n".join(lines), regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.micro")
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", action="append", choices=sorted(CASES))
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--memory", action="store_true", help="also record peak memory")
+    parser.add_argument("--threshold", type=float, default=1.2)
+    parser.add_argument(
+        "--fail-on-regression",
+        action="store_true",
+        help="exit with status 1 if any case is slower than the baseline by more than --threshold",
+    )
+    args = parser.parse_args(argv)
+
+    results = run(
+        scale=args.scale, repeat=args.repeat, only=args.only, trace_memory=args.memory
+    )
+    if args.save_baseline:
+        save_baseline(results, args.scale, args.baseline)
+        print("baseline saved to %s" % args.baseline)
+    text, regressions = compare(results, load_baseline(args.baseline), args.threshold)
+    print(text)
+    if regressions and args.fail_on_regression:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
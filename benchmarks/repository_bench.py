@@ -0,0 +1,134 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022 Wrangle Ltd
+
+"""End-to-end benchmarks of :class:`wrgl.repository.Repository` against
+:class:`wrgl.fakeserver_test.FakeWrgld`. The server runs on a thread of the
+benchmark process, so absolute numbers include its CPU time; compare runs made on
+the same machine.
+"""
+
+import io
+import typing
+
+from benchmarks.harness import BenchResult, measure
+from wrgl.commit import CommitTree
+from wrgl.diff import DiffResult
+from wrgl.fakeserver_test import FakeWrgld, _to_csv, modify_rows, synthetic_rows
+from wrgl.instrument import CallbackInstrumentation
+from wrgl.repository import Repository
+from wrgl.serialize import json_loads
+
+
+def run(
+    rows: int = 100000,
+    cols: int = 10,
+    change_fraction: float = 0.01,
+    history: int = 200,
+    repeat: int = 3,
+    only: typing.List[str] = None,
+    server: FakeWrgld = None,
+    gzip_level: int = 6,
+) -> typing.List[BenchResult]:
+    """Runs the repository benchmarks
+
+    :param int rows: number of rows of the synthetic table
+    :param int cols: number of columns of the synthetic table
+    :param float change_fraction: fraction of rows updated between the two diffed commits
+    :param int history: number of commits in the history used for commit tree benchmarks
+    :param int repeat: number of timed runs per benchmark
+    :param list[str] only: optional, names of benchmarks to run
+    :param FakeWrgld server: optional, a started server to use instead of a new one
+    :param int gzip_level: compression level of CSV responses of the server, 0 disables compression
+    """
+    own_server = server is None
+    if own_server:
+        server = FakeWrgld(gzip_level=gzip_level).start()
+    try:
+        return _run(server, rows, cols, change_fraction, history, repeat, only)
+    finally:
+        if own_server:
+            server.stop()
+
+
+def _run(server, rows, cols, change_fraction, history, repeat, only):
+    columns, data = synthetic_rows(rows, cols)
+    sum1 = server.add_commit("bench", columns, ["id"], data, message="base")
+    sum2 = server.add_commit(
+        "bench", columns, ["id"], modify_rows(data, change_fraction), message="change"
+    )
+    small_cols, small_rows = synthetic_rows(10, 3)
+    for i in range(history):
+        server.add_commit("history", small_cols, ["id"], small_rows, message="c%d" % i)
+    csv_bytes = _to_csv([columns] + data)
+
+    latencies: typing.List[float] = []
+    bytes_in: typing.List[int] = []
+
+    def on_request(e):
+        latencies.append(e.latency)
+        bytes_in.append(e.bytes_in or 0)
+
+    repo = Repository(
+        server.uri,
+        "bench-client",
+        "secret",
+        instrumentation=CallbackInstrumentation(on_request=on_request),
+    )
+    repo.authenticate()
+
+    def export():
+        n = 0
+        for _ in repo.get_blocks(sum2, with_column_names=False):
+            n += 1
+        assert n == len(server.tables[server.commits[sum2]["table"]]["rows"])
+
+    def diff_iteration():
+        dr = repo.diff_reader(sum2, sum1, fetch_size=1000)
+        for it in [dr.added_rows, dr.removed_rows, dr.modified_rows]:
+            for _ in it:
+                pass
+
+    def commit_upload():
+        repo.commit("upload", "bench", io.BytesIO(csv_bytes), ["id"])
+
+    tree_bytes = repo._client.get(
+        "/commits/", params={"head": "heads/history", "maxDepth": history}
+    ).content
+    diff_bytes = repo._client.get("/diff/%s/%s/" % (sum2, sum1)).content
+    n_diff = len(json_loads(diff_bytes, DiffResult).row_diff)
+
+    benches = [
+        ("export", export, rows, "rows", True),
+        ("diff_iteration", diff_iteration, n_diff, "rows", True),
+        ("commit_upload", commit_upload, rows, "rows", True),
+        (
+            "deserialize_commit_tree",
+            lambda: json_loads(tree_bytes, CommitTree),
+            history,
+            "commits",
+            False,
+        ),
+        (
+            "deserialize_diff",
+            lambda: json_loads(diff_bytes, DiffResult),
+            n_diff,
+            "rows",
+            False,
+        ),
+    ]
+    results = []
+    for name, fn, items, unit, over_network in benches:
+        if only and name not in only:
+            continue
+        results.append(
+            measure(
+                name,
+                fn,
+                items,
+                unit,
+                repeat=repeat,
+                latencies=latencies if over_network else None,
+                bytes_in=bytes_in if over_network else None,
+            )
+        )
+    return results
@@ -2,9 +2,19 @@
 # Copyright © 2022 Wrangle Ltd
 
 from wrgl.config import Config, User, Remote, Branch, Receive, Auth, Pack
+from wrgl.changes import ChangeEvent
 from wrgl.commit import Commit, CommitResult, CommitTree, Table
+from wrgl.commitgraph import CommitGraph, CommitRecord, TimeIndex
 from wrgl.diff import DiffResult, RowDiff
+from wrgl.instrument import Instrumentation, MetricsCollector
+from wrgl.mirror import SyncResult, TableMirror
+from wrgl.pkindex import PKIndex
+from wrgl.ratelimit import RequestScheduler
 from wrgl.repository import Repository
+from wrgl.retry import RetryPolicy, RetryBudget
+from wrgl.tokenstore import TokenStore, FileTokenStore
+from wrgl.uma import UMAContext
+from wrgl.watch import RefChange, RefWatcher
 
 __all__ = [
     "Config",
@@ -14,11 +24,28 @@ __all__ = [
     "Receive",
     "Auth",
     "Pack",
+    "ChangeEvent",
     "Commit",
     "CommitResult",
     "CommitTree",
+    "CommitGraph",
+    "CommitRecord",
+    "TimeIndex",
     "Table",
     "DiffResult",
     "RowDiff",
     "Repository",
+    "Instrumentation",
+    "MetricsCollector",
+    "PKIndex",
+    "SyncResult",
+    "TableMirror",
+    "RequestScheduler",
+    "RetryPolicy",
+    "RetryBudget",
+    "TokenStore",
+    "FileTokenStore",
+    "UMAContext",
+    "RefChange",
+    "RefWatcher",
 ]
@@ -0,0 +1,68 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022 Wrangle Ltd
+
+"""Columnar export of Wrgl tables with `Apache Arrow <https://arrow.apache.org/docs/python/>`_.
+
+Block streams are handed to Arrow's multithreaded CSV parser as they arrive, so cells never
+become Python strings. Requires ``pyarrow``, installed with ``pip install wrgl[arrow]``.
+See :func:`wrgl.repository.Repository.to_arrow` and :func:`wrgl.repository.Repository.export_parquet`.
+"""
+
+import typing
+
+from wrgl.ranges import ResponseReader
+
+# number of blocks fetched by each request, i.e. 16,320 rows
+DEFAULT_BLOCKS_PER_REQUEST = 64
+
+
+def import_pyarrow():
+    """Imports pyarrow, pointing at the extra that installs it if it is missing"""
+    try:
+        import pyarrow
+        import pyarrow.csv
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError(
+            "pyarrow is required for Arrow and Parquet export, install it with: pip install wrgl[arrow]"
+        ) from e
+    return pyarrow
+
+
+def pinned_types(schema) -> typing.Dict[str, typing.Any]:
+    """Column types to parse later ranges with so that every range shares the first one's schema.
+    Columns that were entirely empty are read as strings.
+    """
+    pa = import_pyarrow()
+    return {
+        f.name: pa.string() if pa.types.is_null(f.type) else f.type for f in schema
+    }
+
+
+def read_csv_range(
+    resp,
+    column_names: typing.List[str],
+    column_types: typing.Dict[str, typing.Any] = None,
+    include_columns: typing.List[str] = None,
+):
+    """Parses a streamed CSV response without header into a pyarrow.Table, closing the response
+
+    :param list[str] column_names: names of all columns in the CSV
+    :param dict column_types: optional, types of some or all columns. Other columns are inferred.
+    :param list[str] include_columns: optional, only parse these columns, in this order
+
+    :rtype: pyarrow.Table
+    """
+    pa = import_pyarrow()
+    with resp:
+        reader = pa.csv.open_csv(
+            ResponseReader(resp),
+            read_options=pa.csv.ReadOptions(column_names=column_names),
+            parse_options=pa.csv.ParseOptions(newlines_in_values=True),
+            convert_options=pa.csv.ConvertOptions(
+                column_types=column_types or {},
+                include_columns=include_columns or [],
+                strings_can_be_null=False,
+            ),
+        )
+        return reader.read_all()
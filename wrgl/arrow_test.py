@@ -0,0 +1,74 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022 Wrangle Ltd
+
+import os
+import tempfile
+import unittest
+from unittest import TestCase
+
+from wrgl.fakeserver_test import FakeWrgld, synthetic_rows
+from wrgl.repository import Repository, BLOCK_SIZE
+from wrgl.retry import RetryPolicy
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+@unittest.skipUnless(pyarrow is not None, "pyarrow is not installed")
+class ArrowExportTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = FakeWrgld().start()
+        self.addCleanup(self.server.stop)
+        self.columns, self.rows = synthetic_rows(BLOCK_SIZE * 5 + 10, 4)
+        self.sum = self.server.add_commit("main", self.columns, ["id"], self.rows)
+        self.repo = Repository(
+            self.server.uri,
+            "my-client",
+            "secret",
+            retry_policy=RetryPolicy(backoff_factor=0),
+        )
+
+    def test_to_arrow(self):
+        tbl = self.repo.to_arrow(self.sum, blocks_per_request=2, workers=2)
+        self.assertEqual(tbl.column_names, self.columns)
+        self.assertEqual(tbl.num_rows, len(self.rows))
+        self.assertEqual(
+            [str(v) for v in tbl.column(0).to_pylist()], [r[0] for r in self.rows]
+        )
+
+        tbl = self.repo.to_arrow("heads/main", infer_types=False, start=1, end=3)
+        self.assertEqual(
+            tbl.to_pylist()[0], dict(zip(self.columns, self.rows[BLOCK_SIZE]))
+        )
+        self.assertEqual(tbl.num_rows, BLOCK_SIZE * 2)
+
+        schema = pyarrow.schema([(self.columns[1], pyarrow.string())])
+        tbl = self.repo.to_arrow(self.sum, schema=schema)
+        self.assertEqual(tbl.schema, schema)
+        self.assertEqual(tbl.column(0).to_pylist(), [r[1] for r in self.rows])
+
+    def test_to_arrow_retries_broken_range(self):
+        self.server.fail_next(
+            1,
+            path_prefix="/tables/%s/blocks/" % self.server.commits[self.sum]["table"],
+            break_after=100,
+        )
+        tbl = self.repo.to_arrow(self.sum, infer_types=False, workers=1)
+        self.assertEqual(tbl.num_rows, len(self.rows))
+
+    def test_export_parquet(self):
+        with tempfile.TemporaryDirectory() as dirname:
+            path = os.path.join(dirname, "data.parquet")
+            n = self.repo.export_parquet(
+                self.sum, path, infer_types=False, blocks_per_request=2
+            )
+            self.assertEqual(n, len(self.rows))
+            f = pyarrow.parquet.ParquetFile(path)
+            self.assertEqual(f.metadata.num_row_groups, 3)
+            self.assertEqual(
+                f.read().to_pylist()[-1], dict(zip(self.columns, self.rows[-1]))
+            )
@@ -0,0 +1,76 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022 Wrangle Ltd
+
+"""Finds the commits that last changed rows, by bisecting the history of a branch.
+
+A row is looked up by primary key in the head table, through a :class:`wrgl.pkindex.PKIndex`.
+Whether the row still has the same content at an older commit is read off the diff between
+the head and that commit, so a key costs a logarithmic number of diffs in the length of the
+history. Diffs are shared by all keys of a call, and commits of the same table need no diff.
+
+Bisection assumes a row that changed stays changed further back. If a row was changed and
+later changed back, the commit found is one of the commits where it took its current content.
+History is followed through first parents, so changes made on a merged branch are blamed on
+the merge commit.
+"""
+
+import typing
+
+from wrgl import commitgraph, repository
+
+
+def blame(
+    repo: "repository.Repository",
+    branch: str,
+    keys: typing.List[typing.Union[str, typing.Sequence[str]]],
+    index_dir: str = None,
+    batch_size: int = 100,
+) -> typing.List[typing.Union["commitgraph.CommitRecord", None]]:
+    """Finds the oldest commit of a branch at which each row has its current content.
+
+    Usually called as :func:`wrgl.repository.Repository.blame`.
+
+    :param Repository repo: the repo handle
+    :param str branch: the name of the branch
+    :param list keys: primary keys, each either a list of values of the primary key columns
+        or a string for single-column keys
+    :param str index_dir: optional, directory of index files. Defaults to :func:`wrgl.pkindex.default_index_dir`.
+    :param int batch_size: number of rows fetched by each request when locating keys
+
+    :return: the commit of each key, or None if the key is not in the head table
+    :rtype: list[CommitRecord or None]
+    """
+    head = repo.get_branch(branch)
+    with repo._commit_graph_lock:
+        graph = repo._commit_graph
+        history = [graph[s] for s in graph.first_parents(head.sum, repo)]
+    with repo.span("blame", branch=branch, commit=head.sum, keys=len(keys)):
+        with repo.pk_index(head.table.sum, index_dir) as idx:
+            offsets = idx.locate(keys, batch_size)
+        # head offsets of rows that differ, by table of the older commit
+        changed: typing.Dict[str, typing.Set[int]] = {head.table.sum: set()}
+
+        def unchanged(off: int, k: int) -> bool:
+            table_sum = history[k].table_sum
+            if table_sum not in changed:
+                dr = repo.diff(head.sum, history[k].sum)
+                changed[table_sum] = set(
+                    rd.off1 for rd in dr.row_diff or [] if rd.off1 is not None
+                )
+            return off not in changed[table_sum]
+
+        result = []
+        for off in offsets:
+            if off is None:
+                result.append(None)
+                continue
+            # the row is unchanged at history[lo], and absent before the first commit
+            lo, hi = 0, len(history)
+            while hi - lo > 1:
+                mid = (lo + hi) // 2
+                if unchanged(off, mid):
+                    lo = mid
+                else:
+                    hi = mid
+            result.append(history[lo])
+    return result
@@ -0,0 +1,76 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022 Wrangle Ltd
+
+import tempfile
+from unittest import TestCase
+
+from wrgl.fakeserver_test import FakeWrgld
+from wrgl.repository import Repository
+
+
+class BlameTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.server = FakeWrgld().start()
+        self.addCleanup(self.server.stop)
+        self.repo = Repository(self.server.uri, "my-client", "secret")
+        self.repo.authenticate()
+        self.columns = ["id", "value"]
+        self.rows = [[str(i), "v0"] for i in range(10)]
+
+    def commit(self, branch="main", parents=None):
+        return self.server.add_commit(
+            branch, self.columns, ["id"], [list(r) for r in self.rows], parents=parents
+        )
+
+    def diff_requests(self, since):
+        return [p for _, p in self.server.request_log[since:] if p.startswith("/diff/")]
+
+    def test_blame(self):
+        sums = [self.commit()]
+        for i in range(1, 32):
+            # row 1 changes every commit, row 2 at commit 5, row 3 at commit 20
+            self.rows[1][1] = "v%d" % i
+            if i == 5:
+                self.rows[2][1] = "changed"
+            if i == 20:
+                self.rows[3][1] = "changed"
+            if i == 25:
+                self.rows.append(["new", "v"])
+            sums.append(self.commit())
+        changed_at = {"0": 0, "1": 31, "2": 5, "3": 20, "new": 25}
+        keys = list(changed_at) + ["missing"]
+        n = len(self.server.request_log)
+        result = self.repo.blame("main", keys, index_dir=self.dir.name)
+        self.assertEqual(
+            [None if c is None else c.sum for c in result],
+            [sums[i] for i in changed_at.values()] + [None],
+        )
+        # bisection over 32 commits takes at most 5 diffs per key, shared between keys
+        self.assertLessEqual(len(set(self.diff_requests(n))), 5 * 4)
+        self.assertEqual(len(self.diff_requests(n)), len(set(self.diff_requests(n))))
+
+    def test_unchanged_tables_need_no_diff(self):
+        sums = [self.commit() for _ in range(3)]
+        self.rows[4][1] = "changed"
+        sums.append(self.commit())
+        sums.append(self.commit())
+        n = len(self.server.request_log)
+        result = self.repo.blame("main", ["4", "5"], index_dir=self.dir.name)
+        self.assertEqual([c.sum for c in result], [sums[3], sums[0]])
+        # commits 3 and 4 share a table, commits 0 to 2 share another
+        self.assertEqual(len(self.diff_requests(n)), 1)
+
+    def test_first_parent(self):
+        base = self.commit()
+        self.rows[6][1] = "side"
+        side = self.commit("side", parents=[base])
+        self.rows[6][1] = "v0"
+        self.rows[7][1] = "main"
+        main = self.commit("main", parents=[base])
+        self.rows[6][1] = "side"
+        merge = self.commit("main", parents=[main, side])
+        result = self.repo.blame("main", ["6", "7", "8"], index_dir=self.dir.name)
+        self.assertEqual([c.sum for c in result], [merge, main, base])
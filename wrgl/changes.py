@@ -0,0 +1,111 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022 Wrangle Ltd
+
+"""Row-level changes between two commits, as a stream of events.
+
+The first-parent history between the two commits is diffed one commit at a time, oldest
+first. Diffs of upcoming commits are requested ahead on a bounded pool of threads while the
+current one is consumed, and changed rows are only fetched as events are read, so memory
+depends on the number of workers and the size of a single commit's diff rather than on the
+length of the history.
+"""
+
+import datetime
+import typing
+
+import attr
+
+from wrgl import repository
+from wrgl.diffreader import DiffReader
+from wrgl.ranges import iter_ranges
+
+INSERT = "insert"
+DELETE = "delete"
+UPDATE = "update"
+
+
+@attr.s(auto_attribs=True)
+class ChangeEvent(object):
+    """A row inserted, deleted or updated by a commit
+
+    :ivar str op: one of "insert", "delete" or "update"
+    :ivar str commit: checksum of the commit that made the change
+    :ivar datetime.datetime time: commit time
+    :ivar list[str] columns: column names of `row` and `old_row`
+    :ivar list[str] row: the row after the change, None for deletes. For updates the values
+        of columns removed by the commit are None.
+    :ivar list[str] old_row: the row before the change, None for inserts. For updates the values
+        of columns added by the commit are None.
+    """
+
+    op: str
+    commit: str
+    time: datetime.datetime
+    columns: typing.List[str]
+    row: typing.Union[typing.List[str], None] = None
+    old_row: typing.Union[typing.List[str], None] = None
+
+
+def _events(
+    dr: DiffReader, commit: str, time: datetime.datetime
+) -> typing.Iterator[ChangeEvent]:
+    if dr.added_rows is None:
+        raise ValueError(
+            "primary key changed at commit %s, rows cannot be matched" % commit
+        )
+    for row in dr.removed_rows:
+        yield ChangeEvent(DELETE, commit, time, dr.removed_rows.columns, old_row=row)
+    for pairs in dr.modified_rows:
+        yield ChangeEvent(
+            UPDATE,
+            commit,
+            time,
+            dr.modified_rows.columns,
+            row=[new for new, _ in pairs],
+            old_row=[old for _, old in pairs],
+        )
+    for row in dr.added_rows:
+        yield ChangeEvent(INSERT, commit, time, dr.added_rows.columns, row=row)
+
+
+def changes(
+    repo: "repository.Repository",
+    from_commit: str,
+    to_commit: str,
+    columns: typing.List[str] = None,
+    workers: int = 4,
+    fetch_size: int = 100,
+) -> typing.Iterator[ChangeEvent]:
+    """Iterates over the changes made after `from_commit` up to `to_commit`.
+
+    Commits come oldest first. Within a commit, deletes come first, then updates, then inserts.
+
+    Usually called as :func:`wrgl.repository.Repository.changes`.
+
+    :param Repository repo: the repo handle
+    :param str from_commit: checksum of the commit to start from, whose own changes are not included.
+        It must be a first-parent ancestor of `to_commit`.
+    :param str to_commit: checksum of the last commit
+    :param list[str] columns: optional, only read these columns of changed rows. Primary key
+        columns are always read.
+    :param int workers: number of commits diffed ahead of the one being read
+    :param int fetch_size: number of rows to fetch for each batch
+
+    :rtype: typing.Iterator[ChangeEvent]
+    """
+    with repo._commit_graph_lock:
+        graph = repo._commit_graph
+        history = graph.first_parents(to_commit, repo, until=from_commit)
+        records = [graph[s] for s in reversed(history)]
+    if records[0].sum != from_commit:
+        raise ValueError(
+            "commit %s is not a first-parent ancestor of %s" % (from_commit, to_commit)
+        )
+    readers = iter_ranges(
+        lambda old, new: repo.diff_reader(new, old, fetch_size, columns),
+        [(records[i - 1].sum, records[i].sum) for i in range(1, len(records))],
+        workers,
+    )
+    for rec, dr in zip(records[1:], readers):
+        for event in _events(dr, rec.sum, rec.time):
+            yield event
@@ -0,0 +1,79 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022 Wrangle Ltd
+
+from unittest import TestCase
+
+from wrgl.changes import DELETE, INSERT, UPDATE
+from wrgl.fakeserver_test import FakeWrgld
+from wrgl.repository import Repository
+
+
+class ChangesTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = FakeWrgld().start()
+        self.addCleanup(self.server.stop)
+        self.repo = Repository(self.server.uri, "my-client", "secret")
+        self.columns = ["id", "a", "b"]
+
+    def commit(self, rows, branch="main", parents=None, columns=None, pk=None):
+        return self.server.add_commit(
+            branch, columns or self.columns, pk or ["id"], rows, parents=parents
+        )
+
+    def test_changes(self):
+        base = self.commit([["1", "a1", "b1"], ["2", "a2", "b2"]])
+        c1 = self.commit([["1", "a1", "b1"], ["2", "x2", "b2"], ["3", "a3", "b3"]])
+        c2 = self.commit([["2", "x2", "b2"], ["3", "a3", "b3"]])
+        c3 = self.commit([["2", "x2", "y2"], ["3", "a3", "b3"], ["4", "a4", "b4"]])
+        events = [
+            (e.op, e.commit, e.row, e.old_row)
+            for e in self.repo.changes(base, "heads/main", workers=2, fetch_size=1)
+        ]
+        self.assertEqual(
+            events,
+            [
+                (UPDATE, c1, ["2", "x2", "b2"], ["2", "a2", "b2"]),
+                (INSERT, c1, ["3", "a3", "b3"], None),
+                (DELETE, c2, None, ["1", "a1", "b1"]),
+                (UPDATE, c3, ["2", "x2", "y2"], ["2", "x2", "b2"]),
+                (INSERT, c3, ["4", "a4", "b4"], None),
+            ],
+        )
+        events = list(self.repo.changes(c2, c3, columns=["b"]))
+        self.assertEqual(events[0].columns, ["id", "b"])
+        self.assertEqual(events[0].row, ["2", "y2"])
+        self.assertEqual(
+            events[0].time, self.repo.get_commit_graph(c3, max_depth=1)[c3].time
+        )
+        self.assertEqual(list(self.repo.changes(c3, c3)), [])
+
+    def test_first_parent_only(self):
+        base = self.commit([["1", "a1", "b1"]])
+        side = self.commit([["1", "a1", "b1"], ["2", "a2", "b2"]], "side", [base])
+        main = self.commit([["1", "x1", "b1"]], parents=[base])
+        merge = self.commit([["1", "x1", "b1"], ["2", "a2", "b2"]], parents=[main, side])
+        events = [(e.op, e.commit) for e in self.repo.changes(base, merge)]
+        self.assertEqual(events, [(UPDATE, main), (INSERT, merge)])
+        with self.assertRaises(ValueError):
+            list(self.repo.changes(side, merge))
+
+    def test_column_changes(self):
+        base = self.commit([["1", "a1", "b1"]])
+        head = self.commit([["1", "a1", "c1"]], columns=["id", "a", "c"])
+        events = list(self.repo.changes(base, head))
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0].op, UPDATE)
+        self.assertEqual(dict(zip(events[0].columns, events[0].row))["c"], "c1")
+        self.assertEqual(dict(zip(events[0].columns, events[0].old_row))["b"], "b1")
+
+    def test_bounded_lookahead(self):
+        base = self.commit([["0", "a", "b"]])
+        for i in range(1, 20):
+            self.commit([[str(j), "a", "b"] for j in range(i + 1)])
+        n = len(self.server.request_log)
+        events = self.repo.changes(base, "heads/main", workers=2)
+        self.assertEqual(next(events).row, ["1", "a", "b"])
+        events.close()
+        diffs = [p for _, p in self.server.request_log[n:] if p.startswith("/diff/")]
+        self.assertLessEqual(len(diffs), 3)
@@ -67,13 +67,13 @@ def moveOps(sl: typing.List[int]) -> typing.List[MoveOp]:
     return ops
 
 
-@attr.s(auto_attribs=True, field_transformer=none_field_transformer)
+@attr.s(auto_attribs=True, slots=True, field_transformer=none_field_transformer)
 class Move(object):
     after: int
     before: int
 
 
-@attr.s(auto_attribs=True, field_transformer=none_field_transformer)
+@attr.s(auto_attribs=True, slots=True, field_transformer=none_field_transformer)
 class Column(object):
     name: str = attr.ib()
     base_idx: int = attr.ib()
@@ -10,7 +10,7 @@ from wrgl.isoformat import fromisoformat
 from wrgl.serialize import field_transformer
 
 
-@attr.s(auto_attribs=True, field_transformer=field_transformer(globals()))
+@attr.s(auto_attribs=True, slots=True, field_transformer=field_transformer(globals()))
 class CommitResult(object):
     """Payload of a successful commit
 
@@ -22,7 +22,7 @@ class CommitResult(object):
     table: str
 
 
-@attr.s(auto_attribs=True, field_transformer=field_transformer(globals()))
+@attr.s(auto_attribs=True, slots=True, field_transformer=field_transformer(globals()))
 class Table(object):
     """A table represents the underlying CSV of a :class:`Commit`
 
@@ -48,7 +48,7 @@ class Table(object):
         return [self.columns[idx] for idx in self.pk]
 
 
-@attr.s(auto_attribs=True, field_transformer=field_transformer(globals()))
+@attr.s(auto_attribs=True, slots=True, field_transformer=field_transformer(globals()))
 class Commit(object):
     """A commit represents an immutable snapshot of a CSV
 
@@ -73,7 +73,7 @@ class Commit(object):
     parent_commits: "typing.Dict[str, Commit]"
 
 
-@attr.s(auto_attribs=True, field_transformer=field_transformer(globals()))
+@attr.s(auto_attribs=True, slots=True, field_transformer=field_transformer(globals()))
 class CommitTree(object):
     """Payload returned by :func:`Repository.get_commit_tree`
 
@@ -0,0 +1,709 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022 Wrangle Ltd
+
+import bisect
+import collections
+import datetime
+import heapq
+import typing
+from concurrent.futures import ThreadPoolExecutor
+
+import attr
+
+from wrgl import repository
+from wrgl.isoformat import fromisoformat
+
+
+_UNPARSED = object()
+
+
+@attr.s(auto_attribs=True, slots=True)
+class CommitRecord(object):
+    """A commit of a :class:`CommitGraph`
+
+    :ivar str sum: checksum of the commit
+    :ivar str author_name: name of commit author
+    :ivar str author_email: email of commit author
+    :ivar str message: commit message
+    :ivar str table_sum: checksum of the underlying table
+    :ivar str raw_time: commit time as returned by the server
+    :ivar tuple[str] parents: checksums of parent commits
+    """
+
+    sum: str
+    author_name: str
+    author_email: str
+    message: str
+    table_sum: str
+    raw_time: typing.Union[str, None]
+    parents: typing.Tuple[str, ...]
+    _time: typing.Any = attr.ib(init=False, default=_UNPARSED, eq=False, repr=False)
+
+    @property
+    def time(self) -> typing.Union[datetime.datetime, None]:
+        """Commit time, parsed on first access since walks often never read it
+
+        :rtype: datetime.datetime
+        """
+        if self._time is _UNPARSED:
+            self._time = fromisoformat(self.raw_time) if self.raw_time else None
+        return self._time
+
+
+def _record(com_sum: str, obj: typing.Dict) -> CommitRecord:
+    table = obj.get("table") or dict()
+    return CommitRecord(
+        sum=com_sum,
+        author_name=obj.get("authorName"),
+        author_email=obj.get("authorEmail"),
+        message=obj.get("message"),
+        table_sum=table.get("sum"),
+        raw_time=obj.get("time"),
+        parents=tuple(obj.get("parents") or ()),
+    )
+
+
+def _as_utc(time: datetime.datetime) -> datetime.datetime:
+    """Takes naive datetimes as UTC, so they compare with commit times"""
+    if time.tzinfo is None:
+        return time.replace(tzinfo=datetime.timezone.utc)
+    return time
+
+
+def _time_key(rec: CommitRecord) -> float:
+    return -rec.time.timestamp() if rec.time is not None else 0
+
+
+class CommitGraph(object):
+    """A commit DAG that stores each commit once.
+
+    Commits get consecutive integer ids. Records and parent/child adjacency lists are indexed
+    by id, so walking the graph never recurses. Parents that are referenced but not fetched
+    yet make up the frontier, from which :func:`CommitGraph.extend` fetches more history.
+
+    Usually created with :func:`wrgl.repository.Repository.get_commit_graph`.
+
+    :ivar datetime.timedelta max_clock_skew: how much older than its ancestors a commit may
+        appear to be. Ancestry queries do not walk past commits older than the ancestor by
+        more than this. None walks the whole history instead.
+    """
+
+    max_clock_skew: typing.Union[datetime.timedelta, None]
+
+    def __init__(
+        self, max_clock_skew: datetime.timedelta = datetime.timedelta(days=1)
+    ) -> None:
+        """
+        :param datetime.timedelta max_clock_skew: optional, how much older than its ancestors a
+            commit may appear to be, bounds the walks of :func:`CommitGraph.is_ancestor`
+        """
+        self.max_clock_skew = max_clock_skew
+        self._ids: typing.Dict[str, int] = dict()
+        self._sums: typing.List[str] = []
+        self._records: typing.List[typing.Union[CommitRecord, None]] = []
+        self._parents: typing.List[typing.List[int]] = []
+        self._children: typing.List[typing.List[int]] = []
+        # distance from the nearest fetched head, bounds how deep extend() goes
+        self._depths: typing.List[int] = []
+        # ids of commits referenced as parents but not fetched yet
+        self._frontier: typing.Set[int] = set()
+        # generation numbers, 1 for root commits, only known once the whole ancestry is fetched
+        self._generations: typing.Dict[int, int] = dict()
+        # commits whose generation is unknown, with the number of loaded commits at the time
+        self._unknown_generations: typing.Dict[int, int] = dict()
+        self._loaded = 0
+        # answers of ancestry queries, valid forever because history never changes
+        self._ancestry: typing.Dict[typing.Tuple[int, int], bool] = dict()
+        self._merge_bases: typing.Dict[
+            typing.Tuple[int, int], typing.Union[int, None]
+        ] = dict()
+
+    def _id(self, com_sum: str, depth: int) -> int:
+        i = self._ids.get(com_sum, None)
+        if i is None:
+            i = len(self._sums)
+            self._ids[com_sum] = i
+            self._sums.append(com_sum)
+            self._records.append(None)
+            self._parents.append([])
+            self._children.append([])
+            self._depths.append(depth)
+            self._frontier.add(i)
+        elif depth < self._depths[i]:
+            self._depths[i] = depth
+        return i
+
+    def add_tree(self, data: typing.Dict, depth: int = 0) -> int:
+        """Adds the commits of a commit tree response, as returned by wrgld for
+        `GET /commits/?head=...&maxDepth=...`
+
+        :param dict data: the decoded JSON response
+        :param int depth: distance of the root commit from the head of the graph
+
+        :return: number of commits that were not in the graph before
+        :rtype: int
+        """
+        added = 0
+        stack = [(data["sum"], data["root"], depth)]
+        while stack:
+            com_sum, obj, d = stack.pop()
+            i = self._id(com_sum, d)
+            if self._records[i] is None:
+                rec = self._records[i] = _record(com_sum, obj)
+                self._frontier.discard(i)
+                for p in rec.parents:
+                    j = self._id(p, d + 1)
+                    self._parents[i].append(j)
+                    self._children[j].append(i)
+                added += 1
+            for p, parent_obj in (obj.get("parentCommits") or dict()).items():
+                stack.append((p, parent_obj, d + 1))
+        self._loaded += added
+        return added
+
+    @classmethod
+    def fetch(
+        cls,
+        repo: "repository.Repository",
+        head: str,
+        max_depth: int = None,
+        page_depth: int = 100,
+    ) -> "CommitGraph":
+        """Fetches the history of a commit
+
+        :param Repository repo: the repo handle
+        :param str head: checksum or reference of the newest commit
+        :param int max_depth: optional, number of generations to fetch. Fetches the whole history if not set.
+        :param int page_depth: number of generations fetched by each request
+
+        :rtype: CommitGraph
+        """
+        graph = cls()
+        depth = page_depth if max_depth is None else min(page_depth, max_depth)
+        graph.add_tree(repo._get_commit_tree_json(head, depth))
+        graph.extend(repo, max_depth, page_depth)
+        return graph
+
+    def extend(
+        self,
+        repo: "repository.Repository",
+        max_depth: int = None,
+        page_depth: int = 100,
+    ) -> int:
+        """Fetches the frontier until the graph holds `max_depth` generations, or the whole history
+
+        :param Repository repo: the repo handle
+        :param int max_depth: optional, number of generations to hold. Unbounded if not set.
+        :param int page_depth: number of generations fetched by each request
+
+        :return: number of commits added
+        :rtype: int
+        """
+        added = 0
+        while True:
+            frontier = sorted(
+                i
+                for i in self._frontier
+                if max_depth is None or self._depths[i] < max_depth
+            )
+            if not frontier:
+                return added
+            for i in frontier:
+                if self._records[i] is not None:
+                    # fetched along with an earlier frontier commit
+                    continue
+                depth = page_depth
+                if max_depth is not None:
+                    depth = min(depth, max_depth - self._depths[i])
+                added += self.add_tree(
+                    repo._get_commit_tree_json(self._sums[i], depth), self._depths[i]
+                )
+
+    @property
+    def frontier(self) -> typing.List[str]:
+        """Checksums of commits that are referenced as parents but not fetched yet
+
+        :rtype: list[str]
+        """
+        return [self._sums[i] for i in sorted(self._frontier)]
+
+    @property
+    def heads(self) -> typing.List[str]:
+        """Checksums of fetched commits without children in the graph
+
+        :rtype: list[str]
+        """
+        return [
+            self._sums[i]
+            for i, rec in enumerate(self._records)
+            if rec is not None and not self._children[i]
+        ]
+
+    def __len__(self) -> int:
+        """Number of fetched commits"""
+        return len(self._sums) - len(self._frontier)
+
+    def __contains__(self, com_sum: str) -> bool:
+        i = self._ids.get(com_sum, None)
+        return i is not None and self._records[i] is not None
+
+    def __getitem__(self, com_sum: str) -> CommitRecord:
+        rec = self._records[self._ids[com_sum]]
+        if rec is None:
+            raise KeyError(com_sum)
+        return rec
+
+    def get(self, com_sum: str) -> typing.Union[CommitRecord, None]:
+        """Returns a fetched commit, or None
+
+        :rtype: CommitRecord or None
+        """
+        i = self._ids.get(com_sum, None)
+        return None if i is None else self._records[i]
+
+    def parents(self, com_sum: str) -> typing.List[str]:
+        """Checksums of the parents of a commit, fetched or not
+
+        :rtype: list[str]
+        """
+        return [self._sums[j] for j in self._parents[self._ids[com_sum]]]
+
+    def children(self, com_sum: str) -> typing.List[str]:
+        """Checksums of the children of a commit that are in the graph
+
+        :rtype: list[str]
+        """
+        return [self._sums[j] for j in self._children[self._ids[com_sum]]]
+
+    def _load(self, i: int, repo: "repository.Repository", page_depth: int) -> None:
+        if self._records[i] is not None:
+            return
+        if repo is None:
+            raise KeyError(self._sums[i])
+        self.add_tree(repo._get_commit_tree_json(self._sums[i], page_depth), self._depths[i])
+
+    def _node(self, com_sum: str, repo: "repository.Repository", page_depth: int) -> int:
+        i = self._id(com_sum, 0)
+        self._load(i, repo, page_depth)
+        return i
+
+    def first_parents(
+        self,
+        head: str,
+        repo: "repository.Repository" = None,
+        page_depth: int = 100,
+        until: str = None,
+    ) -> typing.List[str]:
+        """Returns the first-parent history of a commit, newest first. This is the sequence
+        of commits a branch pointed to, with merged branches left out.
+
+        :param str head: checksum of the newest commit
+        :param Repository repo: optional, fetches missing history `page_depth` generations at a
+            time. Without it reaching unfetched history raises KeyError.
+        :param int page_depth: number of generations fetched by each request
+        :param str until: optional, checksum of the oldest commit to return. The whole history
+            is returned if it is not a first-parent ancestor of `head`.
+
+        :rtype: list[str]
+        """
+        i = self._node(head, repo, page_depth)
+        result = [self._sums[i]]
+        while self._parents[i] and self._sums[i] != until:
+            i = self._parents[i][0]
+            self._load(i, repo, page_depth)
+            result.append(self._sums[i])
+        return result
+
+    def _generation(self, i: int) -> typing.Union[int, None]:
+        gens = self._generations
+        if i in gens:
+            return gens[i]
+        # still unknown unless more history was loaded since
+        if self._unknown_generations.get(i) == self._loaded:
+            return None
+        stack = [i]
+        while stack:
+            k = stack[-1]
+            if k in gens:
+                stack.pop()
+                continue
+            if self._records[k] is None:
+                self._unknown_generations[i] = self._loaded
+                return None
+            missing = [j for j in self._parents[k] if j not in gens]
+            if missing:
+                stack.extend(missing)
+                continue
+            gens[k] = 1 + max((gens[j] for j in self._parents[k]), default=0)
+            stack.pop()
+        return gens[i]
+
+    def is_ancestor(
+        self,
+        ancestor: str,
+        descendant: str,
+        repo: "repository.Repository" = None,
+        page_depth: int = 100,
+    ) -> bool:
+        """Tells whether a commit is reachable from another, a commit being its own ancestor.
+
+        Walks parents of `descendant` breadth-first. Commits with a known generation number
+        not above the generation of `ancestor`, or older than `ancestor` by more than
+        :attr:`max_clock_skew`, are not walked past. So a negative answer usually only fetches
+        the history newer than `ancestor`. Answers are cached, so repeated queries take no
+        requests and little time.
+
+        :param str ancestor: checksum of the possible ancestor
+        :param str descendant: checksum of the possible descendant
+        :param Repository repo: optional, fetches missing history `page_depth` generations at a
+            time. Without it a query that reaches unfetched history raises KeyError.
+        :param int page_depth: number of generations fetched by each request
+
+        :rtype: bool
+        """
+        a = self._node(ancestor, repo, page_depth)
+        b = self._node(descendant, repo, page_depth)
+        return self._is_ancestor(a, b, repo, page_depth)
+
+    def _is_ancestor(
+        self, a: int, b: int, repo: "repository.Repository", page_depth: int
+    ) -> bool:
+        if a == b:
+            return True
+        key = (a, b)
+        if key in self._ancestry:
+            return self._ancestry[key]
+        gen_a = self._generation(a)
+        time_a = self._records[a].time
+        cutoff = None
+        if self.max_clock_skew is not None and time_a is not None:
+            cutoff = time_a - self.max_clock_skew
+        found = False
+        seen = {b}
+        queue = collections.deque([b])
+        while queue and not found:
+            i = queue.popleft()
+            if self._ancestry.get((a, i)):
+                found = True
+                break
+            gen_i = self._generations.get(i)
+            if gen_a is not None and gen_i is not None and gen_i <= gen_a:
+                continue
+            self._load(i, repo, page_depth)
+            time_i = self._records[i].time
+            if cutoff is not None and time_i is not None and time_i < cutoff:
+                continue
+            for j in self._parents[i]:
+                if j == a:
+                    found = True
+                    break
+                if j not in seen:
+                    seen.add(j)
+                    queue.append(j)
+        self._ancestry[key] = found
+        return found
+
+    def merge_base(
+        self,
+        commit1: str,
+        commit2: str,
+        repo: "repository.Repository" = None,
+        page_depth: int = 100,
+    ) -> typing.Union[str, None]:
+        """Finds the best common ancestor of two commits, the one to diff against when merging.
+
+        Walks both histories newest first, marking commits reachable from either side, until
+        only commits below a common ancestor are left. If several common ancestors are not
+        ancestors of one another, the newest is returned. Answers are cached.
+
+        :param str commit1: checksum of the first commit
+        :param str commit2: checksum of the second commit
+        :param Repository repo: optional, fetches missing history `page_depth` generations at a
+            time. Without it a query that reaches unfetched history raises KeyError.
+        :param int page_depth: number of generations fetched by each request
+
+        :return: checksum of the merge base, or None if the histories are unrelated
+        :rtype: str or None
+        """
+        a = self._node(commit1, repo, page_depth)
+        b = self._node(commit2, repo, page_depth)
+        key = (min(a, b), max(a, b))
+        if key not in self._merge_bases:
+            self._merge_bases[key] = self._merge_base(a, b, repo, page_depth)
+        i = self._merge_bases[key]
+        return None if i is None else self._sums[i]
+
+    def _merge_base(
+        self, a: int, b: int, repo: "repository.Repository", page_depth: int
+    ) -> typing.Union[int, None]:
+        if a == b:
+            return a
+        left, right, stale = 1, 2, 4
+        flags = {a: left, b: right}
+        heap = [(_time_key(self._records[i]), i) for i in (a, b)]
+        heapq.heapify(heap)
+        candidates = []
+        while any(not flags[i] & stale for _, i in heap):
+            _, i = heapq.heappop(heap)
+            f = flags[i]
+            if f & (left | right) == left | right:
+                if not f & stale:
+                    candidates.append(i)
+                # ancestors of a common ancestor are common too but not the best
+                f |= stale
+            for j in self._parents[i]:
+                if flags.get(j, 0) & f == f:
+                    continue
+                flags[j] = flags.get(j, 0) | f
+                self._load(j, repo, page_depth)
+                heapq.heappush(heap, (_time_key(self._records[j]), j))
+        # a candidate marked stale later was reached from another common ancestor, the
+        # ancestry check catches what clock skew let through
+        candidates = [i for i in set(candidates) if not flags[i] & stale]
+        candidates = [
+            i
+            for i in candidates
+            if not any(
+                k != i and self._is_ancestor(i, k, repo, page_depth) for k in candidates
+            )
+        ]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda i: (_time_key(self._records[i]), i))
+
+    def iter_topo(self) -> typing.Iterator[CommitRecord]:
+        """Iterates over fetched commits, children before parents. Among commits that are
+        ready at the same time, newer ones come first.
+
+        :rtype: typing.Iterator[CommitRecord]
+        """
+        pending = [len(children) for children in self._children]
+        heap = []
+        for i, rec in enumerate(self._records):
+            if rec is not None and pending[i] == 0:
+                heapq.heappush(heap, self._heap_key(i))
+        while heap:
+            i = heapq.heappop(heap)[-1]
+            yield self._records[i]
+            for j in self._parents[i]:
+                pending[j] -= 1
+                if pending[j] == 0 and self._records[j] is not None:
+                    heapq.heappush(heap, self._heap_key(j))
+
+    def _heap_key(self, i: int) -> typing.Tuple:
+        rec = self._records[i]
+        return (rec.time is None, _time_key(rec), i)
+
+    def iter_by_time(self, reverse: bool = True) -> typing.Iterator[CommitRecord]:
+        """Iterates over fetched commits by commit time, newest first unless `reverse` is False
+
+        :rtype: typing.Iterator[CommitRecord]
+        """
+        records = [rec for rec in self._records if rec is not None]
+        records.sort(
+            key=lambda rec: rec.time or datetime.datetime.min.replace(
+                tzinfo=datetime.timezone.utc
+            ),
+            reverse=reverse,
+        )
+        return iter(records)
+
+
+class TimeIndex(object):
+    """The first-parent history of a branch sorted by time, to find the commit a branch
+    pointed to at a given time.
+
+    The index holds the first-parent chain from the branch head, newest first, with the
+    running minimum of commit times. Looking up a time is a binary search over those
+    minimums, which finds the newest commit not later than that time even when commit
+    times are skewed. Older history is fetched only as far as lookups need it, and a
+    moved head only adds the new commits in front.
+
+    Usually used through :func:`wrgl.repository.Repository.commit_at`.
+    """
+
+    def __init__(self, graph: CommitGraph = None) -> None:
+        """
+        :param CommitGraph graph: optional, the graph commits are read from and fetched into
+        """
+        self.graph = graph if graph is not None else CommitGraph()
+        self._sums: typing.List[str] = []
+        self._members: typing.Set[str] = set()
+        # negated running minimum of commit timestamps, non-decreasing
+        self._keys: typing.List[float] = []
+        self._complete = False
+
+    @property
+    def head(self) -> typing.Union[str, None]:
+        """Checksum of the newest indexed commit
+
+        :rtype: str or None
+        """
+        return self._sums[0] if self._sums else None
+
+    def __len__(self) -> int:
+        return len(self._sums)
+
+    def _time(self, com_sum: str) -> float:
+        t = self.graph[com_sum].time
+        return t.timestamp() if t is not None else float("inf")
+
+    def _append(self, com_sum: str) -> None:
+        key = -self._time(com_sum)
+        if self._keys and self._keys[-1] > key:
+            key = self._keys[-1]
+        self._sums.append(com_sum)
+        self._members.add(com_sum)
+        self._keys.append(key)
+
+    def _first_parent(
+        self, com_sum: str, repo: "repository.Repository", page_depth: int
+    ) -> typing.Union[str, None]:
+        parents = self.graph._parents[self.graph._ids[com_sum]]
+        if not parents:
+            return None
+        self.graph._load(parents[0], repo, page_depth)
+        return self.graph._sums[parents[0]]
+
+    def update(
+        self, head: str, repo: "repository.Repository" = None, page_depth: int = 100
+    ) -> None:
+        """Moves the index to a new head. Commits already indexed are kept if they are on the
+        first-parent history of `head`, and dropped otherwise.
+
+        :param str head: checksum of the branch head
+        :param Repository repo: optional, fetches missing history
+        :param int page_depth: number of generations fetched by each request
+        """
+        if head == self.head:
+            return
+        self.graph._node(head, repo, page_depth)
+        newer = []
+        com_sum = head
+        while com_sum is not None and com_sum not in self._members:
+            newer.append(com_sum)
+            if len(newer) > page_depth and self._sums:
+                # far from the indexed commits, most likely a rewritten branch
+                break
+            com_sum = self._first_parent(com_sum, repo, page_depth)
+        if com_sum is not None and com_sum in self._members:
+            older = self._sums[self._sums.index(com_sum) :]
+            complete = self._complete
+        else:
+            older = []
+            complete = com_sum is None
+        self._sums, self._members, self._keys = [], set(), []
+        for s in newer + older:
+            self._append(s)
+        self._complete = complete
+
+    def at(
+        self,
+        time: datetime.datetime,
+        repo: "repository.Repository" = None,
+        page_depth: int = 100,
+    ) -> typing.Union[CommitRecord, None]:
+        """Returns the newest commit of the first-parent history whose time is not later than `time`
+
+        :param datetime.datetime time: the point in time. Naive datetimes are taken as UTC.
+        :param Repository repo: optional, fetches older history as needed
+        :param int page_depth: number of generations fetched by each request
+
+        :return: the commit, or None if the history starts after `time`
+        :rtype: CommitRecord or None
+        """
+        key = -_as_utc(time).timestamp()
+        if not self._keys or self._keys[-1] < key:
+            while not self._complete and self._sums:
+                com_sum = self._first_parent(self._sums[-1], repo, page_depth)
+                if com_sum is None:
+                    self._complete = True
+                    break
+                self._append(com_sum)
+                if self._keys[-1] >= key:
+                    break
+        i = bisect.bisect_left(self._keys, key)
+        if i == len(self._sums):
+            return None
+        return self.graph[self._sums[i]]
+
+
+def iter_history(
+    repo: "repository.Repository",
+    head: str,
+    since: datetime.datetime = None,
+    stop: typing.Callable[[CommitRecord], bool] = None,
+    max_count: int = None,
+    page_depth: int = 50,
+    workers: int = 4,
+) -> typing.Iterator[CommitRecord]:
+    """Walks the history of a commit, fetching `page_depth` generations per request.
+
+    Parents that are not in a fetched page form the frontier of the walk. After a page is
+    walked, the frontier is fetched with up to `workers` concurrent requests, so branches
+    of a merge are fetched side by side. Commits reachable through several paths are
+    yielded once. Within a page, children come before their parents and otherwise newer
+    commits come first. Only checksums of visited commits and the pages being walked are
+    kept in memory.
+
+    Usually called as :func:`wrgl.repository.Repository.iter_history`.
+
+    :param Repository repo: the repo handle
+    :param str head: checksum or reference of the newest commit
+    :param datetime.datetime since: optional, commits older than this are not yielded and their
+        ancestors not fetched. Naive datetimes are taken as UTC.
+    :param stop: optional, a function called with each :class:`CommitRecord`. If it returns True the commit
+        is not yielded and its ancestors are not fetched, unless reached through another commit.
+    :param int max_count: optional, maximum number of commits to yield
+    :param int page_depth: number of generations fetched by each request
+    :param int workers: maximum number of concurrent requests
+
+    :rtype: typing.Iterator[CommitRecord]
+    """
+    if since is not None:
+        since = _as_utc(since)
+    seen: typing.Set[str] = set()
+    count = 0
+    pending = [head]
+    workers = max(workers, 1)
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        while pending:
+            frontier = []
+            for i in range(0, len(pending), workers):
+                pages = ex.map(
+                    lambda s: repo._get_commit_tree_json(s, page_depth),
+                    pending[i : i + workers],
+                )
+                for page in pages:
+                    root = _record(page["sum"], page["root"])
+                    # parents are pushed once their child is popped, ties go to newer commits
+                    heap = [(_time_key(root), 0, root, page["root"])]
+                    n = 0
+                    while heap:
+                        _, _, rec, obj = heapq.heappop(heap)
+                        if rec.sum in seen:
+                            continue
+                        seen.add(rec.sum)
+                        if (
+                            since is not None
+                            and rec.time is not None
+                            and rec.time < since
+                        ) or (stop is not None and stop(rec)):
+                            continue
+                        yield rec
+                        count += 1
+                        if max_count is not None and count >= max_count:
+                            return
+                        parent_objs = obj.get("parentCommits") or dict()
+                        for p in rec.parents:
+                            if p in seen:
+                                continue
+                            if p in parent_objs:
+                                n += 1
+                                parent = _record(p, parent_objs[p])
+                                heapq.heappush(
+                                    heap, (_time_key(parent), n, parent, parent_objs[p])
+                                )
+                            else:
+                                frontier.append(p)
+            pending = [s for s in dict.fromkeys(frontier) if s not in seen]
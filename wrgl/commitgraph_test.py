@@ -0,0 +1,322 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022 Wrangle Ltd
+
+import datetime
+from unittest import TestCase
+
+from wrgl.commitgraph import CommitGraph
+from wrgl.fakeserver_test import FakeWrgld, synthetic_rows
+from wrgl.repository import Repository
+
+
+class CommitGraphTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = FakeWrgld().start()
+        self.addCleanup(self.server.stop)
+        self.repo = Repository(self.server.uri, "my-client", "secret")
+        self.repo.authenticate()
+        self.columns, self.rows = synthetic_rows(3, 2)
+
+    def commit(self, branch, parents=None):
+        return self.server.add_commit(
+            branch, self.columns, ["id"], self.rows, parents=parents
+        )
+
+    def commits_requests(self, since):
+        return [
+            p for _, p in self.server.request_log[since:] if p.startswith("/commits/?")
+        ]
+
+    def test_linear_history(self):
+        sums = [self.commit("main") for _ in range(30)]
+        n = len(self.server.request_log)
+        graph = self.repo.get_commit_graph("heads/main", page_depth=7)
+        self.assertEqual(len(graph), 30)
+        self.assertEqual(len(self.commits_requests(n)), 5)
+        self.assertEqual(graph.frontier, [])
+        self.assertEqual(graph.heads, [sums[-1]])
+        self.assertEqual([c.sum for c in graph.iter_topo()], sums[::-1])
+        self.assertEqual([c.sum for c in graph.iter_by_time(reverse=False)], sums)
+        rec = graph[sums[3]]
+        self.assertEqual(rec.parents, (sums[2],))
+        self.assertEqual(rec.table_sum, self.server.commits[sums[3]]["table"])
+        self.assertEqual(
+            rec.time, datetime.datetime(2022, 1, 1, 0, 3, tzinfo=datetime.timezone.utc)
+        )
+        self.assertEqual(graph.children(sums[3]), [sums[4]])
+
+    def test_max_depth_and_extend(self):
+        sums = [self.commit("main") for _ in range(10)]
+        graph = self.repo.get_commit_graph(sums[-1], max_depth=4, page_depth=3)
+        self.assertEqual(len(graph), 4)
+        self.assertEqual(graph.frontier, [sums[5]])
+        self.assertNotIn(sums[5], graph)
+        self.assertEqual(graph.extend(self.repo, max_depth=6), 2)
+        self.assertEqual(graph.frontier, [sums[3]])
+        self.assertEqual(graph.extend(self.repo), 4)
+        self.assertEqual(graph.frontier, [])
+
+    def test_merges(self):
+        base = self.commit("main")
+        left = self.commit("left", parents=[base])
+        right = self.commit("right", parents=[base])
+        merge = self.commit("main", parents=[left, right])
+        graph = self.repo.get_commit_graph("heads/main", page_depth=2)
+        self.assertEqual(len(graph), 4)
+        self.assertEqual(sorted(graph.children(base)), sorted([left, right]))
+        self.assertEqual(graph.parents(merge), [left, right])
+        self.assertEqual([c.sum for c in graph.iter_topo()], [merge, right, left, base])
+
+    def test_add_tree_stores_shared_ancestors_once(self):
+        def node(parents, parent_commits=None):
+            obj = {"time": "2022-01-01T00:00:00Z", "parents": parents}
+            if parent_commits:
+                obj["parentCommits"] = parent_commits
+            return obj
+
+        root = node(
+            ["a"], {"a": node(["b", "c"], {"b": node(["d"]), "c": node(["d"])})}
+        )
+        graph = CommitGraph()
+        self.assertEqual(graph.add_tree({"sum": "r", "root": root}), 4)
+        self.assertEqual(graph.frontier, ["d"])
+        self.assertEqual(sorted(graph.children("d")), ["b", "c"])
+        self.assertEqual(graph.add_tree({"sum": "d", "root": node([])}, depth=3), 1)
+        self.assertEqual([c.sum for c in graph.iter_topo()][-1], "d")
+
+
+class IterHistoryTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = FakeWrgld().start()
+        self.addCleanup(self.server.stop)
+        self.repo = Repository(self.server.uri, "my-client", "secret")
+        self.repo.authenticate()
+        self.columns, self.rows = synthetic_rows(3, 2)
+
+    def commit(self, branch, parents=None, message="commit"):
+        return self.server.add_commit(
+            branch, self.columns, ["id"], self.rows, message=message, parents=parents
+        )
+
+    def test_pages(self):
+        sums = [self.commit("main") for _ in range(25)]
+        n = len(self.server.request_log)
+        history = [c.sum for c in self.repo.iter_history("heads/main", page_depth=10)]
+        self.assertEqual(history, sums[::-1])
+        requests = [
+            p for _, p in self.server.request_log[n:] if p.startswith("/commits/?")
+        ]
+        self.assertEqual(len(requests), 3)
+
+    def test_merges_are_deduplicated(self):
+        base = self.commit("main")
+        left = [self.commit("left", parents=[base])]
+        right = [self.commit("right", parents=[base])]
+        for _ in range(4):
+            left.append(self.commit("left", parents=[left[-1]]))
+            right.append(self.commit("right", parents=[right[-1]]))
+        merge = self.commit("main", parents=[left[-1], right[-1]])
+        history = [c.sum for c in self.repo.iter_history(merge, page_depth=2)]
+        self.assertEqual(len(history), 12)
+        self.assertEqual(set(history), set([base, merge] + left + right))
+        self.assertEqual(history[0], merge)
+        self.assertEqual(history[-1], base)
+        for sums in (left, right):
+            positions = [history.index(s) for s in sums]
+            self.assertEqual(positions, sorted(positions, reverse=True))
+
+    def test_stop_early(self):
+        sums = [self.commit("main", message="commit %d" % i) for i in range(10)]
+        self.assertEqual(
+            [c.sum for c in self.repo.iter_history(sums[-1], page_depth=3, max_count=4)],
+            sums[:-5:-1],
+        )
+        since = datetime.datetime(2022, 1, 1, 0, 6, tzinfo=datetime.timezone.utc)
+        self.assertEqual(
+            [c.sum for c in self.repo.iter_history(sums[-1], page_depth=3, since=since)],
+            sums[:5:-1],
+        )
+        # naive datetimes are taken as UTC
+        self.assertEqual(
+            [
+                c.sum
+                for c in self.repo.iter_history(
+                    "heads/main", since=datetime.datetime(2022, 1, 1, 0, 6)
+                )
+            ],
+            sums[:5:-1],
+        )
+        history = self.repo.iter_history(
+            "heads/main", since=datetime.datetime(2000, 1, 1)
+        )
+        self.assertEqual(len(list(history)), 10)
+        self.assertEqual(
+            [
+                c.message
+                for c in self.repo.iter_history(
+                    sums[-1], stop=lambda c: c.message == "commit 7"
+                )
+            ],
+            ["commit 9", "commit 8"],
+        )
+
+
+class AncestryTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = FakeWrgld().start()
+        self.addCleanup(self.server.stop)
+        self.repo = Repository(self.server.uri, "my-client", "secret")
+        self.repo.authenticate()
+        self.columns, self.rows = synthetic_rows(3, 2)
+
+    def commit(self, branch, parents=None, time=None):
+        return self.server.add_commit(
+            branch, self.columns, ["id"], self.rows, time=time, parents=parents
+        )
+
+    def count_requests(self, since):
+        return len(self.server.request_log) - since
+
+    def test_is_ancestor(self):
+        main = [self.commit("main") for _ in range(20)]
+        side = [self.commit("side", parents=[main[4]])]
+        side.append(self.commit("side", parents=[side[-1]]))
+        self.assertTrue(self.repo.is_ancestor(main[3], main[-1]))
+        self.assertTrue(self.repo.is_ancestor(main[-1], main[-1]))
+        self.assertFalse(self.repo.is_ancestor(main[-1], main[3]))
+        self.assertTrue(self.repo.is_ancestor(main[4], side[-1]))
+        self.assertFalse(self.repo.is_ancestor(main[5], side[-1]))
+        self.assertFalse(self.repo.is_ancestor(side[0], main[-1]))
+        n = len(self.server.request_log)
+        self.assertTrue(self.repo.is_ancestor(main[3], main[-1]))
+        self.assertTrue(self.repo.is_ancestor(main[0], main[10]))
+        self.assertFalse(self.repo.is_ancestor(side[1], main[18]))
+        self.assertEqual(self.count_requests(n), 0)
+        self.assertTrue(self.repo.is_ancestor(main[3], "heads/main"))
+        self.assertEqual(self.count_requests(n), 1)
+
+    def test_negative_query_stops_at_ancestor_time(self):
+        start = datetime.datetime(2022, 1, 1, tzinfo=datetime.timezone.utc)
+        main = [
+            self.commit("main", time=start + datetime.timedelta(days=i))
+            for i in range(100)
+        ]
+        other = self.commit(
+            "other", parents=[], time=start + datetime.timedelta(days=90)
+        )
+        graph = CommitGraph()
+        n = len(self.server.request_log)
+        self.assertFalse(graph.is_ancestor(other, main[-1], self.repo, page_depth=5))
+        # pages of main[99:94], ..., main[89:84] and the page of other
+        self.assertEqual(self.count_requests(n), 4)
+        # still correct when the cutoff is disabled, but the whole history is fetched
+        graph = CommitGraph(max_clock_skew=None)
+        n = len(self.server.request_log)
+        self.assertFalse(graph.is_ancestor(other, main[-1], self.repo, page_depth=5))
+        self.assertEqual(self.count_requests(n), 21)
+
+    def test_merge_base(self):
+        base = [self.commit("main") for _ in range(5)]
+        left = [self.commit("left", parents=[base[-1]])]
+        right = [self.commit("right", parents=[base[-1]])]
+        for _ in range(3):
+            left.append(self.commit("left", parents=[left[-1]]))
+            right.append(self.commit("right", parents=[right[-1]]))
+        self.assertEqual(self.repo.merge_base("heads/left", "heads/right"), base[-1])
+        self.assertEqual(self.repo.merge_base(left[-1], base[2]), base[2])
+        self.assertEqual(self.repo.merge_base(left[2], left[2]), left[2])
+        merge = self.commit("left", parents=[left[-1], right[1]])
+        # right[1] is reachable from both, base[-1] is not the best anymore
+        self.assertEqual(self.repo.merge_base(merge, right[-1]), right[1])
+        other = self.commit("other", parents=[])
+        self.assertIsNone(self.repo.merge_base(other, merge))
+
+    def test_merge_base_with_clock_skew(self):
+        root = self.commit("main")
+        skewed = datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc)
+        a = self.commit("a", parents=[root])
+        b = self.commit("a", parents=[a], time=skewed)
+        c = self.commit("a", parents=[b])
+        d = self.commit("b", parents=[b])
+        self.assertEqual(self.repo.merge_base(c, d), b)
+
+    def test_without_repo(self):
+        graph = CommitGraph()
+        sums = [self.commit("main") for _ in range(5)]
+        graph.add_tree(self.repo._get_commit_tree_json(sums[-1], 3))
+        self.assertTrue(graph.is_ancestor(sums[3], sums[4]))
+        with self.assertRaises(KeyError):
+            graph.is_ancestor(sums[0], sums[4])
+        self.assertTrue(graph.is_ancestor(sums[0], sums[4], self.repo))
+
+
+class CommitAtTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = FakeWrgld().start()
+        self.addCleanup(self.server.stop)
+        self.repo = Repository(self.server.uri, "my-client", "secret")
+        self.repo.authenticate()
+        self.columns = ["id", "value"]
+
+    def commit(self, branch, value, parents=None, time=None):
+        return self.server.add_commit(
+            branch,
+            self.columns,
+            ["id"],
+            [["1", value]],
+            time=time,
+            parents=parents,
+        )
+
+    def at(self, minute, second=0):
+        return datetime.datetime(
+            2022, 1, 1, 0, minute, second, tzinfo=datetime.timezone.utc
+        )
+
+    def test_commit_at(self):
+        sums = [self.commit("main", str(i)) for i in range(10)]
+        self.assertEqual(self.repo.commit_at("main", self.at(3)).sum, sums[3])
+        self.assertEqual(self.repo.commit_at("main", self.at(3, 30)).sum, sums[3])
+        self.assertEqual(self.repo.commit_at("main", self.at(59)).sum, sums[9])
+        self.assertIsNone(self.repo.commit_at("main", datetime.datetime(2021, 12, 31)))
+        n = len(self.server.request_log)
+        self.assertEqual(
+            self.repo.commit_at("main", datetime.datetime(2022, 1, 1, 0, 5)).sum,
+            sums[5],
+        )
+        self.assertEqual(
+            [p for _, p in self.server.request_log[n:]], ["/refs/heads/main/"]
+        )
+
+        sums.append(self.commit("main", "10"))
+        self.assertEqual(self.repo.commit_at("main", self.at(59)).sum, sums[10])
+        self.assertEqual(self.repo.commit_at("main", self.at(1)).sum, sums[1])
+
+    def test_first_parent_and_skew(self):
+        main = [self.commit("main", str(i)) for i in range(3)]
+        side = self.commit("side", "side", parents=[main[0]])
+        # a commit with a clock behind its parent hides its parent for later times
+        skewed = self.commit("main", "skewed", time=self.at(0, 30))
+        merge = self.commit("main", "merge", parents=[skewed, side])
+        self.assertEqual(self.repo.commit_at("main", self.at(59)).sum, merge)
+        self.assertEqual(self.repo.commit_at("main", self.at(3)).sum, skewed)
+        self.assertEqual(self.repo.commit_at("main", self.at(0, 30)).sum, skewed)
+        self.assertEqual(self.repo.commit_at("main", self.at(0, 29)).sum, main[0])
+
+    def test_get_blocks_at(self):
+        self.commit("main", "a")
+        self.commit("main", "b")
+        self.assertEqual(
+            list(self.repo.get_blocks_at("main", self.at(0, 30))),
+            [self.columns, ["1", "a"]],
+        )
+        self.assertEqual(
+            list(self.repo.get_blocks_at("main", self.at(5), columns=["value"])),
+            [["value"], ["b"]],
+        )
+        with self.assertRaises(ValueError):
+            self.repo.get_blocks_at("main", datetime.datetime(2021, 1, 1))
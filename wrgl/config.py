@@ -7,7 +7,7 @@ import attr
 from wrgl.serialize import field_transformer
 
 
-@attr.s(auto_attribs=True, field_transformer=field_transformer(globals()))
+@attr.s(auto_attribs=True, slots=True, field_transformer=field_transformer(globals()))
 class User(object):
     """User configuration, this corresponds to the `user` section in config.yaml.
     Learn more about `configuration options`_.
@@ -23,7 +23,7 @@ class User(object):
     email: str
 
 
-@attr.s(auto_attribs=True, field_transformer=field_transformer(globals()))
+@attr.s(auto_attribs=True, slots=True, field_transformer=field_transformer(globals()))
 class Receive(object):
     """Receive configuration, this corresponds to the `receive` section in config.yaml.
     Learn more about `configuration options`_.
@@ -36,7 +36,7 @@ class Receive(object):
     deny_deletes: bool
 
 
-@attr.s(auto_attribs=True, field_transformer=field_transformer(globals()))
+@attr.s(auto_attribs=True, slots=True, field_transformer=field_transformer(globals()))
 class Branch(object):
     """Branch's upstream configuration, this corresponds to the `branch` section in config.yaml.
     Learn more about `configuration options`_.
@@ -51,7 +51,7 @@ class Branch(object):
     merge: str
 
 
-@attr.s(auto_attribs=True, field_transformer=field_transformer(globals()))
+@attr.s(auto_attribs=True, slots=True, field_transformer=field_transformer(globals()))
 class Auth(object):
     """Authentication configuration, this corresponds to the `auth` section in config.yaml.
     Learn more about `configuration options`_.
@@ -63,7 +63,7 @@ class Auth(object):
     token_duration: str
 
 
-@attr.s(auto_attribs=True, field_transformer=field_transformer(globals()))
+@attr.s(auto_attribs=True, slots=True, field_transformer=field_transformer(globals()))
 class Pack(object):
     """Packfile configuration, this corresponds to the `pack` section in config.yaml.
     Learn more about `configuration options`_.
@@ -74,7 +74,7 @@ class Pack(object):
     max_file_size: int
 
 
-@attr.s(auto_attribs=True, field_transformer=field_transformer(globals()))
+@attr.s(auto_attribs=True, slots=True, field_transformer=field_transformer(globals()))
 class Remote(object):
     """Remote configuration, this corresponds to the `remote` section in config.yaml.
     Learn more about `configuration options`_.
@@ -93,7 +93,7 @@ class Remote(object):
     mirror: bool
 
 
-@attr.s(auto_attribs=True, field_transformer=field_transformer(globals()))
+@attr.s(auto_attribs=True, slots=True, field_transformer=field_transformer(globals()))
 class Config(object):
     """Configurations as recorded in config.yaml, which can also be read/update via the `/config/ endpoint <https://www.wrgl.co/doc/http-api#config>`_.
     Learn more about `configuration options`_.
@@ -0,0 +1,58 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022 Wrangle Ltd
+
+"""Reads Wrgl tables into `pandas <https://pandas.pydata.org/>`_ DataFrames.
+
+Block streams are parsed by pandas' C parser as they arrive, so rows never exist as lists
+of Python strings. Requires ``pandas``, installed with ``pip install wrgl[pandas]``.
+See :func:`wrgl.repository.Repository.read_dataframe`.
+"""
+
+import io
+import typing
+
+from wrgl.ranges import ResponseReader
+
+
+def import_pandas():
+    """Imports pandas, pointing at the extra that installs it if it is missing"""
+    try:
+        import pandas
+    except ImportError as e:
+        raise ImportError(
+            "pandas is required to read DataFrames, install it with: pip install wrgl[pandas]"
+        ) from e
+    return pandas
+
+
+def read_csv(
+    resp,
+    column_names: typing.List[str],
+    usecols: typing.List[str] = None,
+    dtypes: typing.Union[typing.Dict[str, typing.Any], typing.Any] = None,
+    index_col: typing.List[str] = None,
+    skiprows: int = 0,
+    chunksize: int = None,
+):
+    """Parses a streamed CSV response without header
+
+    :param list[str] column_names: names of all columns in the CSV
+    :param list[str] usecols: optional, only parse these columns
+    :param dtypes: optional, a dtype or a mapping of column name to dtype
+    :param list[str] index_col: optional, columns to use as the index
+    :param int skiprows: number of rows to skip at the start
+    :param int chunksize: if set, return an iterator of DataFrames with this many rows
+
+    :rtype: pandas.DataFrame or typing.Iterator[pandas.DataFrame]
+    """
+    pd = import_pandas()
+    return pd.read_csv(
+        io.BufferedReader(ResponseReader(resp)),
+        header=None,
+        names=column_names,
+        usecols=usecols,
+        dtype=dtypes,
+        index_col=index_col,
+        skiprows=skiprows,
+        chunksize=chunksize,
+    )
@@ -0,0 +1,69 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022 Wrangle Ltd
+
+import unittest
+from unittest import TestCase
+
+from wrgl.fakeserver_test import FakeWrgld, synthetic_rows
+from wrgl.repository import Repository, BLOCK_SIZE
+from wrgl.retry import RetryPolicy
+
+try:
+    import pandas
+except ImportError:
+    pandas = None
+
+
+@unittest.skipUnless(pandas is not None, "pandas is not installed")
+class ReadDataFrameTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = FakeWrgld(gzip_level=0).start()
+        self.addCleanup(self.server.stop)
+        self.columns, self.rows = synthetic_rows(BLOCK_SIZE * 3 + 10, 4)
+        self.sum = self.server.add_commit("main", self.columns, ["id"], self.rows)
+        self.repo = Repository(
+            self.server.uri,
+            "my-client",
+            "secret",
+            retry_policy=RetryPolicy(backoff_factor=0),
+        )
+
+    def test_read_dataframe(self):
+        df = self.repo.read_dataframe("heads/main", dtypes=str)
+        self.assertEqual(list(df.columns), self.columns)
+        self.assertEqual(df.values.tolist(), self.rows)
+        self.assertEqual(list(df.index), list(range(len(self.rows))))
+
+        df = self.repo.read_dataframe(self.sum, columns=["col_2", "id"])
+        self.assertEqual(list(df.columns), ["col_2", "id"])
+        self.assertEqual(df["id"].dtype.kind, "i")
+        self.assertEqual(df["col_2"].tolist(), [r[2] for r in self.rows])
+
+    def test_pk_index(self):
+        df = self.repo.read_dataframe(
+            self.sum, columns=["col_1"], dtypes={"id": str}, pk_index=True
+        )
+        self.assertEqual(list(df.index.names), ["id"])
+        self.assertEqual(list(df.columns), ["col_1"])
+        self.assertEqual(df.loc["5", "col_1"], self.rows[5][1])
+
+    def test_chunks(self):
+        chunks = list(self.repo.read_dataframe(self.sum, dtypes=str, chunksize=100))
+        self.assertEqual([len(df) for df in chunks], [100] * 7 + [75])
+        self.assertEqual(pandas.concat(chunks).values.tolist(), self.rows)
+
+    def test_resume_broken_stream(self):
+        # pandas reads 256 KiB at a time, rows are only delivered before the break
+        # if the table is larger than that
+        columns, rows = synthetic_rows(BLOCK_SIZE * 40, 4)
+        com_sum = self.server.add_commit("big", columns, ["id"], rows)
+        path = "/tables/%s/blocks/" % self.server.commits[com_sum]["table"]
+        self.server.fail_next(1, path_prefix=path, break_after=300000)
+        chunks = list(self.repo.read_dataframe(com_sum, dtypes=str, chunksize=1000))
+        df = pandas.concat(chunks)
+        self.assertEqual(df.values.tolist(), rows)
+        self.assertEqual(list(df.index), list(range(len(rows))))
+        starts = [p for _, p in self.server.request_log if p.startswith(path)]
+        self.assertEqual(len(starts), 2)
+        self.assertNotIn("start=0", starts[1])
@@ -7,7 +7,7 @@ import typing
 from wrgl.serialize import field_transformer
 
 
-@attr.s(auto_attribs=True, field_transformer=field_transformer(globals()))
+@attr.s(auto_attribs=True, slots=True, field_transformer=field_transformer(globals()))
 class RowDiff(object):
     """Row offsets from both tables.
 
@@ -19,7 +19,7 @@ class RowDiff(object):
     off2: int
 
 
-@attr.s(auto_attribs=True, field_transformer=field_transformer(globals()))
+@attr.s(auto_attribs=True, slots=True, field_transformer=field_transformer(globals()))
 class ColumnProfileDiff(object):
     """Changes in column profile.
 
@@ -35,7 +35,7 @@ class ColumnProfileDiff(object):
     stats: typing.List[typing.Dict]
 
 
-@attr.s(auto_attribs=True, field_transformer=field_transformer(globals()))
+@attr.s(auto_attribs=True, slots=True, field_transformer=field_transformer(globals()))
 class TableProfileDiff(object):
     """Changes in table profile.
 
@@ -49,7 +49,7 @@ class TableProfileDiff(object):
     columns: typing.List[ColumnProfileDiff]
 
 
-@attr.s(auto_attribs=True, field_transformer=field_transformer(globals()))
+@attr.s(auto_attribs=True, slots=True, field_transformer=field_transformer(globals()))
 class DiffResult(object):
     """Diff result. Learn more at `diff endpoint`_
 
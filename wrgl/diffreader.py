@@ -11,6 +11,18 @@ from wrgl.diff import TableProfileDiff
 from wrgl.coldiff import ColDiff
 
 
+def _project_table(
+    tbl: Table, wanted: typing.Set[str]
+) -> typing.Tuple[Table, typing.List[int]]:
+    """Returns the table restricted to the wanted columns, and the indices of those columns"""
+    indices = [i for i, name in enumerate(tbl.columns) if name in wanted]
+    columns = [tbl.columns[i] for i in indices]
+    pk = None
+    if tbl.pk is not None:
+        pk = [columns.index(tbl.columns[i]) for i in tbl.pk]
+    return Table(columns=columns, pk=pk), indices
+
+
 class RowIterator(object):
     """Iterates over rows with specified offsets of a table.
 
@@ -36,6 +48,7 @@ class RowIterator(object):
         columns: typing.List[str],
         primary_key: typing.List[str],
         fetch_size: int = 100,
+        column_indices: typing.List[int] = None,
     ) -> None:
         """
         :param Repository repo: the repo handle
@@ -43,11 +56,13 @@ class RowIterator(object):
         :param list[str] columns: column names
         :param list[str] primary_key: primary key
         :param int fetch_size: number of rows to fetch for each batch
+        :param list[int] column_indices: optional, indices in the table of `columns` if only some columns are read
         """
         self._repo = repo
         self._tbl_sum = tbl_sum
         self._offsets = []
         self._fetch_size = fetch_size
+        self._column_indices = column_indices
         self.columns = columns
         self.primary_key = primary_key
 
@@ -72,9 +87,15 @@ class RowIterator(object):
         except StopIteration:
             if self._off >= len(self):
                 raise StopIteration()
-            self._batch = self._repo.get_table_rows(
-                self._tbl_sum, self._offsets[self._off : self._off + self._fetch_size]
-            )
+            offsets = self._offsets[self._off : self._off + self._fetch_size]
+            with self._repo.span("diffreader.fetch_rows", rows=len(offsets)):
+                self._batch = iter(
+                    list(
+                        self._repo.get_table_rows(
+                            self._tbl_sum, offsets, self._column_indices
+                        )
+                    )
+                )
             self._off += self._fetch_size
             return next(self._batch)
 
@@ -110,6 +131,8 @@ class ModifiedRowIterator(object):
         columns: typing.List[str],
         primary_key: typing.List[str],
         fetch_size: int = 100,
+        column_indices1: typing.List[int] = None,
+        column_indices2: typing.List[int] = None,
     ) -> None:
         """
         :param Repository repo: the repo handle
@@ -119,11 +142,15 @@ class ModifiedRowIterator(object):
         :param list[str] columns: column names
         :param list[str] primary_key: primary key
         :param int fetch_size: number of rows to fetch for each batch
+        :param list[int] column_indices1: optional, indices of the columns to read from the newer table
+        :param list[int] column_indices2: optional, indices of the columns to read from the older table
         """
         self._repo = repo
         self._tbl_sum1 = tbl_sum1
         self._tbl_sum2 = tbl_sum2
         self._cd = cd
+        self._column_indices1 = column_indices1
+        self._column_indices2 = column_indices2
         self._fetch_size = fetch_size
         self._offsets = []
         self._off = 0
@@ -153,10 +180,23 @@ class ModifiedRowIterator(object):
             if self._off >= len(self):
                 raise StopIteration()
             offsets = self._offsets[self._off : self._off + self._fetch_size]
-            self._batch = itertools.zip_longest(
-                self._repo.get_table_rows(self._tbl_sum1, [i for i, _ in offsets]),
-                self._repo.get_table_rows(self._tbl_sum2, [i for _, i in offsets]),
-            )
+            with self._repo.span("diffreader.fetch_modified_rows", rows=len(offsets)):
+                self._batch = itertools.zip_longest(
+                    list(
+                        self._repo.get_table_rows(
+                            self._tbl_sum1,
+                            [i for i, _ in offsets],
+                            self._column_indices1,
+                        )
+                    ),
+                    list(
+                        self._repo.get_table_rows(
+                            self._tbl_sum2,
+                            [i for _, i in offsets],
+                            self._column_indices2,
+                        )
+                    ),
+                )
             self._off += self._fetch_size
             row1, row2 = next(self._batch)
         return self._cd.combine_rows(0, row1, row2)
@@ -224,23 +264,36 @@ class DiffReader(object):
         com_sum1: str,
         com_sum2: str,
         fetch_size: int = 100,
+        columns: typing.List[str] = None,
     ) -> None:
         """
         :param Repository repo: the repo handle
         :param str com_sum1: checksum of the first (newer) commit
         :param str com_sum2: checksum of the second (older) commit
+        :param int fetch_size: number of rows to fetch for each batch
+        :param list[str] columns: optional, only read these columns of changed rows, in table order.
+            Primary key columns are always read.
         """
-        dr = repo.diff(com_sum1, com_sum2)
+        with repo.span("diffreader.diff"):
+            dr = repo.diff(com_sum1, com_sum2)
         self.data_profile = dr.data_profile
         old_tbl = Table(columns=dr.old_columns, pk=dr.old_pk)
         new_tbl = Table(columns=dr.columns, pk=dr.pk)
-        cd = ColDiff(old_tbl, new_tbl)
         self.column_changes = ColumnChanges.from_new_old_columns(
             dr.columns, dr.old_columns
         )
         self.pk_changes = ColumnChanges.from_new_old_columns(
             new_tbl.primary_key, old_tbl.primary_key
         )
+        indices1 = indices2 = None
+        if columns is not None:
+            missing = set(columns) - set(dr.columns) - set(dr.old_columns)
+            if missing:
+                raise ValueError("unknown columns %s" % sorted(missing))
+            wanted = set(columns) | set(new_tbl.primary_key) | set(old_tbl.primary_key)
+            new_tbl, indices1 = _project_table(new_tbl, wanted)
+            old_tbl, indices2 = _project_table(old_tbl, wanted)
+        cd = ColDiff(old_tbl, new_tbl)
         if dr.row_diff is not None and old_tbl.primary_key == new_tbl.primary_key:
             self.added_rows = RowIterator(
                 repo=repo,
@@ -248,6 +301,7 @@ class DiffReader(object):
                 columns=new_tbl.columns,
                 primary_key=new_tbl.primary_key,
                 fetch_size=fetch_size,
+                column_indices=indices1,
             )
             self.removed_rows = RowIterator(
                 repo=repo,
@@ -255,6 +309,7 @@ class DiffReader(object):
                 columns=old_tbl.columns,
                 primary_key=old_tbl.primary_key,
                 fetch_size=fetch_size,
+                column_indices=indices2,
             )
             self.modified_rows = ModifiedRowIterator(
                 repo=repo,
@@ -264,6 +319,8 @@ class DiffReader(object):
                 columns=[col.name for col in cd.columns],
                 primary_key=new_tbl.primary_key,
                 fetch_size=fetch_size,
+                column_indices1=indices1,
+                column_indices2=indices2,
             )
             for rd in dr.row_diff:
                 if rd.off1 is None:
@@ -0,0 +1,141 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022 Wrangle Ltd
+
+"""Long-running exports that survive restarts.
+
+Progress is recorded in a small JSON state file after every block range. An interrupted
+export started again with the same arguments picks up after the last completed range,
+reading from the same table even if the branch has moved since, because tables are
+immutable. The output is written to `<path>.part` and only renamed to `path` once complete.
+"""
+
+import json
+import math
+import os
+import tempfile
+import typing
+
+import attr
+
+from wrgl import repository
+from wrgl.ranges import block_ranges
+
+
+@attr.s(auto_attribs=True)
+class ExportState(object):
+    """Progress of an export
+
+    :ivar str commit: the commit as requested, checksum or reference
+    :ivar str table: checksum of the exported table, pinned when the export started
+    :ivar int n_blocks: number of blocks of the table
+    :ivar int next_block: index of the first block not yet written
+    :ivar int offset: size of the partial output in bytes once `next_block` blocks are written
+    :ivar bool with_column_names: the output starts with column names
+    :ivar bool gzip: the output is gzip-compressed
+    """
+
+    commit: str
+    table: str
+    n_blocks: int
+    next_block: int = 0
+    offset: int = 0
+    with_column_names: bool = True
+    gzip: bool = False
+
+    @property
+    def done(self) -> bool:
+        return self.next_block >= self.n_blocks
+
+    @classmethod
+    def load(cls, path: str) -> typing.Union["ExportState", None]:
+        """Reads a state file, returning None if it is missing or unreadable
+
+        :rtype: ExportState or None
+        """
+        try:
+            with open(path, "r") as f:
+                return cls(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def save(self, path: str) -> None:
+        """Writes the state file atomically"""
+        dir_name = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=dir_name, prefix=".export-")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(attr.asdict(self), f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+
+def export_csv(
+    repo: "repository.Repository",
+    commit: str,
+    path: str,
+    with_column_names: bool = True,
+    gzip: bool = False,
+    blocks_per_range: int = 64,
+    state_path: str = None,
+) -> ExportState:
+    """Exports a table to a CSV file, resuming a previous attempt if there is one.
+
+    :param Repository repo: the repo handle
+    :param str commit: either commit checksum or reference e.g. "heads/main"
+    :param str path: path of the output file
+    :param bool with_column_names: start the output with column names
+    :param bool gzip: write gzip-compressed CSV. Each range is a gzip member, which gzip readers concatenate.
+    :param int blocks_per_range: number of blocks written between checkpoints
+    :param str state_path: optional, location of the state file. Defaults to `<path>.export.json`.
+
+    :return: the final state
+    :rtype: ExportState
+    """
+    part_path = path + ".part"
+    state_path = state_path or path + ".export.json"
+    state = ExportState.load(state_path)
+    if (
+        state is None
+        or (state.commit, state.with_column_names, state.gzip)
+        != (commit, with_column_names, gzip)
+        or not os.path.exists(part_path)
+        or os.path.getsize(part_path) < state.offset
+    ):
+        table = repo._resolve_table(commit)
+        state = ExportState(
+            commit=commit,
+            table=table.sum,
+            n_blocks=math.ceil(table.rows_count / repository.BLOCK_SIZE),
+            with_column_names=with_column_names,
+            gzip=gzip,
+        )
+        # start from scratch, an existing partial output does not match
+        open(part_path, "wb").close()
+        state.save(state_path)
+    ranges = block_ranges(state.n_blocks, state.next_block, None, blocks_per_range)
+    if state.n_blocks == 0 and with_column_names:
+        # an empty table still has a header
+        ranges = [(0, None)]
+    with repo.span("export_csv", table=state.table, start=state.next_block):
+        with open(part_path, "r+b") as f:
+            f.seek(state.offset)
+            f.truncate()
+            for start, end in ranges:
+                repo.download_table_blocks_raw(
+                    state.table,
+                    f,
+                    start=start,
+                    end=end,
+                    with_column_names=with_column_names and start == 0,
+                    keep_gzip=gzip,
+                )
+                f.flush()
+                os.fsync(f.fileno())
+                state.next_block = state.n_blocks if end is None else end
+                state.offset = f.tell()
+                state.save(state_path)
+        os.replace(part_path, path)
+    os.remove(state_path)
+    return state
@@ -0,0 +1,88 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022 Wrangle Ltd
+
+import gzip
+import os
+import tempfile
+from unittest import TestCase
+
+import requests
+
+from wrgl.export import ExportState
+from wrgl.fakeserver_test import FakeWrgld, _to_csv, modify_rows, synthetic_rows
+from wrgl.repository import Repository, BLOCK_SIZE
+
+
+class ExportCSVTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.server = FakeWrgld().start()
+        self.addCleanup(self.server.stop)
+        self.columns, self.rows = synthetic_rows(BLOCK_SIZE * 5 + 10, 4)
+        self.server.add_commit("main", self.columns, ["id"], self.rows)
+        self.repo = Repository(self.server.uri, "my-client", "secret")
+        self.path = os.path.join(self.dir.name, "main.csv")
+
+    def read(self, path, compressed=False):
+        with open(path, "rb") as f:
+            data = f.read()
+        return gzip.decompress(data) if compressed else data
+
+    def test_export(self):
+        state = self.repo.export_csv("heads/main", self.path, blocks_per_range=2)
+        self.assertTrue(state.done)
+        self.assertEqual(self.read(self.path), _to_csv([self.columns] + self.rows))
+        self.assertEqual(os.listdir(self.dir.name), ["main.csv"])
+
+        path = os.path.join(self.dir.name, "main.csv.gz")
+        self.repo.export_csv(
+            "heads/main", path, with_column_names=False, gzip=True, blocks_per_range=4
+        )
+        self.assertEqual(self.read(path, True), _to_csv(self.rows))
+
+    def test_resume(self):
+        download = self.repo.download_table_blocks_raw
+        calls = []
+
+        def fail_third_range(*args, **kwargs):
+            calls.append(kwargs["start"])
+            if len(calls) == 3:
+                raise requests.ConnectionError("connection lost")
+            return download(*args, **kwargs)
+
+        self.repo.download_table_blocks_raw = fail_third_range
+        with self.assertRaises(requests.ConnectionError):
+            self.repo.export_csv("heads/main", self.path, blocks_per_range=2)
+        self.assertFalse(os.path.exists(self.path))
+        state = ExportState.load(self.path + ".export.json")
+        self.assertEqual((state.next_block, state.n_blocks), (4, 6))
+        self.assertEqual(os.path.getsize(self.path + ".part"), state.offset)
+
+        # the branch moves, the export still finishes the pinned table
+        self.server.add_commit(
+            "main", self.columns, ["id"], modify_rows(self.rows, 0.5)
+        )
+        self.repo.download_table_blocks_raw = download
+        n = len(self.server.request_log)
+        self.repo.export_csv("heads/main", self.path, blocks_per_range=2)
+        self.assertEqual(self.read(self.path), _to_csv([self.columns] + self.rows))
+        blocks = [p for _, p in self.server.request_log[n:] if "/blocks/" in p]
+        self.assertEqual(len(blocks), 1)
+        self.assertIn("start=4", blocks[0])
+        self.assertFalse(os.path.exists(self.path + ".export.json"))
+
+    def test_changed_arguments_restart(self):
+        state = ExportState(commit="heads/main", table="abc", n_blocks=6, next_block=4)
+        state.offset = 100
+        state.save(self.path + ".export.json")
+        with open(self.path + ".part", "wb") as f:
+            f.write(b"x" * 100)
+        self.repo.export_csv("heads/main", self.path, with_column_names=False)
+        self.assertEqual(self.read(self.path), _to_csv(self.rows))
+
+    def test_empty_table(self):
+        self.server.add_commit("empty", self.columns, ["id"], [])
+        self.repo.export_csv("heads/empty", self.path)
+        self.assertEqual(self.read(self.path), _to_csv([self.columns]))
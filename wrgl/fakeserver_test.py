@@ -0,0 +1,488 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022 Wrangle Ltd
+
+"""An in-process stand-in for wrgld, used by tests and benchmarks that must run offline.
+
+It serves the endpoints used by :class:`wrgl.repository.Repository` from in-memory
+tables and commits, and emulates the UMA flow: unauthenticated requests receive a
+401 challenge, and the server doubles as the authorization server that hands out
+access tokens and RPTs. Blocks hold :data:`BLOCK_SIZE` rows and the `end` block
+index is exclusive.
+"""
+
+import csv
+import datetime
+import email.parser
+import email.policy
+import gzip
+import hashlib
+import io
+import json
+import random
+import threading
+import typing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+BLOCK_SIZE = 255
+
+
+def synthetic_rows(
+    n_rows: int, n_cols: int, seed: int = 0
+) -> typing.Tuple[typing.List[str], typing.List[typing.List[str]]]:
+    """Generates a table whose first column is a unique id
+
+    :rtype: tuple[list[str], list[list[str]]]
+    """
+    rnd = random.Random(seed)
+    columns = ["id"] + ["col_%d" % i for i in range(1, n_cols)]
+    rows = [
+        [str(i)] + ["%x" % rnd.getrandbits(32) for _ in range(1, n_cols)]
+        for i in range(n_rows)
+    ]
+    return columns, rows
+
+
+def modify_rows(
+    rows: typing.List[typing.List[str]], fraction: float, seed: int = 0
+) -> typing.List[typing.List[str]]:
+    """Returns a copy of rows where about `fraction` of the rows are updated, and a few
+    are removed and added. Assumes ids generated by :func:`synthetic_rows`.
+
+    :rtype: list[list[str]]
+    """
+    rnd = random.Random(seed)
+    n = max(1, int(len(rows) * fraction))
+    result = [list(row) for row in rows]
+    for i in rnd.sample(range(len(result)), min(n, len(result))):
+        if len(result[i]) > 1:
+            result[i][-1] = "%x" % rnd.getrandbits(32)
+    removed = set(rnd.sample(range(len(result)), min(n // 10, len(result))))
+    result = [row for i, row in enumerate(result) if i not in removed]
+    width = len(rows[0]) if rows else 1
+    next_id = max([int(row[0]) for row in rows] + [0]) + 1
+    for i in range(n // 10):
+        result.append(
+            [str(next_id + i)] + ["%x" % rnd.getrandbits(32) for _ in range(1, width)]
+        )
+    return result
+
+
+def _to_csv(rows: typing.Iterable[typing.List[str]]) -> bytes:
+    buf = io.StringIO()
+    writer = csv.writer(buf, dialect="unix", quoting=csv.QUOTE_MINIMAL)
+    writer.writerows(rows)
+    return buf.getvalue().encode("utf8")
+
+
+class FakeWrgld(object):
+    """In-memory wrgld server running on a background thread::
+
+        with FakeWrgld() as server:
+            server.add_commit("main", ["id", "a"], ["id"], [["1", "x"]])
+            repo = Repository(server.uri, "client", "secret")
+    """
+
+    def __init__(
+        self, auth: bool = True, gzip_level: int = 6, etags: bool = True
+    ) -> None:
+        """
+        :param bool auth: require an RPT, emulating the UMA challenge
+        :param int gzip_level: compression level used when the client accepts gzip. 0 disables compression.
+        :param bool etags: send an ETag with refs and answer matching If-None-Match with 304
+        """
+        self.auth = auth
+        self.gzip_level = gzip_level
+        self.etags = etags
+        self.tables: typing.Dict[str, typing.Dict] = dict()
+        self.commits: typing.Dict[str, typing.Dict] = dict()
+        self.refs: typing.Dict[str, str] = dict()
+        self.request_log: typing.List[typing.Tuple[str, str]] = []
+        self._faults: typing.List[typing.Dict] = []
+        self._tokens: typing.Set[str] = set()
+        self._counter = 0
+        self._lock = threading.Lock()
+        self._httpd = None
+        self._thread = None
+
+    @property
+    def uri(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return "http://%s:%d" % (host, port)
+
+    def start(self) -> "FakeWrgld":
+        server = self
+
+        class Handler(_Handler):
+            fake = server
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        # a short poll interval keeps stop() from waiting half a second
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever, args=(0.01,), daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._thread.join()
+
+    def __enter__(self) -> "FakeWrgld":
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    def _next_id(self) -> int:
+        with self._lock:
+            self._counter += 1
+            return self._counter
+
+    def add_table(
+        self,
+        columns: typing.List[str],
+        primary_key: typing.List[str],
+        rows: typing.List[typing.List[str]],
+    ) -> str:
+        """Stores a table and returns its checksum
+
+        :rtype: str
+        """
+        pk = [columns.index(name) for name in primary_key]
+        content = _to_csv([columns] + rows) + json.dumps(pk).encode("utf8")
+        tbl_sum = hashlib.md5(content).hexdigest()
+        self.tables[tbl_sum] = {"columns": columns, "pk": pk, "rows": rows}
+        return tbl_sum
+
+    def add_commit(
+        self,
+        branch: str,
+        columns: typing.List[str],
+        primary_key: typing.List[str],
+        rows: typing.List[typing.List[str]],
+        message: str = "commit",
+        time: datetime.datetime = None,
+        parents: typing.List[str] = None,
+    ) -> str:
+        """Stores a commit on top of the current head of `branch` and returns its checksum
+
+        :param list[str] parents: optional, overrides the parents, e.g. to create merge commits
+
+        :rtype: str
+        """
+        tbl_sum = self.add_table(columns, primary_key, rows)
+        if parents is None:
+            head = self.refs.get("heads/" + branch, None)
+            parents = [head] if head else []
+        if time is None:
+            time = datetime.datetime(2022, 1, 1, tzinfo=datetime.timezone.utc) + (
+                datetime.timedelta(minutes=len(self.commits))
+            )
+        com_sum = hashlib.md5(
+            ("%s %s %s %d" % (tbl_sum, message, parents, self._next_id())).encode()
+        ).hexdigest()
+        self.commits[com_sum] = {
+            "authorName": "John Doe",
+            "authorEmail": "john@domain.com",
+            "message": message,
+            "table": tbl_sum,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "parents": parents,
+        }
+        self.refs["heads/" + branch] = com_sum
+        return com_sum
+
+    def fail_next(
+        self,
+        n: int = 1,
+        status: int = 503,
+        path_prefix: str = "/",
+        retry_after: str = None,
+        break_after: int = None,
+    ) -> None:
+        """Makes the next `n` requests whose path starts with `path_prefix` fail
+
+        :param int status: status of the failed responses
+        :param str retry_after: optional, value of the Retry-After header
+        :param int break_after: optional, instead of returning `status`, send the normal
+            response headers and only this many bytes of the body, then drop the connection
+        """
+        with self._lock:
+            for _ in range(n):
+                self._faults.append(
+                    {
+                        "status": status,
+                        "path_prefix": path_prefix,
+                        "retry_after": retry_after,
+                        "break_after": break_after,
+                    }
+                )
+
+    def _pop_fault(self, path: str) -> typing.Union[typing.Dict, None]:
+        with self._lock:
+            for i, fault in enumerate(self._faults):
+                if path.startswith(fault["path_prefix"]):
+                    return self._faults.pop(i)
+        return None
+
+    def _resolve(self, head: str) -> typing.Union[str, None]:
+        if head in self.commits:
+            return head
+        return self.refs.get(head, None)
+
+    def _commit_json(self, com_sum: str, with_sum: bool = True) -> typing.Dict:
+        com = self.commits[com_sum]
+        tbl = self.tables[com["table"]]
+        obj = {
+            "authorName": com["authorName"],
+            "authorEmail": com["authorEmail"],
+            "message": com["message"],
+            "table": {
+                "sum": com["table"],
+                "columns": tbl["columns"],
+                "pk": tbl["pk"],
+                "rowsCount": len(tbl["rows"]),
+                "exist": True,
+            },
+            "time": com["time"],
+            "parents": com["parents"],
+        }
+        if with_sum:
+            obj["sum"] = com_sum
+        return obj
+
+    def _commit_tree_json(self, com_sum: str, max_depth: int) -> typing.Dict:
+        root = self._commit_json(com_sum, with_sum=False)
+        stack = [(root, com_sum, 1)]
+        while stack:
+            obj, s, depth = stack.pop()
+            if depth >= max_depth or not self.commits[s]["parents"]:
+                continue
+            obj["parentCommits"] = dict()
+            for p in self.commits[s]["parents"]:
+                child = self._commit_json(p, with_sum=False)
+                obj["parentCommits"][p] = child
+                stack.append((child, p, depth + 1))
+        return {"sum": com_sum, "root": root}
+
+    def _diff_json(self, sum1: str, sum2: str) -> typing.Dict:
+        tbl1 = self.tables[self.commits[sum1]["table"]]
+        tbl2 = self.tables[self.commits[sum2]["table"]]
+
+        def index(tbl):
+            return {
+                tuple(row[i] for i in tbl["pk"]) if tbl["pk"] else tuple(row): off
+                for off, row in enumerate(tbl["rows"])
+            }
+
+        idx1 = index(tbl1)
+        idx2 = index(tbl2)
+        same_cols = tbl1["columns"] == tbl2["columns"]
+        row_diff = []
+        for key, off1 in idx1.items():
+            off2 = idx2.get(key, None)
+            if off2 is None:
+                row_diff.append({"off1": off1})
+            elif not same_cols or tbl1["rows"][off1] != tbl2["rows"][off2]:
+                row_diff.append({"off1": off1, "off2": off2})
+        for key, off2 in idx2.items():
+            if key not in idx1:
+                row_diff.append({"off2": off2})
+        return {
+            "tableSum": self.commits[sum1]["table"],
+            "oldTableSum": self.commits[sum2]["table"],
+            "oldPK": tbl2["pk"],
+            "pk": tbl1["pk"],
+            "oldColumns": tbl2["columns"],
+            "columns": tbl1["columns"],
+            "rowDiff": row_diff,
+        }
+
+    def _commit_upload(self, content_type: str, body: bytes) -> typing.Dict:
+        msg = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + body
+        )
+        fields = dict()
+        for part in msg.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            fields[name] = part.get_payload(decode=True)
+        data = fields["file"]
+        if data[:2] == b"\x1f\x8b":
+            data = gzip.decompress(data)
+        rows = list(csv.reader(io.StringIO(data.decode("utf8"))))
+        primary_key = [s for s in fields["primaryKey"].decode().split(",") if s]
+        com_sum = self.add_commit(
+            fields["branch"].decode(),
+            rows[0],
+            primary_key,
+            rows[1:],
+            message=fields["message"].decode(),
+        )
+        return {"sum": com_sum, "table": self.commits[com_sum]["table"]}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    fake: FakeWrgld
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(
+        self,
+        status: int,
+        body: bytes,
+        content_type: str = "application/json",
+        headers: typing.Dict[str, str] = None,
+        break_after: int = None,
+    ) -> None:
+        encoding = None
+        if (
+            self.fake.gzip_level > 0
+            and content_type == "text/csv"
+            and "gzip" in self.headers.get("Accept-Encoding", "")
+        ):
+            body = gzip.compress(body, compresslevel=self.fake.gzip_level)
+            encoding = "gzip"
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if encoding is not None:
+            self.send_header("Content-Encoding", encoding)
+        for k, v in (headers or dict()).items():
+            self.send_header(k, v)
+        self.end_headers()
+        if break_after is not None:
+            self.wfile.write(body[:break_after])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+    def _json(self, obj, status: int = 200, **kwargs) -> None:
+        self._send(status, json.dumps(obj).encode("utf8"), **kwargs)
+
+    def _read_body(self) -> bytes:
+        n = int(self.headers.get("Content-Length", 0) or 0)
+        return self.rfile.read(n) if n > 0 else b""
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def _handle(self, method: str) -> None:
+        body = self._read_body()
+        url = urlsplit(self.path)
+        path = url.path
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        fake = self.fake
+        fake.request_log.append((method, self.path))
+        if path.startswith("/auth/"):
+            return self._auth(path, body)
+        if fake.auth:
+            token = self.headers.get("Authorization", "")[len("Bearer ") :]
+            if token not in fake._tokens or not token.startswith("rpt-"):
+                return self._json(
+                    {"message": "Unauthorized"},
+                    401,
+                    headers={
+                        "WWW-Authenticate": 'UMA realm="fake", as_uri="%s/auth", ticket="ticket-%d"'
+                        % (fake.uri, fake._next_id())
+                    },
+                )
+        fault = fake._pop_fault(path)
+        if fault is not None and fault["break_after"] is None:
+            headers = dict()
+            if fault["retry_after"] is not None:
+                headers["Retry-After"] = fault["retry_after"]
+            return self._json({"message": "injected"}, fault["status"], headers=headers)
+        break_after = None if fault is None else fault["break_after"]
+        parts = [s for s in path.split("/") if s]
+        try:
+            self._route(method, parts, query, body, break_after)
+        except (KeyError, IndexError):
+            self._json({"message": "Not Found"}, 404)
+
+    def _route(self, method, parts, query, body, break_after) -> None:
+        fake = self.fake
+        if method == "POST" and parts == ["commits"]:
+            if not body:
+                return self._json({"message": "missing form"}, 400)
+            return self._json(
+                fake._commit_upload(self.headers.get("Content-Type"), body)
+            )
+        if parts == ["refs"]:
+            body = json.dumps({"refs": fake.refs}, sort_keys=True).encode("utf8")
+            if not fake.etags:
+                return self._send(200, body)
+            etag = '"%s"' % hashlib.md5(body).hexdigest()
+            if self.headers.get("If-None-Match") == etag:
+                return self._send(304, b"", headers={"ETag": etag})
+            return self._send(200, body, headers={"ETag": etag})
+        if parts[:2] == ["refs", "heads"]:
+            return self._json(fake._commit_json(fake.refs["/".join(parts[1:])]))
+        if parts == ["commits"]:
+            com_sum = fake._resolve(query["head"])
+            if com_sum is None:
+                raise KeyError(query["head"])
+            return self._json(
+                fake._commit_tree_json(com_sum, int(query.get("maxDepth", "1")))
+            )
+        if parts[0] == "commits" and len(parts) == 2:
+            return self._json(fake._commit_json(parts[1]))
+        if parts[0] == "diff" and len(parts) == 3:
+            return self._json(fake._diff_json(parts[1], parts[2]))
+        if parts == ["blocks"] or parts == ["rows"]:
+            com_sum = fake._resolve(query["head"])
+            if com_sum is None:
+                raise KeyError(query["head"])
+            tbl = fake.tables[fake.commits[com_sum]["table"]]
+        elif parts[0] == "tables" and len(parts) >= 2:
+            tbl = fake.tables[parts[1]]
+            parts = parts[2:]
+            if not parts:
+                return self._json(
+                    {
+                        "columns": tbl["columns"],
+                        "pk": tbl["pk"],
+                        "rowsCount": len(tbl["rows"]),
+                    }
+                )
+        else:
+            raise KeyError(parts)
+        if parts == ["blocks"]:
+            start = int(query.get("start", "0"))
+            end = int(query["end"]) if "end" in query else None
+            rows = tbl["rows"][
+                start * BLOCK_SIZE : None if end is None else end * BLOCK_SIZE
+            ]
+            if query.get("columns", "false") == "true":
+                rows = [tbl["columns"]] + rows
+        elif parts == ["rows"]:
+            offsets = [int(s) for s in query.get("offsets", "").split(",") if s]
+            rows = [tbl["rows"][off] for off in offsets]
+        else:
+            raise KeyError(parts)
+        self._send(200, _to_csv(rows), "text/csv", break_after=break_after)
+
+    def _auth(self, path: str, body: bytes) -> None:
+        fake = self.fake
+        if path == "/auth/.well-known/uma2-configuration":
+            return self._json({"token_endpoint": fake.uri + "/auth/token"})
+        form = {k: v[-1] for k, v in parse_qs(body.decode()).items()}
+        if form.get("grant_type") == "client_credentials":
+            token = "access-%d" % fake._next_id()
+        else:
+            access = self.headers.get("Authorization", "")[len("Bearer ") :]
+            if access not in fake._tokens:
+                return self._json({"error": "invalid token"}, 401)
+            token = "rpt-%d" % fake._next_id()
+        with fake._lock:
+            fake._tokens.add(token)
+        self._json({"access_token": token})
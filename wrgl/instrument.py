@@ -0,0 +1,243 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022 Wrangle Ltd
+
+import contextlib
+import re
+import threading
+import time
+import typing
+
+import attr
+
+_sum_pattern = re.compile(r"(?<=/)[0-9a-f]{32}(?=/)")
+_branch_pattern = re.compile(r"^/refs/heads/.+/$")
+
+
+def endpoint_template(path: str) -> str:
+    """Returns the endpoint template of a request path, replacing checksums with
+    `{sum}` and branch names with `{branch}`. E.g. `/tables/{sum}/rows/`.
+
+    :param str path: request path relative to the repository URI
+
+    :rtype: str
+    """
+    path = path.split("?", 1)[0]
+    if _branch_pattern.match(path):
+        return "/refs/heads/{branch}/"
+    return _sum_pattern.sub("{sum}", path)
+
+
+@attr.s(auto_attribs=True)
+class RequestEvent(object):
+    """Measurements of a single request, including all of its retries
+
+    :ivar str method: HTTP verb
+    :ivar str endpoint: endpoint template, e.g. `/tables/{sum}/rows/`
+    :ivar int status: status of the final response. None if no response was received.
+    :ivar float connect: seconds spent opening a new connection. None if a pooled connection was reused
+        or the session does not support connect timing.
+    :ivar float ttfb: seconds from sending the request until response headers arrived, excluding `connect`
+    :ivar float transfer: seconds spent reading the response body
+    :ivar int bytes_in: response body size as received on the wire
+    :ivar int bytes_out: request body size
+    :ivar int retries: number of retries
+    :ivar int auth_refreshes: number of times an RPT had to be acquired
+    :ivar str error: name of the exception that aborted the request, if any
+    """
+
+    method: str
+    endpoint: str
+    status: int = None
+    connect: float = None
+    ttfb: float = None
+    transfer: float = None
+    bytes_in: int = None
+    bytes_out: int = None
+    retries: int = 0
+    auth_refreshes: int = 0
+    error: str = None
+
+    @property
+    def latency(self) -> float:
+        """Total seconds spent on the final attempt
+
+        :rtype: float
+        """
+        return (self.connect or 0) + (self.ttfb or 0) + (self.transfer or 0)
+
+
+class Instrumentation(object):
+    """Receives measurements from the SDK. This base class ignores everything;
+    subclass it and override :func:`on_request` and/or :func:`span`.
+    """
+
+    def on_request(self, event: RequestEvent) -> None:
+        """Called once for every request, after the response body is read or closed
+
+        :param RequestEvent event: request measurements
+        """
+        pass
+
+    @contextlib.contextmanager
+    def span(self, name: str, **attributes) -> typing.Iterator[None]:
+        """Wraps a higher-level operation, e.g. `commit.upload` or `diffreader.fetch_rows`
+
+        :param str name: name of the operation
+        :param dict attributes: attributes of the operation
+        """
+        yield
+
+
+class CallbackInstrumentation(Instrumentation):
+    """Forwards measurements to plain functions"""
+
+    def __init__(
+        self,
+        on_request: typing.Callable[[RequestEvent], None] = None,
+        on_span: typing.Callable[[str, float, typing.Dict], None] = None,
+    ) -> None:
+        """
+        :param func on_request: optional, called with each :class:`RequestEvent`
+        :param func on_span: optional, called with the name, duration in seconds and attributes of each span
+        """
+        self._on_request = on_request
+        self._on_span = on_span
+
+    def on_request(self, event: RequestEvent) -> None:
+        if self._on_request is not None:
+            self._on_request(event)
+
+    @contextlib.contextmanager
+    def span(self, name: str, **attributes) -> typing.Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self._on_span is not None:
+                self._on_span(name, time.perf_counter() - start, attributes)
+
+
+@attr.s(auto_attribs=True)
+class EndpointStats(object):
+    """Aggregated measurements of an endpoint or a span
+
+    :ivar int count: number of requests or spans
+    :ivar int errors: number of requests that failed
+    :ivar float total_time: sum of latencies in seconds
+    :ivar float max_time: maximum latency in seconds
+    :ivar int bytes_in: sum of response sizes
+    :ivar int bytes_out: sum of request sizes
+    :ivar int retries: sum of retries
+    :ivar int auth_refreshes: sum of auth refreshes
+    """
+
+    count: int = 0
+    errors: int = 0
+    total_time: float = 0.0
+    max_time: float = 0.0
+    bytes_in: int = 0
+    bytes_out: int = 0
+    retries: int = 0
+    auth_refreshes: int = 0
+
+    def add_time(self, seconds: float) -> None:
+        self.count += 1
+        self.total_time += seconds
+        self.max_time = max(self.max_time, seconds)
+
+    @property
+    def mean_time(self) -> float:
+        """Mean latency in seconds
+
+        :rtype: float
+        """
+        return self.total_time / self.count if self.count else 0.0
+
+
+class MetricsCollector(Instrumentation):
+    """Aggregates measurements per endpoint and per span name in memory. Thread-safe."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._endpoints: typing.Dict[typing.Tuple[str, str], EndpointStats] = dict()
+        self._spans: typing.Dict[str, EndpointStats] = dict()
+
+    def on_request(self, event: RequestEvent) -> None:
+        with self._lock:
+            stats = self._endpoints.setdefault(
+                (event.method, event.endpoint), EndpointStats()
+            )
+            stats.add_time(event.latency)
+            if event.error is not None or (event.status or 0) >= 400:
+                stats.errors += 1
+            stats.bytes_in += event.bytes_in or 0
+            stats.bytes_out += event.bytes_out or 0
+            stats.retries += event.retries
+            stats.auth_refreshes += event.auth_refreshes
+
+    @contextlib.contextmanager
+    def span(self, name: str, **attributes) -> typing.Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._spans.setdefault(name, EndpointStats()).add_time(elapsed)
+
+    def endpoints(self) -> typing.Dict[typing.Tuple[str, str], EndpointStats]:
+        """Returns a copy of per-endpoint stats keyed by (method, endpoint template)
+
+        :rtype: dict[tuple[str, str], EndpointStats]
+        """
+        with self._lock:
+            return {k: attr.evolve(v) for k, v in self._endpoints.items()}
+
+    def spans(self) -> typing.Dict[str, EndpointStats]:
+        """Returns a copy of per-span stats keyed by span name
+
+        :rtype: dict[str, EndpointStats]
+        """
+        with self._lock:
+            return {k: attr.evolve(v) for k, v in self._spans.items()}
+
+
+class OpenTelemetryInstrumentation(Instrumentation):
+    """Reports requests and spans to an OpenTelemetry tracer, e.g.
+    `opentelemetry.trace.get_tracer("wrgl")`. The `opentelemetry` package itself
+    is not required by the SDK.
+    """
+
+    def __init__(self, tracer) -> None:
+        """
+        :param opentelemetry.trace.Tracer tracer: the tracer to report to
+        """
+        self._tracer = tracer
+
+    def on_request(self, event: RequestEvent) -> None:
+        end = time.time_ns()
+        span = self._tracer.start_span(
+            "%s %s" % (event.method, event.endpoint),
+            start_time=end - int(event.latency * 1e9),
+        )
+        for key, value in [
+            ("http.method", event.method),
+            ("http.route", event.endpoint),
+            ("http.status_code", event.status),
+            ("wrgl.connect_time", event.connect),
+            ("wrgl.ttfb", event.ttfb),
+            ("wrgl.transfer_time", event.transfer),
+            ("http.response_content_length", event.bytes_in),
+            ("http.request_content_length", event.bytes_out),
+            ("wrgl.retries", event.retries),
+            ("wrgl.auth_refreshes", event.auth_refreshes),
+            ("wrgl.error", event.error),
+        ]:
+            if value is not None:
+                span.set_attribute(key, value)
+        span.end(end_time=end)
+
+    @contextlib.contextmanager
+    def span(self, name: str, **attributes) -> typing.Iterator[None]:
+        with self._tracer.start_as_current_span(name, attributes=attributes):
+            yield
@@ -0,0 +1,102 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022 Wrangle Ltd
+
+import os
+import tempfile
+from unittest import TestCase
+
+import vcr
+
+from wrgl.instrument import (
+    CallbackInstrumentation,
+    MetricsCollector,
+    RequestEvent,
+    endpoint_template,
+)
+from wrgl.fakeserver_test import FakeWrgld
+from wrgl.repository import Repository
+
+
+class EndpointTemplateTestCase(TestCase):
+    def test_template(self):
+        for path, tmpl in [
+            ("/refs/", "/refs/"),
+            ("/refs/heads/main/", "/refs/heads/{branch}/"),
+            ("/refs/heads/feature/x/", "/refs/heads/{branch}/"),
+            (
+                "/tables/f0922f47e7b80dafc6448e27a7caf36a/rows/",
+                "/tables/{sum}/rows/",
+            ),
+            (
+                "/diff/d5c2b5f3211b3b72ed606e387919255a/f0922f47e7b80dafc6448e27a7caf36a/",
+                "/diff/{sum}/{sum}/",
+            ),
+            ("/blocks/?head=abc", "/blocks/"),
+        ]:
+            self.assertEqual(endpoint_template(path), tmpl)
+
+
+class MetricsCollectorTestCase(TestCase):
+    def test_aggregate(self):
+        m = MetricsCollector()
+        m.on_request(
+            RequestEvent(
+                method="GET", endpoint="/refs/", status=200, ttfb=0.1, transfer=0.2,
+                bytes_in=100,
+            )
+        )
+        m.on_request(
+            RequestEvent(
+                method="GET", endpoint="/refs/", status=503, ttfb=0.3, retries=2
+            )
+        )
+        with m.span("commit.upload"):
+            pass
+        stats = m.endpoints()[("GET", "/refs/")]
+        self.assertEqual(stats.count, 2)
+        self.assertEqual(stats.errors, 1)
+        self.assertEqual(stats.retries, 2)
+        self.assertEqual(stats.bytes_in, 100)
+        self.assertAlmostEqual(stats.max_time, 0.3)
+        self.assertAlmostEqual(stats.mean_time, 0.3)
+        self.assertEqual(m.spans()["commit.upload"].count, 1)
+
+    def test_repository_events(self):
+        events = []
+        repo = Repository(
+            "http://localhost:8081",
+            "wrgl-python-sdk",
+            "my-secret",
+            instrumentation=CallbackInstrumentation(on_request=events.append),
+        )
+        with vcr.use_cassette(
+            "fixtures/vcr_cassettes/repository_test/RepositoryTestCase/test_authenticate.yaml"
+        ):
+            repo.authenticate()
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0].method, "POST")
+        self.assertEqual(events[0].endpoint, "/commits/")
+        self.assertEqual(events[0].status, 401)
+        self.assertEqual(events[0].auth_refreshes, 1)
+        self.assertIsNotNone(events[0].ttfb)
+        self.assertIsNotNone(events[0].transfer)
+
+    def test_connect_time(self):
+        with FakeWrgld() as server:
+            events = []
+            repo = Repository(
+                server.uri,
+                "my-client",
+                "secret",
+                instrumentation=CallbackInstrumentation(on_request=events.append),
+            )
+            repo.authenticate()
+            self.assertIsNotNone(events[0].connect)
+
+            # timing must not get in the way of vcrpy's stubbed connections
+            cassette = os.path.join(tempfile.mkdtemp(), "cassette.yaml")
+            for record_mode in ["once", "none"]:
+                repo = Repository(server.uri, "my-client", "secret")
+                with vcr.use_cassette(cassette, record_mode=record_mode):
+                    repo.authenticate()
+                    self.assertEqual(repo.get_refs(), {})
@@ -1,4 +1,5 @@
 import datetime
+import sys
 
 
 # Helpers for parsing the result of isoformat()
@@ -59,6 +60,35 @@ def _parse_hh_mm_ss_ff(tstr):
     return time_comps
 
 
+def _parse_tz(tzstr):
+    if tzstr == 'Z':
+        return datetime.timezone.utc
+    tz_comps = _parse_hh_mm_ss_ff(tzstr[1:])
+    if all(x == 0 for x in tz_comps):
+        return datetime.timezone.utc
+    tzsign = -1 if tzstr[0] == '-' else 1
+
+    td = datetime.timedelta(hours=tz_comps[0], minutes=tz_comps[1],
+                            seconds=tz_comps[2], microseconds=tz_comps[3])
+
+    return datetime.timezone(tzsign * td)
+
+
+# time zones by suffix, so that timestamps with the same offset share one tzinfo. Not used
+# by _fromisoformat_native, i.e. from Python 3.11
+_tz_cache = {'Z': datetime.timezone.utc}
+_TZ_CACHE_SIZE = 256
+
+
+def _tz(tzstr):
+    tzi = _tz_cache.get(tzstr, None)
+    if tzi is None:
+        tzi = _parse_tz(tzstr)
+        if len(_tz_cache) < _TZ_CACHE_SIZE:
+            _tz_cache[tzstr] = tzi
+    return tzi
+
+
 def _parse_isoformat_time(tstr):
     # Format supported is HH[:MM[:SS[.fff[fff]]]][+HH:MM[:SS[.ffffff]]]
     len_str = len(tstr)
@@ -84,26 +114,14 @@ def _parse_isoformat_time(tstr):
         if len(tzstr) not in (1, 6, 9, 16):
             raise ValueError('Malformed time zone string')
 
-        if tzstr == 'Z':
-            tzi = datetime.timezone.utc
-        else:
-            tz_comps = _parse_hh_mm_ss_ff(tzstr[1:])
-            if all(x == 0 for x in tz_comps):
-                tzi = datetime.timezone.utc
-            else:
-                tzsign = -1 if tstr[tz_pos] == '-' else 1
-
-                td = datetime.timedelta(hours=tz_comps[0], minutes=tz_comps[1],
-                                        seconds=tz_comps[2], microseconds=tz_comps[3])
-
-                tzi = datetime.timezone(tzsign * td)
+        tzi = _tz(tzstr)
 
     time_comps.append(tzi)
 
     return time_comps
 
 
-def fromisoformat(date_string):
+def _fromisoformat_py(date_string):
     """Construct a datetime from the output of datetime.isoformat()."""
     if not isinstance(date_string, str):
         raise TypeError('fromisoformat: argument must be str')
@@ -126,3 +144,46 @@ def fromisoformat(date_string):
         time_components = [0, 0, 0, 0, None]
 
     return datetime.datetime(*(date_components + time_components))
+
+
+def _fromisoformat_native(date_string):
+    """Construct a datetime from the output of datetime.isoformat(), or a timestamp
+    ending with "Z". Falls back to the pure-Python parser for strings the C
+    implementation of datetime.fromisoformat rejects.
+
+    Unlike the other parsers, time zones do not come from the cache: offsets other than
+    UTC get their own tzinfo, because swapping in the cached one costs several times the
+    parse itself. The cache therefore only applies before Python 3.11."""
+    try:
+        return datetime.datetime.fromisoformat(date_string)
+    except ValueError:
+        return _fromisoformat_py(date_string)
+
+
+def _fromisoformat_split(date_string):
+    """Construct a datetime from the output of datetime.isoformat(), or a timestamp
+    ending with "Z". The C implementation of datetime.fromisoformat parses the date and
+    time, the time zone comes from a cache."""
+    if not isinstance(date_string, str):
+        raise TypeError('fromisoformat: argument must be str')
+    n = len(date_string)
+    if n > 10 and date_string[-1] == 'Z':
+        naive, tzi = date_string[:-1], datetime.timezone.utc
+    elif n > 16 and date_string[-6] in '+-' and date_string[-3] == ':':
+        naive, tzi = date_string[:-6], _tz(date_string[-6:])
+    else:
+        naive, tzi = date_string, None
+    try:
+        dt = datetime.datetime.fromisoformat(naive)
+    except ValueError:
+        return _fromisoformat_py(date_string)
+    if dt.tzinfo is not None:
+        return _fromisoformat_py(date_string)
+    return dt if tzi is None else dt.replace(tzinfo=tzi)
+
+
+# datetime.fromisoformat only parses "Z" and arbitrary fractions of a second from 3.11
+if sys.version_info >= (3, 11):
+    fromisoformat = _fromisoformat_native
+else:
+    fromisoformat = _fromisoformat_split
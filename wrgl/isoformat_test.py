@@ -1,7 +1,11 @@
 from unittest import TestCase
 import datetime
 
-from wrgl.isoformat import fromisoformat
+from wrgl.isoformat import (
+    fromisoformat,
+    _fromisoformat_py,
+    _fromisoformat_split,
+)
 
 class FromISOFormatTestCase(TestCase):
     def test_parse(self):
@@ -12,4 +16,32 @@ class FromISOFormatTestCase(TestCase):
         self.assertEqual(
             fromisoformat('2021-11-17T01:22:53+07:00'),
             datetime.datetime(2021, 11, 17, 1, 22, 53, tzinfo=datetime.timezone(datetime.timedelta(hours=7)))
-        )
\ No newline at end of file
+        )
+
+    def test_matches_pure_python_parser(self):
+        for parse in (fromisoformat, _fromisoformat_split):
+            for s in [
+                '2021-11-17T01:22:53Z',
+                '2021-11-17T01:22:53.123Z',
+                '2021-11-17T01:22:53.123456+07:00',
+                '2021-11-17T01:22:53-05:30',
+                '2021-11-17T01:22:53+00:00',
+                '2021-11-17T01:22:53',
+                '2021-11-17T01:22',
+                '2021-11-17',
+                '2021-11-17T01:22:53+07:00:30',
+            ]:
+                self.assertEqual(parse(s), _fromisoformat_py(s), s)
+                self.assertEqual(parse(s).utcoffset(), _fromisoformat_py(s).utcoffset(), s)
+            for s in ['2021/11/17', '2021-11-17T01:22:53+0', 'nope']:
+                with self.assertRaises(ValueError):
+                    parse(s)
+            with self.assertRaises(TypeError):
+                parse(None)
+
+    def test_time_zones_are_shared(self):
+        for parse in (_fromisoformat_py, _fromisoformat_split):
+            a = parse('2021-11-17T01:22:53+07:00')
+            b = parse('2022-01-01T00:00:00+07:00')
+            self.assertIs(a.tzinfo, b.tzinfo)
+            self.assertIs(parse('2021-11-17T01:22:53Z').tzinfo, datetime.timezone.utc)
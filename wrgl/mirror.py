@@ -0,0 +1,273 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022 Wrangle Ltd
+
+import contextlib
+import json
+import sqlite3
+import typing
+
+import attr
+
+from wrgl import repository
+from wrgl.commit import Commit, Table
+
+
+@attr.s(auto_attribs=True)
+class SyncResult(object):
+    """Outcome of :func:`TableMirror.sync`
+
+    :ivar str commit: checksum of the mirrored commit after the sync
+    :ivar bool full: the whole table was downloaded, rather than the changes since the previous commit
+    :ivar int added: number of inserted rows
+    :ivar int removed: number of deleted rows
+    :ivar int modified: number of updated rows
+    """
+
+    commit: str
+    full: bool = False
+    added: int = 0
+    removed: int = 0
+    modified: int = 0
+
+
+# SQLITE_MAX_COLUMN of default SQLite builds, the maximum number of columns of a table
+_DEFAULT_MAX_COLUMNS = 2000
+
+
+def _quote(name: str) -> str:
+    return '"%s"' % name.replace('"', '""')
+
+
+class TableMirror(object):
+    """Keeps a local SQLite copy of the head of a branch, keyed by primary key.
+
+    The first sync downloads the whole table. Later syncs only fetch the rows that changed
+    since the mirrored commit. A table without primary key, or a change of columns or
+    primary key, falls back to downloading the whole table. Either way a sync runs in one
+    transaction, so readers of the database see either the old or the new snapshot.
+
+    All values are stored as TEXT, in table `rows` whose columns are named after the table's.
+    SQLite limits the number of columns of a table, to 2000 in default builds, so wider tables
+    cannot be mirrored and :func:`TableMirror.sync` raises ValueError.
+
+    :ivar sqlite3.Connection conn: connection to the mirror database, for custom queries.
+        It is in autocommit mode, i.e. opened with `isolation_level=None`.
+    """
+
+    conn: sqlite3.Connection
+    branch: str
+
+    def __init__(
+        self,
+        repo: "repository.Repository",
+        branch: str,
+        path: str,
+        batch_size: int = 1000,
+    ) -> None:
+        """
+        :param Repository repo: the repo handle
+        :param str branch: name of the branch to mirror
+        :param str path: location of the SQLite database
+        :param int batch_size: number of rows fetched by each request and written at a time
+        """
+        self._repo = repo
+        self.branch = branch
+        self._batch_size = batch_size
+        # transactions are managed by _transaction, because the sqlite3 module commits
+        # DDL statements such as DROP TABLE outside of its implicit transactions
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+        )
+
+    def __enter__(self) -> "TableMirror":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    @contextlib.contextmanager
+    def _transaction(self) -> typing.Iterator[None]:
+        self.conn.execute("BEGIN")
+        try:
+            yield
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def _meta(self, key: str) -> typing.Any:
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def _set_meta(self, **values) -> None:
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            [(k, json.dumps(v)) for k, v in values.items()],
+        )
+
+    @property
+    def commit(self) -> typing.Union[str, None]:
+        """Checksum of the mirrored commit, None before the first sync
+
+        :rtype: str
+        """
+        return self._meta("commit")
+
+    @property
+    def columns(self) -> typing.List[str]:
+        """Column names of the mirrored table
+
+        :rtype: list[str]
+        """
+        return self._meta("columns") or []
+
+    @property
+    def primary_key(self) -> typing.List[str]:
+        """Primary key of the mirrored table
+
+        :rtype: list[str]
+        """
+        return self._meta("primary_key") or []
+
+    def __len__(self) -> int:
+        if self.commit is None:
+            return 0
+        return self.conn.execute("SELECT count(*) FROM rows").fetchone()[0]
+
+    def rows(self) -> typing.Iterator[typing.List[str]]:
+        """Iterates over mirrored rows in no particular order
+
+        :rtype: typing.Iterator[list[str]]
+        """
+        if self.commit is None:
+            return
+        for row in self.conn.execute("SELECT * FROM rows"):
+            yield list(row)
+
+    def get(
+        self, key: typing.Union[str, typing.Sequence[str]]
+    ) -> typing.Union[typing.List[str], None]:
+        """Returns the row with the given primary key, or None
+
+        :param key: values of the primary key columns, or a string for single-column keys
+
+        :rtype: list[str] or None
+        """
+        pk = self.primary_key
+        if not pk:
+            raise ValueError("the mirrored table has no primary key")
+        if isinstance(key, str):
+            key = [key]
+        row = self.conn.execute(
+            "SELECT * FROM rows WHERE %s"
+            % " AND ".join("%s = ?" % _quote(c) for c in pk),
+            list(key),
+        ).fetchone()
+        return None if row is None else list(row)
+
+    def sync(self) -> SyncResult:
+        """Brings the mirror to the head of the branch
+
+        :rtype: SyncResult
+        """
+        head = self._repo.get_branch(self.branch)
+        old_commit = self.commit
+        if head.sum == old_commit:
+            return SyncResult(commit=head.sum)
+        table = self._repo.get_table(head.table.sum)
+        table.sum = head.table.sum
+        with self._repo.span("mirror.sync", branch=self.branch, commit=head.sum):
+            with self._transaction():
+                if (
+                    old_commit is None
+                    or not table.pk
+                    or table.columns != self.columns
+                    or table.primary_key != self.primary_key
+                ):
+                    result = self._load(head, table)
+                else:
+                    result = self._apply_diff(head, table, old_commit)
+                self._set_meta(
+                    commit=head.sum,
+                    table=table.sum,
+                    columns=table.columns,
+                    primary_key=table.primary_key,
+                )
+        return result
+
+    def _insert(self, table: Table, rows: typing.Iterable[typing.List[str]]) -> int:
+        stmt = "INSERT OR REPLACE INTO rows VALUES (%s)" % ", ".join(
+            "?" * len(table.columns)
+        )
+        n = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self._batch_size:
+                self.conn.executemany(stmt, batch)
+                n += len(batch)
+                batch = []
+        self.conn.executemany(stmt, batch)
+        return n + len(batch)
+
+    def _max_columns(self) -> int:
+        # Connection.getlimit is new in Python 3.11
+        getlimit = getattr(self.conn, "getlimit", None)
+        if getlimit is None:
+            return _DEFAULT_MAX_COLUMNS
+        return getlimit(sqlite3.SQLITE_LIMIT_COLUMN)
+
+    def _load(self, head: Commit, table: Table) -> SyncResult:
+        if len(table.columns) > self._max_columns():
+            raise ValueError(
+                "table %s has %d columns, more than SQLite allows in a table (%d)"
+                % (table.sum, len(table.columns), self._max_columns())
+            )
+        self.conn.execute("DROP TABLE IF EXISTS rows")
+        cols = ", ".join("%s TEXT" % _quote(c) for c in table.columns)
+        if table.pk:
+            cols += ", PRIMARY KEY (%s)" % ", ".join(
+                _quote(c) for c in table.primary_key
+            )
+        self.conn.execute("CREATE TABLE rows (%s)" % cols)
+        n = self._insert(
+            table, self._repo.get_table_blocks(table.sum, with_column_names=False)
+        )
+        return SyncResult(commit=head.sum, full=True, added=n)
+
+    def _fetch_rows(
+        self, table_sum: str, offsets: typing.List[int], columns: typing.List[int] = None
+    ) -> typing.Iterator[typing.List[str]]:
+        for i in range(0, len(offsets), self._batch_size):
+            for row in self._repo.get_table_rows(
+                table_sum, offsets[i : i + self._batch_size], columns
+            ):
+                yield row
+
+    def _apply_diff(self, head: Commit, table: Table, old_commit: str) -> SyncResult:
+        dr = self._repo.diff(head.sum, old_commit)
+        added, removed, modified = [], [], []
+        for rd in dr.row_diff or []:
+            if rd.off1 is None:
+                removed.append(rd.off2)
+            elif rd.off2 is None:
+                added.append(rd.off1)
+            else:
+                modified.append(rd.off1)
+        # removed rows are deleted by key, so only their primary key is fetched
+        self.conn.executemany(
+            "DELETE FROM rows WHERE %s"
+            % " AND ".join("%s = ?" % _quote(c) for c in table.primary_key),
+            self._fetch_rows(dr.old_table_sum, removed, dr.old_pk),
+        )
+        self._insert(table, self._fetch_rows(table.sum, added + modified))
+        return SyncResult(
+            commit=head.sum,
+            added=len(added),
+            removed=len(removed),
+            modified=len(modified),
+        )
@@ -0,0 +1,105 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022 Wrangle Ltd
+
+import os
+import tempfile
+from unittest import TestCase
+
+from requests.exceptions import HTTPError
+
+from wrgl.fakeserver_test import FakeWrgld, modify_rows, synthetic_rows
+from wrgl.mirror import TableMirror
+from wrgl.repository import Repository, BLOCK_SIZE
+
+
+class TableMirrorTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.server = FakeWrgld().start()
+        self.addCleanup(self.server.stop)
+        self.columns, self.rows = synthetic_rows(BLOCK_SIZE * 2, 4)
+        self.server.add_commit("main", self.columns, ["id"], self.rows)
+        self.repo = Repository(self.server.uri, "my-client", "secret")
+        self.path = os.path.join(self.dir.name, "main.sqlite")
+
+    def assertMirrors(self, mirror, rows):
+        self.assertEqual(sorted(mirror.rows()), sorted(rows))
+
+    def request_paths(self, since):
+        return [p for _, p in self.server.request_log[since:]]
+
+    def test_sync(self):
+        with TableMirror(self.repo, "main", self.path) as mirror:
+            self.assertIsNone(mirror.commit)
+            self.assertEqual(len(mirror), 0)
+            result = mirror.sync()
+            self.assertTrue(result.full)
+            self.assertEqual(result.added, len(self.rows))
+            self.assertMirrors(mirror, self.rows)
+            self.assertEqual(mirror.get("10"), self.rows[10])
+            self.assertEqual(mirror.columns, self.columns)
+
+            # nothing changed
+            result = mirror.sync()
+            self.assertEqual((result.full, result.added), (False, 0))
+
+            rows = modify_rows(self.rows, 0.1)
+            com_sum = self.server.add_commit("main", self.columns, ["id"], rows)
+            n = len(self.server.request_log)
+            result = mirror.sync()
+            self.assertFalse(result.full)
+            self.assertEqual(result.commit, com_sum)
+            self.assertEqual(result.removed, 5)
+            self.assertEqual(result.added, 5)
+            self.assertGreater(result.modified, 0)
+            self.assertMirrors(mirror, rows)
+            self.assertFalse([p for p in self.request_paths(n) if "/blocks/" in p])
+
+        # the mirror persists between processes
+        with TableMirror(self.repo, "main", self.path) as mirror:
+            self.assertEqual(mirror.commit, com_sum)
+            self.assertMirrors(mirror, rows)
+
+    def test_column_change_reloads(self):
+        with TableMirror(self.repo, "main", self.path) as mirror:
+            mirror.sync()
+            columns = self.columns + ["extra"]
+            rows = [r + ["x"] for r in self.rows[:10]]
+            self.server.add_commit("main", columns, ["id"], rows)
+            result = mirror.sync()
+            self.assertTrue(result.full)
+            self.assertEqual(mirror.columns, columns)
+            self.assertMirrors(mirror, rows)
+
+    def test_failed_reload_keeps_snapshot(self):
+        with TableMirror(self.repo, "main", self.path) as mirror:
+            old_commit = mirror.sync().commit
+            columns = self.columns + ["extra"]
+            self.server.add_commit(
+                "main", columns, ["id"], [r + ["x"] for r in self.rows]
+            )
+            table_sum = self.repo.get_branch("main").table.sum
+            self.server.fail_next(
+                status=400, path_prefix="/tables/%s/blocks/" % table_sum
+            )
+            with self.assertRaises(HTTPError):
+                mirror.sync()
+            self.assertEqual(mirror.commit, old_commit)
+            self.assertEqual(mirror.columns, self.columns)
+            self.assertMirrors(mirror, self.rows)
+
+            result = mirror.sync()
+            self.assertTrue(result.full)
+            self.assertEqual(mirror.columns, columns)
+
+    def test_too_many_columns(self):
+        with TableMirror(self.repo, "main", self.path) as mirror:
+            old_commit = mirror.sync().commit
+            columns, rows = synthetic_rows(2, 2500)
+            self.server.add_commit("main", columns, ["id"], rows)
+            with self.assertRaisesRegex(ValueError, "2500 columns"):
+                mirror.sync()
+            self.assertEqual(mirror.commit, old_commit)
+            self.assertMirrors(mirror, self.rows)
@@ -0,0 +1,265 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022 Wrangle Ltd
+
+import array
+import bisect
+import collections
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import typing
+
+from wrgl import repository
+
+# magic, byte order ("l" or "b"), size of an offset in bytes, number of rows
+_HEADER = struct.Struct("=8scB6xQ")
+_MAGIC = b"WRGLPKI1"
+
+
+def default_index_dir() -> str:
+    """Returns the default directory of index files, which is
+    `$XDG_CACHE_HOME/wrgl/pkindex` or `~/.cache/wrgl/pkindex`
+
+    :rtype: str
+    """
+    cache_dir = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(cache_dir, "wrgl", "pkindex")
+
+
+def key_hash(key: typing.List[str]) -> int:
+    """Returns the 64-bit hash of a primary key
+
+    :param list[str] key: values of the primary key columns
+
+    :rtype: int
+    """
+    return int.from_bytes(
+        hashlib.blake2b("\x00".join(key).encode("utf8"), digest_size=8).digest(),
+        "little",
+    )
+
+
+def write_index(path: str, keys: typing.Iterable[typing.List[str]]) -> int:
+    """Writes an index file from the primary keys of a table, in row order.
+    The file is written atomically.
+
+    :param str path: location of the index file
+    :param keys: primary key of each row
+
+    :return: number of rows
+    :rtype: int
+    """
+    hashes = array.array("Q", (key_hash(key) for key in keys))
+    order = sorted(range(len(hashes)), key=hashes.__getitem__)
+    typecode = "I" if len(hashes) < 1 << 32 else "Q"
+    offsets = array.array(typecode, order)
+    hashes = array.array("Q", (hashes[i] for i in order))
+    dir_name = os.path.dirname(os.path.abspath(path))
+    os.makedirs(dir_name, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=dir_name, prefix=".pkindex-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(
+                _HEADER.pack(
+                    _MAGIC, sys.byteorder[0].encode(), offsets.itemsize, len(hashes)
+                )
+            )
+            hashes.tofile(f)
+            offsets.tofile(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return len(hashes)
+
+
+class PKIndex(object):
+    """A local index from primary key to row offset for one table.
+
+    The index is a file of key hashes sorted next to their row offsets, 12 bytes per row for
+    most tables, which is memory-mapped and binary searched. Tables are immutable, so an index
+    file never goes stale and is reused by later processes. Rows are fetched by offset and
+    their keys compared, so hash collisions cannot return the wrong row.
+
+    Usually created with :func:`wrgl.repository.Repository.pk_index`.
+    """
+
+    table_sum: str
+    path: str
+    pk: typing.List[int]
+
+    def __init__(
+        self,
+        repo: "repository.Repository",
+        table_sum: str,
+        pk: typing.List[int],
+        path: str,
+        cache_size: int = 10000,
+    ) -> None:
+        """Opens an existing index file
+
+        :param Repository repo: the repo handle
+        :param str table_sum: checksum of the indexed table
+        :param list[int] pk: indices of primary key columns
+        :param str path: location of the index file
+        :param int cache_size: number of fetched rows kept in memory
+        """
+        self._repo = repo
+        self.table_sum = table_sum
+        self.pk = pk
+        self.path = path
+        self._cache_size = cache_size
+        self._cache = collections.OrderedDict()
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, byteorder, itemsize, n = _HEADER.unpack_from(self._mmap)
+            if magic != _MAGIC or byteorder != sys.byteorder[0].encode():
+                raise ValueError("%s is not an index file of this platform" % path)
+            start = _HEADER.size
+            view = memoryview(self._mmap)
+            self._hashes = view[start : start + n * 8].cast("Q")
+            start += n * 8
+            self._offsets = view[start : start + n * itemsize].cast(
+                "I" if itemsize == 4 else "Q"
+            )
+            view.release()
+        except BaseException:
+            self._mmap.close()
+            raise
+
+    @classmethod
+    def build(
+        cls,
+        repo: "repository.Repository",
+        table_sum: str,
+        pk: typing.List[int],
+        path: str,
+        cache_size: int = 10000,
+    ) -> "PKIndex":
+        """Streams the primary key columns of a table once and writes its index file
+
+        :param Repository repo: the repo handle
+        :param str table_sum: checksum of the table to index
+        :param list[int] pk: indices of primary key columns
+        :param str path: location of the index file
+        :param int cache_size: number of fetched rows kept in memory
+
+        :rtype: PKIndex
+        """
+        if not pk:
+            raise ValueError("table %s has no primary key" % table_sum)
+        with repo.span("pkindex.build", table=table_sum):
+            write_index(
+                path,
+                repo.get_table_blocks(table_sum, with_column_names=False, columns=pk),
+            )
+        return cls(repo, table_sum, pk, path, cache_size)
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def __enter__(self) -> "PKIndex":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Unmaps the index file"""
+        self._hashes.release()
+        self._offsets.release()
+        self._mmap.close()
+
+    def _key(self, key: typing.Union[str, typing.Sequence[str]]) -> typing.List[str]:
+        if isinstance(key, str):
+            return [key]
+        return list(key)
+
+    def offsets(self, key: typing.Union[str, typing.Sequence[str]]) -> typing.List[int]:
+        """Returns offsets of rows whose key has the same hash as `key`. Usually one
+        offset if the key exists and none otherwise.
+
+        :param key: values of the primary key columns, or a string for single-column keys
+
+        :rtype: list[int]
+        """
+        h = key_hash(self._key(key))
+        i = bisect.bisect_left(self._hashes, h)
+        result = []
+        while i < len(self._hashes) and self._hashes[i] == h:
+            result.append(self._offsets[i])
+            i += 1
+        return result
+
+    def lookup(
+        self,
+        keys: typing.List[typing.Union[str, typing.Sequence[str]]],
+        batch_size: int = 100,
+    ) -> typing.List[typing.Union[typing.List[str], None]]:
+        """Fetches rows by primary key. Rows that are not cached are fetched by offset in
+        batches of `batch_size`.
+
+        :param list keys: primary keys, each either a list of values of the primary key columns
+            or a string for single-column keys
+        :param int batch_size: number of rows fetched by each request
+
+        :return: the row of each key, or None if the key does not exist
+        :rtype: list[list[str] or None]
+        """
+        return [None if m is None else m[1] for m in self._match(keys, batch_size)]
+
+    def locate(
+        self,
+        keys: typing.List[typing.Union[str, typing.Sequence[str]]],
+        batch_size: int = 100,
+    ) -> typing.List[typing.Union[int, None]]:
+        """Returns row offsets by primary key. Like :func:`PKIndex.lookup`, candidate rows
+        are fetched to rule out hash collisions.
+
+        :param list keys: primary keys, each either a list of values of the primary key columns
+            or a string for single-column keys
+        :param int batch_size: number of rows fetched by each request
+
+        :return: the offset of each key, or None if the key does not exist
+        :rtype: list[int or None]
+        """
+        return [None if m is None else m[0] for m in self._match(keys, batch_size)]
+
+    def _match(
+        self,
+        keys: typing.List[typing.Union[str, typing.Sequence[str]]],
+        batch_size: int,
+    ) -> typing.List[typing.Union[typing.Tuple[int, typing.List[str]], None]]:
+        keys = [self._key(k) for k in keys]
+        candidates = [self.offsets(k) for k in keys]
+        rows = dict()
+        missing = []
+        for off in sorted(set(off for offs in candidates for off in offs)):
+            if off in self._cache:
+                self._cache.move_to_end(off)
+                rows[off] = self._cache[off]
+            else:
+                missing.append(off)
+        for i in range(0, len(missing), batch_size):
+            batch = missing[i : i + batch_size]
+            for off, row in zip(batch, self._repo.get_table_rows(self.table_sum, batch)):
+                rows[off] = row
+                self._cache[off] = row
+        while len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+        result = []
+        for key, offs in zip(keys, candidates):
+            found = None
+            for off in offs:
+                row = rows[off]
+                if [row[i] for i in self.pk] == key:
+                    found = (off, row)
+                    break
+            result.append(found)
+        return result
@@ -0,0 +1,62 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022 Wrangle Ltd
+
+import os
+import tempfile
+from unittest import TestCase
+
+from wrgl.fakeserver_test import FakeWrgld, synthetic_rows
+from wrgl.pkindex import PKIndex, write_index
+from wrgl.repository import Repository, BLOCK_SIZE
+
+
+class PKIndexTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.server = FakeWrgld().start()
+        self.addCleanup(self.server.stop)
+        self.columns, self.rows = synthetic_rows(BLOCK_SIZE * 3 + 10, 4)
+        com_sum = self.server.add_commit("main", self.columns, ["id"], self.rows)
+        self.table_sum = self.server.commits[com_sum]["table"]
+        self.repo = Repository(self.server.uri, "my-client", "secret")
+
+    def test_lookup(self):
+        with self.repo.pk_index(self.table_sum, self.dir.name) as idx:
+            self.assertEqual(len(idx), len(self.rows))
+            self.assertEqual(idx.offsets("42"), [42])
+            self.assertEqual(idx.offsets(["nope"]), [])
+            self.assertEqual(
+                idx.lookup(["7", ("700",), "nope"], batch_size=1),
+                [self.rows[7], self.rows[700], None],
+            )
+            n = len(self.server.request_log)
+            # cached rows are not fetched again
+            self.assertEqual(idx.lookup(["7"]), [self.rows[7]])
+            self.assertEqual(idx.locate(["700", "nope", "7"]), [700, None, 7])
+            self.assertEqual(len(self.server.request_log), n)
+
+    def test_reuse_index_file(self):
+        self.repo.pk_index(self.table_sum, self.dir.name).close()
+        n = len(self.server.request_log)
+        with self.repo.pk_index(self.table_sum, self.dir.name) as idx:
+            self.assertEqual(idx.lookup(["3"]), [self.rows[3]])
+        paths = [p for _, p in self.server.request_log[n:]]
+        self.assertFalse([p for p in paths if "/blocks/" in p])
+
+    def test_composite_key_and_collisions(self):
+        path = os.path.join(self.dir.name, "composite.pkidx")
+        keys = [["a", "1"], ["b", "2"], ["a", "1"]]
+        self.assertEqual(write_index(path, iter(keys)), 3)
+        idx = PKIndex(self.repo, self.table_sum, [0, 1], path)
+        try:
+            self.assertEqual(sorted(idx.offsets(["a", "1"])), [0, 2])
+            self.assertEqual(idx.offsets(("b", "2")), [1])
+        finally:
+            idx.close()
+
+    def test_no_primary_key(self):
+        com_sum = self.server.add_commit("nopk", self.columns, [], self.rows[:10])
+        with self.assertRaises(ValueError):
+            self.repo.pk_index(self.server.commits[com_sum]["table"], self.dir.name)
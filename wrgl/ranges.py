@@ -0,0 +1,78 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022 Wrangle Ltd
+
+"""Helpers to read a table in ranges of blocks, shared by the CSV, Arrow, dataframe and
+change-stream paths.
+"""
+
+import collections
+import io
+import typing
+from concurrent.futures import ThreadPoolExecutor
+
+
+def block_ranges(
+    n_blocks: int, start: int = None, end: int = None, blocks_per_range: int = 1
+) -> typing.List[typing.Tuple[int, int]]:
+    """Splits blocks [start, end) into consecutive ranges of at most `blocks_per_range` blocks
+
+    :rtype: list[tuple[int, int]]
+    """
+    start = 0 if start is None else start
+    end = n_blocks if end is None else min(end, n_blocks)
+    return [
+        (s, min(s + blocks_per_range, end))
+        for s in range(start, end, max(1, blocks_per_range))
+    ]
+
+
+class ResponseReader(io.RawIOBase):
+    """A read-only file object over the (decoded) body of a streamed response"""
+
+    def __init__(self, resp, chunk_size: int = 1 << 16) -> None:
+        if hasattr(resp.raw, "enforce_content_length"):
+            # a truncated body must raise instead of silently ending the stream
+            resp.raw.enforce_content_length = True
+        self._chunks = resp.iter_content(chunk_size=chunk_size)
+        self._buf = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._buf:
+            try:
+                self._buf = next(self._chunks)
+            except StopIteration:
+                return 0
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+        return n
+
+
+def iter_ranges(
+    fetch: typing.Callable[[int, int], typing.Any],
+    ranges: typing.List[typing.Tuple[int, int]],
+    workers: int = 1,
+) -> typing.Iterator[typing.Any]:
+    """Calls `fetch(start, end)` for each range on up to `workers` threads, yielding results in order.
+
+    At most `workers` results are held at a time so memory stays bounded.
+    """
+    if workers <= 1 or len(ranges) <= 1:
+        for s, e in ranges:
+            yield fetch(s, e)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        pending = collections.deque()
+        try:
+            for s, e in ranges:
+                pending.append(ex.submit(fetch, s, e))
+                if len(pending) >= workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for fut in pending:
+                fut.cancel()
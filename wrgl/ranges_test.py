@@ -0,0 +1,41 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022 Wrangle Ltd
+
+import io
+from unittest import TestCase
+
+from wrgl.ranges import ResponseReader, block_ranges, iter_ranges
+
+
+class ChunkedResponse(object):
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self.raw = None
+
+    def iter_content(self, chunk_size=1):
+        return iter(self._chunks)
+
+
+class RangesTestCase(TestCase):
+    def test_block_ranges(self):
+        self.assertEqual(block_ranges(0), [])
+        self.assertEqual(block_ranges(5, blocks_per_range=2), [(0, 2), (2, 4), (4, 5)])
+        self.assertEqual(
+            block_ranges(10, start=3, end=8, blocks_per_range=3), [(3, 6), (6, 8)]
+        )
+        self.assertEqual(block_ranges(4, end=100, blocks_per_range=10), [(0, 4)])
+
+    def test_response_reader(self):
+        f = io.BufferedReader(
+            ResponseReader(ChunkedResponse([b"abc", b"", b"defgh", b"i"])), 4
+        )
+        self.assertEqual(f.read(2), b"ab")
+        self.assertEqual(f.read(), b"cdefghi")
+        self.assertEqual(f.read(), b"")
+
+    def test_iter_ranges(self):
+        ranges = block_ranges(20, blocks_per_range=3)
+        for workers in [1, 4]:
+            self.assertEqual(
+                list(iter_ranges(lambda s, e: (s, e), ranges, workers)), ranges
+            )
@@ -0,0 +1,138 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022 Wrangle Ltd
+
+import re
+import threading
+import time
+import typing
+
+
+class TokenBucket(object):
+    """A thread-safe token bucket. Tokens refill continuously at `rate` per second up to
+    `capacity`, and each acquisition takes `weight` tokens.
+
+    An acquisition heavier than the capacity waits for a full bucket then drives the
+    balance negative, so heavy requests are delayed proportionally rather than starved.
+    """
+
+    rate: float
+    capacity: float
+
+    def __init__(self, rate: float, capacity: float = None) -> None:
+        """
+        :param float rate: tokens added per second
+        :param float capacity: maximum number of tokens, i.e. the allowed burst. Defaults to `max(rate, 1)`.
+        """
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._cond = threading.Condition()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self, weight: float = 1.0) -> None:
+        """Blocks until `weight` tokens are taken
+
+        :param float weight: number of tokens to take
+        """
+        need = min(weight, self.capacity)
+        with self._cond:
+            while True:
+                self._refill()
+                if self._tokens >= need:
+                    self._tokens -= weight
+                    return
+                self._cond.wait((need - self._tokens) / self.rate)
+
+
+class RequestScheduler(object):
+    """Limits the request rate and the number of in-flight requests sent by one or many
+    :class:`wrgl.uma.UMAClient`. Thread-safe, so a single scheduler can be shared by all
+    threads and iterators of a repository, or by several repositories that talk to the
+    same server.
+
+    Each request costs a weight in the token bucket. Weights are looked up by matching
+    the request path against the keys of `weights` (regular expressions, matched from the
+    start of the path, first match wins), e.g.::
+
+        RequestScheduler(
+            rate=20,
+            max_in_flight=8,
+            weights={r"/diff/": 10, r"/tables/\\w+/blocks/": 4, r"/refs/": 0.5},
+        )
+    """
+
+    default_weight: float
+
+    def __init__(
+        self,
+        rate: float = None,
+        burst: float = None,
+        max_in_flight: int = None,
+        weights: typing.Dict[str, float] = None,
+        default_weight: float = 1.0,
+    ) -> None:
+        """
+        :param float rate: optional, sustained request weight per second. Unlimited if not set.
+        :param float burst: optional, maximum weight that can be sent at once. Defaults to `max(rate, 1)`.
+        :param int max_in_flight: optional, maximum number of concurrent requests. A streamed response
+            occupies its slot until it is closed. Unlimited if not set.
+        :param dict[str, float] weights: optional, weights of requests by path pattern
+        :param float default_weight: weight of requests that match none of the patterns
+        """
+        self._bucket = TokenBucket(rate, burst) if rate is not None else None
+        self._in_flight = (
+            threading.BoundedSemaphore(max_in_flight)
+            if max_in_flight is not None
+            else None
+        )
+        self._weights = [(re.compile(k), v) for k, v in (weights or dict()).items()]
+        self.default_weight = default_weight
+
+    def weight(self, path: str) -> float:
+        """Returns the weight of a request
+
+        :param str path: request path relative to the resource URI
+
+        :rtype: float
+        """
+        for pattern, weight in self._weights:
+            if pattern.match(path):
+                return weight
+        return self.default_weight
+
+    def acquire(self, path: str) -> typing.Callable[[], None]:
+        """Blocks until a request to `path` may be sent
+
+        :param str path: request path relative to the resource URI
+
+        :return: a function that must be called once the request is complete. Calling it more than once is harmless.
+        :rtype: typing.Callable[[], None]
+        """
+        if self._in_flight is not None:
+            self._in_flight.acquire()
+        try:
+            if self._bucket is not None:
+                self._bucket.acquire(self.weight(path))
+        except BaseException:
+            if self._in_flight is not None:
+                self._in_flight.release()
+            raise
+        released = []
+        lock = threading.Lock()
+
+        def release() -> None:
+            with lock:
+                if released:
+                    return
+                released.append(True)
+            if self._in_flight is not None:
+                self._in_flight.release()
+
+        return release
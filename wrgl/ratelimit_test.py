@@ -0,0 +1,60 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022 Wrangle Ltd
+
+import threading
+import time
+from unittest import TestCase
+
+from wrgl.ratelimit import RequestScheduler, TokenBucket
+
+
+class TokenBucketTestCase(TestCase):
+    def test_rate(self):
+        bucket = TokenBucket(rate=100, capacity=1)
+        start = time.monotonic()
+        for _ in range(11):
+            bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+    def test_heavy_weight(self):
+        bucket = TokenBucket(rate=100, capacity=2)
+        start = time.monotonic()
+        bucket.acquire(5)
+        self.assertLess(time.monotonic() - start, 0.02)
+        bucket.acquire(1)
+        self.assertGreaterEqual(time.monotonic() - start, 0.03)
+
+
+class RequestSchedulerTestCase(TestCase):
+    def test_weight(self):
+        sched = RequestScheduler(
+            weights={r"/diff/": 10, r"/tables/\w+/blocks/": 4}, default_weight=2
+        )
+        self.assertEqual(sched.weight("/diff/abc/def/"), 10)
+        self.assertEqual(sched.weight("/tables/abc/blocks/"), 4)
+        self.assertEqual(sched.weight("/tables/abc/rows/"), 2)
+
+    def test_max_in_flight(self):
+        sched = RequestScheduler(max_in_flight=2)
+        lock = threading.Lock()
+        in_flight = [0]
+        peak = [0]
+
+        def work():
+            release = sched.acquire("/refs/")
+            with lock:
+                in_flight[0] += 1
+                peak[0] = max(peak[0], in_flight[0])
+            time.sleep(0.01)
+            with lock:
+                in_flight[0] -= 1
+            release()
+            # releasing twice must not free an extra slot
+            release()
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(peak[0], 2)
@@ -3,32 +3,216 @@
 
 from typing import Iterator, List
 import tempfile
+import threading
 import gzip
 import shutil
 import typing
+import codecs
+import datetime
 import csv
 import io
+import itertools
+import math
+import os
+import zlib
 from requests_toolbelt.multipart.encoder import MultipartEncoder
 
-from wrgl import diffreader
+from wrgl import (
+    arrow,
+    blame,
+    changes,
+    commitgraph,
+    dataframe,
+    diffreader,
+    export,
+    pkindex,
+)
 from wrgl.commit import Commit, CommitResult, Table, CommitTree
 from wrgl.diff import DiffResult
+from wrgl.instrument import Instrumentation
+from wrgl.ranges import block_ranges, iter_ranges
+from wrgl.ratelimit import RequestScheduler
+from wrgl.retry import RetryPolicy, TRANSIENT_ERRORS
 from wrgl.serialize import json_loads
-from wrgl.uma import UMAClient
+from wrgl.tokenstore import TokenStore
+from wrgl.uma import UMAClient, UMAContext
+
+# number of rows in each block of a Wrgl table
+BLOCK_SIZE = 255
+
+
+def _enforce_content_length(r) -> None:
+    if hasattr(r.raw, "enforce_content_length"):
+        # a truncated body must raise instead of silently ending the stream
+        r.raw.enforce_content_length = True
+
+
+def _iter_lines(r, chunk_size: int = 1 << 16) -> Iterator[typing.List[str]]:
+    """Decodes a streamed response into batches of lines, one batch per chunk"""
+    _enforce_content_length(r)
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pending = ""
+    for chunk in r.iter_content(chunk_size=chunk_size):
+        lines = (pending + decoder.decode(chunk)).split("\n")
+        pending = lines.pop()
+        yield [line + "\n" for line in lines]
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield [pending]
+
+
+class _Projection(object):
+    """Selects columns of rows, by name or by index"""
+
+    def __init__(self, columns: typing.List[typing.Union[str, int]]) -> None:
+        self.columns = list(columns)
+        self.indices = None
+        if all(isinstance(c, int) for c in self.columns):
+            self.indices = self.columns
+
+    def bind(self, names: typing.List[str]) -> None:
+        """Looks up indices of the selected columns among the columns of a table"""
+        if self.indices is not None:
+            return
+        name_map = {name: i for i, name in enumerate(names)}
+        missing = [c for c in self.columns if c not in name_map]
+        if missing:
+            raise ValueError("unknown columns %s" % missing)
+        self.indices = [name_map[c] for c in self.columns]
+
+    def __call__(self, row: typing.List[str]) -> typing.List[str]:
+        return [row[i] for i in self.indices]
+
+
+def _iter_projected(
+    lines: Iterator[str], indices: typing.List[int]
+) -> Iterator[List[str]]:
+    """Parses CSV lines keeping only cells at `indices`. Records without quotes are split
+    no further than the last selected cell, so the cells after it are never created.
+    """
+    maxsplit = max(indices) + 1 if indices else 0
+    for line in lines:
+        if '"' in line:
+            # quoted cells may contain commas and newlines, parse this record with csv
+            row = next(
+                csv.reader(itertools.chain([line], lines), dialect="unix"), None
+            )
+            if row is None:
+                return
+        else:
+            line = line.rstrip("\r\n")
+            if not line:
+                continue
+            row = line.split(",", maxsplit)
+        yield [row[i] for i in indices]
+
+
+def _iter_csv(
+    r, projection: _Projection = None, header: bool = False
+) -> Iterator[List[str]]:
+    """Parses a streamed CSV response incrementally, closing it once done
+
+    :param _Projection projection: optional, the columns to keep. Bound to the header if the
+        response starts with one.
+    :param bool header: the response starts with a header
+    """
+    with r:
+        lines = itertools.chain.from_iterable(_iter_lines(r))
+        if projection is None:
+            for row in csv.reader(lines, dialect="unix"):
+                yield row
+            return
+        if header:
+            names = next(csv.reader(lines, dialect="unix"), None)
+            if names is None:
+                return
+            projection.bind(names)
+            yield projection(names)
+        for row in _iter_projected(lines, projection.indices):
+            yield row
+
+
+def _copy_body(r, dest: typing.BinaryIO, keep_gzip: bool, chunk_size: int) -> int:
+    """Writes the body of a streamed response to `dest` chunk by chunk, returning the number of bytes written"""
+    _enforce_content_length(r)
+    compressor = None
+    if keep_gzip and r.headers.get("Content-Encoding", "") == "gzip":
+        chunks = r.raw.stream(chunk_size, decode_content=False)
+    else:
+        chunks = r.iter_content(chunk_size=chunk_size)
+        if keep_gzip:
+            # the server did not compress the body, compress it here
+            compressor = zlib.compressobj(wbits=31)
+    n = 0
+    for chunk in chunks:
+        if compressor is not None:
+            chunk = compressor.compress(chunk)
+        n += len(chunk)
+        dest.write(chunk)
+    if compressor is not None:
+        chunk = compressor.flush()
+        n += len(chunk)
+        dest.write(chunk)
+    return n
 
 
 class Repository(object):
     """Represents the HTTP API that wraps a hosted Wrgl repository"""
 
     def __init__(
-        self, repo_uri: str, client_id: str, client_secret: str = None
+        self,
+        repo_uri: str,
+        client_id: str,
+        client_secret: str = None,
+        token_store: TokenStore = None,
+        context: UMAContext = None,
+        retry_policy: RetryPolicy = None,
+        scheduler: RequestScheduler = None,
+        instrumentation: Instrumentation = None,
+        accept_encoding: str = None,
     ) -> None:
         """
         :param str repo_uri: the URI of the repository
         :param str client_id: Keycloak client id
         :param str client_secret: Keycloak client secret
+        :param TokenStore token_store: optional, persists tokens between processes so that
+            short-lived processes can skip the authentication handshake. See :class:`wrgl.tokenstore.FileTokenStore`.
+        :param UMAContext context: optional, credentials and connection pool shared with other repositories
+            behind the same authorization server. See :class:`wrgl.uma.UMAContext`.
+        :param RetryPolicy retry_policy: optional, how transient failures are retried. See :class:`wrgl.retry.RetryPolicy`.
+        :param RequestScheduler scheduler: optional, enforces a request rate and a maximum number of in-flight
+            requests across all threads and iterators of this repository. See :class:`wrgl.ratelimit.RequestScheduler`.
+        :param Instrumentation instrumentation: optional, receives per-request measurements and spans of higher-level
+            operations. See :mod:`wrgl.instrument`.
+        :param str accept_encoding: optional, overrides the content codings offered when reading, e.g. "identity"
+            to disable compression. Requests offers gzip and deflate by default.
+        """
+        self._client = UMAClient(
+            repo_uri,
+            client_id,
+            client_secret,
+            token_store=token_store,
+            context=context,
+            retry_policy=retry_policy,
+            scheduler=scheduler,
+            instrumentation=instrumentation,
+            accept_encoding=accept_encoding,
+        )
+        # commits never change, so fetched history is kept for ancestry queries
+        self._commit_graph = commitgraph.CommitGraph()
+        self._commit_graph_lock = threading.Lock()
+        self._time_indices: typing.Dict[str, commitgraph.TimeIndex] = dict()
+
+    def span(self, name: str, **attributes):
+        """Wraps an operation in a span of this repository's instrumentation, e.g.::
+
+            with repo.span("export", table=table_sum):
+                ...
+
+        :param str name: name of the operation
+        :param dict attributes: attributes of the operation
         """
-        self._client = UMAClient(repo_uri, client_id, client_secret)
+        return self._client.span(name, **attributes)
 
     def get_refs(self) -> dict:
         """Get references as a mapping of reference name and commit checksum
@@ -39,6 +223,30 @@ class Repository(object):
         obj = r.json()
         return obj["refs"]
 
+    def poll_refs(
+        self, etag: str = None
+    ) -> typing.Tuple[typing.Union[dict, None], typing.Union[str, None]]:
+        """Gets references unless they are unchanged since an earlier call, e.g.::
+
+            refs, etag = repo.poll_refs()
+            ...
+            new_refs, etag = repo.poll_refs(etag)
+            if new_refs is not None:
+                refs = new_refs
+
+        :param str etag: optional, the entity tag returned by an earlier call. The server answers
+            with an empty response if references have not changed since.
+
+        :return: references, or None if they are unchanged, and the entity tag to pass to the next call,
+            which is None if the server does not support conditional requests
+        :rtype: tuple[dict or None, str or None]
+        """
+        headers = None if etag is None else {"If-None-Match": etag}
+        r = self._client.get("/refs/", headers=headers)
+        if r.status_code == 304:
+            return None, etag
+        return r.json()["refs"], r.headers.get("ETag", None)
+
     def get_branch(self, branch: str) -> Commit:
         """Get the head commit of a branch
 
@@ -65,6 +273,7 @@ class Repository(object):
         message: str,
         file: typing.BinaryIO,
         primary_key: typing.List[str],
+        retry: bool = False,
     ) -> CommitResult:
         """Creates a new commit
 
@@ -72,12 +281,15 @@ class Repository(object):
         :param str message: commit message
         :param typing.BinaryIO file: the CSV file to commit
         :param list[str] primary_key: list of column names that make up the primary key
+        :param bool retry: retry the upload on transient failures. Off by default because commits are not idempotent:
+            if the server committed but the response was lost, retrying creates a second commit.
 
         :rtype: CommitResult
         """
         with tempfile.TemporaryFile() as fp:
-            with gzip.open(fp, "w") as gzf:
-                shutil.copyfileobj(file, gzf)
+            with self.span("commit.compress", branch=branch):
+                with gzip.open(fp, "w") as gzf:
+                    shutil.copyfileobj(file, gzf)
 
             def create_request_args():
                 fp.seek(0)
@@ -94,10 +306,12 @@ class Repository(object):
                     "headers": {"Content-Type": m.content_type},
                 }
 
-            r = self._client.post(
-                "/commits/",
-                create_request_args=create_request_args,
-            )
+            with self.span("commit.upload", branch=branch, bytes=fp.tell()):
+                r = self._client.post(
+                    "/commits/",
+                    create_request_args=create_request_args,
+                    retry=retry,
+                )
         return json_loads(r.content, CommitResult)
 
     def get_commit_tree(self, head: str, max_depth: int) -> CommitTree:
@@ -111,6 +325,151 @@ class Repository(object):
         r = self._client.get("/commits/", params={"head": head, "maxDepth": max_depth})
         return json_loads(r.content, CommitTree)
 
+    def _get_commit_tree_json(self, head: str, max_depth: int) -> dict:
+        r = self._client.get("/commits/", params={"head": head, "maxDepth": max_depth})
+        return json_loads(r.content)
+
+    def get_commit_graph(
+        self, head: str, max_depth: int = None, page_depth: int = 100
+    ) -> "commitgraph.CommitGraph":
+        """Gets the history of a commit as a flat DAG where each commit is stored once.
+
+        Unlike :func:`Repository.get_commit_tree`, the history is fetched `page_depth` generations per
+        request and never deserialized recursively, so it suits long histories. See :class:`wrgl.commitgraph.CommitGraph`.
+
+        :param str head: name of the newest commit, could either be reference name or commit checksum.
+        :param int max_depth: optional, number of generations to fetch. Fetches the whole history if not set.
+        :param int page_depth: number of generations fetched by each request
+
+        :rtype: CommitGraph
+        """
+        with self.span("get_commit_graph", head=head):
+            return commitgraph.CommitGraph.fetch(self, head, max_depth, page_depth)
+
+    def iter_history(
+        self,
+        head: str,
+        since: datetime.datetime = None,
+        stop: typing.Callable[["commitgraph.CommitRecord"], bool] = None,
+        max_count: int = None,
+        page_depth: int = 50,
+        workers: int = 4,
+    ) -> Iterator["commitgraph.CommitRecord"]:
+        """Iterates over the history of a commit, fetching it in pages of bounded depth.
+
+        Merge parents are fetched concurrently and each commit is yielded once. The walk
+        stops descending at commits older than `since` or for which `stop` returns True.
+        See :func:`wrgl.commitgraph.iter_history`.
+
+        :param str head: name of the newest commit, could either be reference name or commit checksum.
+        :param datetime.datetime since: optional, skip commits older than this and their ancestors.
+            Naive datetimes are taken as UTC.
+        :param stop: optional, a function called with each :class:`wrgl.commitgraph.CommitRecord`.
+            Returns True to skip the commit and its ancestors.
+        :param int max_count: optional, maximum number of commits to yield
+        :param int page_depth: number of generations fetched by each request
+        :param int workers: maximum number of concurrent requests
+
+        :rtype: typing.Iterator[CommitRecord]
+        """
+        return commitgraph.iter_history(
+            self, head, since, stop, max_count, page_depth, workers
+        )
+
+    def _resolve_commit(self, commit: str) -> str:
+        if commit.startswith("heads/"):
+            return self.get_branch(commit[len("heads/") :]).sum
+        return commit
+
+    def is_ancestor(self, ancestor: str, descendant: str) -> bool:
+        """Tells whether a commit is reachable from another, a commit being its own ancestor.
+
+        History fetched by earlier queries is reused and only missing parts are requested, so
+        repeated queries on checksums take no requests. References are resolved on every call.
+        See :func:`wrgl.commitgraph.CommitGraph.is_ancestor`.
+
+        :param str ancestor: checksum or reference of the possible ancestor
+        :param str descendant: checksum or reference of the possible descendant
+
+        :rtype: bool
+        """
+        ancestor = self._resolve_commit(ancestor)
+        descendant = self._resolve_commit(descendant)
+        with self._commit_graph_lock:
+            return self._commit_graph.is_ancestor(ancestor, descendant, self)
+
+    def merge_base(self, commit1: str, commit2: str) -> typing.Union[str, None]:
+        """Finds the best common ancestor of two commits.
+
+        History fetched by earlier queries is reused and only missing parts are requested.
+        See :func:`wrgl.commitgraph.CommitGraph.merge_base`.
+
+        :param str commit1: checksum or reference of the first commit
+        :param str commit2: checksum or reference of the second commit
+
+        :return: checksum of the merge base, or None if the histories are unrelated
+        :rtype: str or None
+        """
+        commit1 = self._resolve_commit(commit1)
+        commit2 = self._resolve_commit(commit2)
+        with self._commit_graph_lock:
+            return self._commit_graph.merge_base(commit1, commit2, self)
+
+    def commit_at(
+        self, branch: str, time: datetime.datetime
+    ) -> typing.Union["commitgraph.CommitRecord", None]:
+        """Finds the commit a branch pointed to at a point in time, following first parents.
+
+        Each branch keeps a time-sorted index of its history, so only the branch head is
+        requested by later calls, plus any history the index has not reached yet.
+        See :class:`wrgl.commitgraph.TimeIndex`.
+
+        :param str branch: the name of the branch
+        :param datetime.datetime time: the point in time. Naive datetimes are taken as UTC.
+
+        :return: the newest commit not later than `time`, or None if the branch starts after `time`
+        :rtype: CommitRecord or None
+        """
+        head = self.get_branch(branch).sum
+        with self._commit_graph_lock:
+            index = self._time_indices.get(branch)
+            if index is None:
+                index = self._time_indices[branch] = commitgraph.TimeIndex(
+                    self._commit_graph
+                )
+            index.update(head, self)
+            return index.at(time, self)
+
+    def get_blocks_at(
+        self,
+        branch: str,
+        time: datetime.datetime,
+        start: int = None,
+        end: int = None,
+        with_column_names: bool = True,
+        columns: typing.List[typing.Union[str, int]] = None,
+    ) -> Iterator[List[str]]:
+        """Fetchs blocks of the table a branch pointed to at a point in time.
+
+        The commit is resolved with :func:`Repository.commit_at` before the first block is read,
+        and blocks are read by table checksum, so the rows stay consistent if the branch moves.
+
+        :param str branch: the name of the branch
+        :param datetime.datetime time: the point in time. Naive datetimes are taken as UTC.
+        :param int start: index of the first block to fetch. Defaults to 0.
+        :param int end: index of the last block to fetch. If not set, fetch til the end.
+        :param bool with_column_names: prepend column names to the resulting CSV
+        :param list columns: optional, only return these columns, in this order. Either column names or indices.
+
+        :rtype: typing.Iterator[list[str]]
+        """
+        com = self.commit_at(branch, time)
+        if com is None:
+            raise ValueError("branch %s has no commit at %s" % (branch, time.isoformat()))
+        return self.get_table_blocks(
+            com.table_sum, start, end, with_column_names, columns
+        )
+
     def get_commit(self, commit_sum: str) -> Commit:
         """Get commit with the given checksum
 
@@ -137,6 +496,7 @@ class Repository(object):
         start: int = None,
         end: int = None,
         with_column_names: bool = True,
+        columns: typing.List[typing.Union[str, int]] = None,
     ) -> Iterator[List[str]]:
         """Fetchs blocks as concatenated rows. Each row as a list of strings.
 
@@ -146,20 +506,14 @@ class Repository(object):
         :param int start: index of the first block to fetch. Defaults to 0.
         :param int end: index of the last block to fetch. If not set, fetch til the end.
         :param bool with_column_names: prepend column names to the resulting CSV, which in effect producing a CSV with header.
+        :param list columns: optional, only return these columns, in this order. Either column names or
+            indices. Unselected cells are skipped by the parser rather than extracted and dropped.
 
         :rtype: typing.Iterator[list[str]]
         """
-        r = self._client.get(
-            "/blocks/",
-            params={
-                "head": commit,
-                "start": start,
-                "end": end,
-                "columns": "true" if with_column_names else "false",
-            },
+        return self._iter_blocks(
+            "/blocks/", {"head": commit}, start, end, with_column_names, columns
         )
-        for row in csv.reader(io.StringIO(r.text), dialect="unix"):
-            yield row
 
     def get_table_blocks(
         self,
@@ -167,6 +521,7 @@ class Repository(object):
         start: int = None,
         end: int = None,
         with_column_names: bool = True,
+        columns: typing.List[typing.Union[str, int]] = None,
     ) -> Iterator[List[str]]:
         """Fetchs blocks with table checksum.
 
@@ -176,53 +531,617 @@ class Repository(object):
         :param int start: index of the first block to fetch. Defaults to 0.
         :param int end: index of the last block to fetch. If not set, fetch til the end.
         :param bool with_column_names: prepend column names to the resulting CSV, which in effect producing a CSV with header.
+        :param list columns: optional, only return these columns, in this order. Either column names or indices.
 
         :rtype: typing.Iterator[list[str]]
         """
-        r = self._client.get(
+        return self._iter_blocks(
             "/tables/%s/blocks/" % table_sum,
-            params={
-                "start": start,
-                "end": end,
-                "columns": "true" if with_column_names else "false",
-            },
+            {},
+            start,
+            end,
+            with_column_names,
+            columns,
         )
-        for row in csv.reader(io.StringIO(r.text), dialect="unix"):
-            yield row
 
-    def get_rows(self, commit: str, offsets: List[int]) -> Iterator[List[str]]:
+    def _iter_blocks(
+        self,
+        path: str,
+        params: dict,
+        start: int = None,
+        end: int = None,
+        with_column_names: bool = True,
+        columns: typing.List[typing.Union[str, int]] = None,
+    ) -> Iterator[List[str]]:
+        # if the stream breaks, resume from the block of the first undelivered row
+        policy = self._client.retry_policy
+        projection = None if columns is None else _Projection(columns)
+        delivered = 0
+        header_pending = with_column_names
+        attempt = 0
+        while True:
+            block_start = (start or 0) + delivered // BLOCK_SIZE
+            skip = delivered % BLOCK_SIZE
+            # column names are needed to look up projected columns, even if not returned
+            with_header = header_pending or (
+                projection is not None and projection.indices is None
+            )
+            r = self._client.get(
+                path,
+                params=dict(
+                    params,
+                    start=block_start,
+                    end=end,
+                    columns="true" if with_header else "false",
+                ),
+                stream=True,
+            )
+            try:
+                for row in _iter_csv(r, projection, with_header):
+                    if with_header:
+                        with_header = False
+                        if not header_pending:
+                            continue
+                        header_pending = False
+                    elif skip > 0:
+                        skip -= 1
+                        continue
+                    else:
+                        delivered += 1
+                    yield row
+                return
+            except TRANSIENT_ERRORS:
+                if not policy.wait(attempt):
+                    raise
+                attempt += 1
+
+    def download_blocks_raw(
+        self,
+        commit: str,
+        dest: typing.BinaryIO,
+        start: int = None,
+        end: int = None,
+        with_column_names: bool = True,
+        keep_gzip: bool = False,
+        chunk_size: int = 1 << 20,
+    ) -> int:
+        """Writes blocks as CSV bytes to a file or buffer without parsing them.
+
+        This is much faster than :func:`Repository.get_blocks` when rows are only archived or
+        handed to another program.
+
+        :param str commit: either commit checksum or reference e.g. "heads/main"
+        :param typing.BinaryIO dest: writable file or buffer. If the download breaks and `dest` is seekable,
+            it is truncated back to its initial position and the download retried.
+        :param int start: index of the first block to fetch. Defaults to 0.
+        :param int end: index of the last block to fetch. If not set, fetch til the end.
+        :param bool with_column_names: prepend column names to the resulting CSV
+        :param bool keep_gzip: write gzip-compressed CSV. The compressed body is written as received
+            when the server sends it with gzip encoding.
+        :param int chunk_size: number of bytes read and written at a time
+
+        :return: number of bytes written
+        :rtype: int
+        """
+        return self._download_raw(
+            "/blocks/",
+            {"head": commit},
+            dest,
+            start,
+            end,
+            with_column_names,
+            keep_gzip,
+            chunk_size,
+        )
+
+    def download_table_blocks_raw(
+        self,
+        table_sum: str,
+        dest: typing.BinaryIO,
+        start: int = None,
+        end: int = None,
+        with_column_names: bool = True,
+        keep_gzip: bool = False,
+        chunk_size: int = 1 << 20,
+    ) -> int:
+        """Writes blocks of a table as CSV bytes to a file or buffer without parsing them.
+
+        :param str table_sum: table checksum
+
+        See :func:`Repository.download_blocks_raw` for the other parameters.
+
+        :return: number of bytes written
+        :rtype: int
+        """
+        return self._download_raw(
+            "/tables/%s/blocks/" % table_sum,
+            {},
+            dest,
+            start,
+            end,
+            with_column_names,
+            keep_gzip,
+            chunk_size,
+        )
+
+    def _download_raw(
+        self,
+        path: str,
+        params: dict,
+        dest: typing.BinaryIO,
+        start: int = None,
+        end: int = None,
+        with_column_names: bool = True,
+        keep_gzip: bool = False,
+        chunk_size: int = 1 << 20,
+    ) -> int:
+        policy = self._client.retry_policy
+        origin = dest.tell() if getattr(dest, "seekable", lambda: False)() else None
+        attempt = 0
+        while True:
+            r = self._client.get(
+                path,
+                params=dict(
+                    params,
+                    start=start,
+                    end=end,
+                    columns="true" if with_column_names else "false",
+                ),
+                stream=True,
+            )
+            try:
+                with r:
+                    return _copy_body(r, dest, keep_gzip, chunk_size)
+            except TRANSIENT_ERRORS:
+                if origin is None or not policy.wait(attempt):
+                    raise
+                dest.seek(origin)
+                dest.truncate()
+                attempt += 1
+
+    def get_rows(
+        self,
+        commit: str,
+        offsets: List[int],
+        columns: typing.List[typing.Union[str, int]] = None,
+    ) -> Iterator[List[str]]:
         """Get rows at certain offsets. Each row will be returned as a list of strings.
 
         This is usually used in tandem with row offsets from :class:`DiffResult` to fetch changed rows.
 
         :param str commit: either commit checksum or reference e.g. "heads/main"
         :param list[int] offsets: the offsets of the rows to fetch
+        :param list columns: optional, only return these columns, in this order. Either column names or
+            indices. Names are looked up with an extra request, indices are not.
 
         :rtype: typing.Iterator[list[str]]
         """
-        r = self._client.get(
-            "/rows/",
-            params={"head": commit, "offsets": ",".join([str(v) for v in offsets])},
-        )
-        for row in csv.reader(io.StringIO(r.text), dialect="unix"):
-            yield row
+        projection = None
+        if columns is not None:
+            projection = _Projection(columns)
+            if projection.indices is None:
+                projection.bind(self._resolve_table(commit).columns)
+        return self._iter_rows("/rows/", {"head": commit}, offsets, projection)
 
-    def get_table_rows(self, table_sum: str, offsets: List[int]) -> Iterator[List[str]]:
+    def get_table_rows(
+        self,
+        table_sum: str,
+        offsets: List[int],
+        columns: typing.List[typing.Union[str, int]] = None,
+    ) -> Iterator[List[str]]:
         """Get rows at certain offsets with table checksum.
 
         This is usually used in tandem with row offsets from :class:`DiffResult` to fetch changed rows.
 
         :param str table_sum: table checksum
         :param list[int] offsets: the offsets of the rows to fetch
+        :param list columns: optional, only return these columns, in this order. Either column names or
+            indices. Names are looked up with an extra request, indices are not.
 
         :rtype: typing.Iterator[list[str]]
         """
-        r = self._client.get(
-            "/tables/%s/rows/" % table_sum,
-            params={"offsets": ",".join([str(v) for v in offsets])},
+        projection = None
+        if columns is not None:
+            projection = _Projection(columns)
+            if projection.indices is None:
+                projection.bind(self.get_table(table_sum).columns)
+        return self._iter_rows(
+            "/tables/%s/rows/" % table_sum, {}, offsets, projection
+        )
+
+    def _iter_rows(
+        self,
+        path: str,
+        params: dict,
+        offsets: List[int],
+        projection: _Projection = None,
+    ) -> Iterator[List[str]]:
+        # if the stream breaks, request only the offsets that were not delivered yet
+        policy = self._client.retry_policy
+        delivered = 0
+        attempt = 0
+        while True:
+            r = self._client.get(
+                path,
+                params=dict(
+                    params, offsets=",".join([str(v) for v in offsets[delivered:]])
+                ),
+                stream=True,
+            )
+            try:
+                for row in _iter_csv(r, projection):
+                    delivered += 1
+                    yield row
+                return
+            except TRANSIENT_ERRORS:
+                if not policy.wait(attempt):
+                    raise
+                attempt += 1
+
+    def _resolve_table(self, commit: str) -> Table:
+        # a reference is resolved once, so that a branch moving mid-export cannot mix two tables
+        if commit.startswith("heads/"):
+            com = self.get_branch(commit[len("heads/") :])
+        else:
+            com = self.get_commit(commit)
+        tbl = self.get_table(com.table.sum)
+        tbl.sum = com.table.sum
+        return tbl
+
+    def _arrow_tables(
+        self,
+        commit: str,
+        start: int = None,
+        end: int = None,
+        schema=None,
+        infer_types: bool = True,
+        blocks_per_request: int = arrow.DEFAULT_BLOCKS_PER_REQUEST,
+        workers: int = 4,
+    ):
+        # returns the output schema and an iterator of one pyarrow.Table per block range
+        pa = arrow.import_pyarrow()
+        table = self._resolve_table(commit)
+        path = "/tables/%s/blocks/" % table.sum
+        include_columns = None
+        if schema is not None:
+            include_columns = schema.names
+            types = {f.name: f.type for f in schema}
+        elif not infer_types:
+            types = {c: pa.string() for c in table.columns}
+        else:
+            types = None
+        ranges = block_ranges(
+            math.ceil(table.rows_count / BLOCK_SIZE), start, end, blocks_per_request
+        )
+        policy = self._client.retry_policy
+
+        def fetch(s: int, e: int):
+            # a range is parsed whole, so a broken stream simply refetches it
+            attempt = 0
+            while True:
+                r = self._client.get(
+                    path,
+                    params={"start": s, "end": e, "columns": "false"},
+                    stream=True,
+                )
+                try:
+                    return arrow.read_csv_range(
+                        r, table.columns, types, include_columns
+                    )
+                except TRANSIENT_ERRORS:
+                    if not policy.wait(attempt):
+                        raise
+                    attempt += 1
+
+        first = None
+        if types is None:
+            # infer types from the first range, then parse the rest with the same types
+            if ranges:
+                first = fetch(*ranges[0])
+                ranges = ranges[1:]
+                types = arrow.pinned_types(first.schema)
+            else:
+                types = {c: pa.string() for c in table.columns}
+        if schema is None:
+            schema = pa.schema([(c, types[c]) for c in table.columns])
+
+        def iter_tables():
+            if first is not None:
+                yield first.cast(schema)
+            for t in iter_ranges(fetch, ranges, workers):
+                yield t if t.schema == schema else t.cast(schema)
+
+        return schema, iter_tables()
+
+    def to_arrow(
+        self,
+        commit: str,
+        start: int = None,
+        end: int = None,
+        schema=None,
+        infer_types: bool = True,
+        blocks_per_request: int = arrow.DEFAULT_BLOCKS_PER_REQUEST,
+        workers: int = 4,
+    ):
+        """Reads a table into a `pyarrow.Table`, parsing the CSV stream with Arrow instead of in Python.
+
+        Requires ``pyarrow``, installed with ``pip install wrgl[arrow]``.
+
+        :param str commit: either commit checksum or reference e.g. "heads/main"
+        :param int start: index of the first block to fetch. Defaults to 0.
+        :param int end: index of the last block to fetch. If not set, fetch til the end.
+        :param pyarrow.Schema schema: optional, the columns to read and their types. Columns not
+            in the schema are skipped.
+        :param bool infer_types: when no schema is given, infer column types from the first
+            `blocks_per_request` blocks. Otherwise every column is a string.
+        :param int blocks_per_request: number of blocks fetched by each request
+        :param int workers: number of block ranges fetched concurrently
+
+        :rtype: pyarrow.Table
+        """
+        pa = arrow.import_pyarrow()
+        with self.span("to_arrow", commit=commit):
+            schema, tables = self._arrow_tables(
+                commit, start, end, schema, infer_types, blocks_per_request, workers
+            )
+            tables = list(tables)
+            if not tables:
+                return schema.empty_table()
+            return pa.concat_tables(tables)
+
+    def export_parquet(
+        self,
+        commit: str,
+        path: str,
+        start: int = None,
+        end: int = None,
+        schema=None,
+        infer_types: bool = True,
+        compression: str = "snappy",
+        blocks_per_request: int = arrow.DEFAULT_BLOCKS_PER_REQUEST,
+        workers: int = 4,
+    ) -> int:
+        """Writes a table to a Parquet file, one row group per block range, so that memory stays
+        bounded by `workers` x `blocks_per_request` blocks whatever the size of the table.
+
+        Requires ``pyarrow``, installed with ``pip install wrgl[arrow]``.
+
+        :param str commit: either commit checksum or reference e.g. "heads/main"
+        :param str path: path of the Parquet file to write
+        :param str compression: Parquet compression codec
+        :param int blocks_per_request: number of blocks fetched by each request and written as a row group
+
+        See :func:`Repository.to_arrow` for the other parameters.
+
+        :return: number of rows written
+        :rtype: int
+        """
+        pa = arrow.import_pyarrow()
+        with self.span("export_parquet", commit=commit):
+            schema, tables = self._arrow_tables(
+                commit, start, end, schema, infer_types, blocks_per_request, workers
+            )
+            n = 0
+            # a failed export must not leave a truncated file at `path`
+            part_path = path + ".part"
+            try:
+                with pa.parquet.ParquetWriter(
+                    part_path, schema, compression=compression
+                ) as writer:
+                    for t in tables:
+                        writer.write_table(t)
+                        n += t.num_rows
+            except BaseException:
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+                raise
+            os.replace(part_path, path)
+            return n
+
+    def export_csv(
+        self,
+        commit: str,
+        path: str,
+        with_column_names: bool = True,
+        gzip: bool = False,
+        blocks_per_range: int = 64,
+        state_path: str = None,
+    ) -> "export.ExportState":
+        """Exports a table to a CSV file with checkpoints, so that an interrupted export resumes
+        where it stopped when called again with the same arguments. The file only appears at `path`
+        once complete. See :mod:`wrgl.export`.
+
+        :param str commit: either commit checksum or reference e.g. "heads/main"
+        :param str path: path of the output file
+        :param bool with_column_names: start the output with column names
+        :param bool gzip: write gzip-compressed CSV
+        :param int blocks_per_range: number of blocks written between checkpoints
+        :param str state_path: optional, location of the state file. Defaults to `<path>.export.json`.
+
+        :rtype: ExportState
+        """
+        return export.export_csv(
+            self,
+            commit,
+            path,
+            with_column_names=with_column_names,
+            gzip=gzip,
+            blocks_per_range=blocks_per_range,
+            state_path=state_path,
+        )
+
+    def read_dataframe(
+        self,
+        commit: str,
+        columns: typing.List[str] = None,
+        dtypes=None,
+        chunksize: int = None,
+        pk_index: bool = False,
+    ):
+        """Reads a table into a pandas DataFrame, parsing the CSV stream with pandas' C parser
+        instead of building lists of strings first.
+
+        Unless `pk_index` is set, the index holds row offsets in the table.
+
+        Requires ``pandas``, installed with ``pip install wrgl[pandas]``.
+
+        :param str commit: either commit checksum or reference e.g. "heads/main"
+        :param list[str] columns: optional, the columns to read, in this order
+        :param dtypes: optional, a dtype or a mapping of column name to dtype. Inferred by pandas if not set.
+        :param int chunksize: if set, return an iterator of DataFrames with at most this many rows,
+            so that memory stays bounded whatever the size of the table
+        :param bool pk_index: use the primary key columns as the index
+
+        :rtype: pandas.DataFrame or typing.Iterator[pandas.DataFrame]
+        """
+        table = self._resolve_table(commit)
+        frames = self._iter_dataframes(table, columns, dtypes, chunksize, pk_index)
+        if chunksize is not None:
+            return frames
+        with self.span("read_dataframe", commit=commit):
+            return next(frames)
+
+    def _iter_dataframes(
+        self,
+        table: Table,
+        columns: typing.List[str] = None,
+        dtypes=None,
+        chunksize: int = None,
+        pk_index: bool = False,
+    ):
+        pd = dataframe.import_pandas()
+        usecols = None if columns is None else list(columns)
+        index_col = None
+        if pk_index and table.pk:
+            index_col = table.primary_key
+            if usecols is not None:
+                usecols += [c for c in index_col if c not in usecols]
+        if columns is not None:
+            # pandas keeps the order of the CSV
+            columns = [c for c in columns if c not in (index_col or [])]
+        policy = self._client.retry_policy
+        # if the stream breaks, resume from the block of the first undelivered row
+        delivered = 0
+        attempt = 0
+        while True:
+            r = self._client.get(
+                "/tables/%s/blocks/" % table.sum,
+                params={"start": delivered // BLOCK_SIZE, "columns": "false"},
+                stream=True,
+            )
+            try:
+                with r:
+                    frames = dataframe.read_csv(
+                        r,
+                        table.columns,
+                        usecols=usecols,
+                        dtypes=dtypes,
+                        index_col=index_col,
+                        skiprows=delivered % BLOCK_SIZE,
+                        chunksize=chunksize,
+                    )
+                    if chunksize is None:
+                        frames = [frames]
+                    for df in frames:
+                        if columns is not None and list(df.columns) != columns:
+                            df = df[columns]
+                        if index_col is None:
+                            df.index = pd.RangeIndex(delivered, delivered + len(df))
+                        delivered += len(df)
+                        yield df
+                return
+            except TRANSIENT_ERRORS:
+                if not policy.wait(attempt):
+                    raise
+                attempt += 1
+
+    def pk_index(
+        self, table_sum: str, index_dir: str = None, rebuild: bool = False
+    ) -> "pkindex.PKIndex":
+        """Returns a local index to look up rows of a table by primary key, e.g.::
+
+            with repo.pk_index(table_sum) as idx:
+                rows = idx.lookup(["id1", "id2"])
+
+        The index file is built on first use by streaming the primary key columns once, then
+        reused by later calls and processes.
+
+        :param str table_sum: table checksum
+        :param str index_dir: optional, directory of index files. Defaults to :func:`wrgl.pkindex.default_index_dir`.
+        :param bool rebuild: build the index even if its file exists
+
+        :rtype: PKIndex
+        """
+        tbl = self.get_table(table_sum)
+        path = os.path.join(
+            index_dir or pkindex.default_index_dir(), "%s.pkidx" % table_sum
+        )
+        if not rebuild and os.path.exists(path):
+            return pkindex.PKIndex(self, table_sum, tbl.pk, path)
+        return pkindex.PKIndex.build(self, table_sum, tbl.pk, path)
+
+    def blame(
+        self,
+        branch: str,
+        keys: typing.List[typing.Union[str, typing.Sequence[str]]],
+        index_dir: str = None,
+        batch_size: int = 100,
+    ) -> typing.List[typing.Union["commitgraph.CommitRecord", None]]:
+        """Finds the commit that last changed each row, e.g.::
+
+            for key, com in zip(keys, repo.blame("main", keys)):
+                print(key, com.sum, com.author_name)
+
+        History is bisected with diffs against the head, so the cost grows with the logarithm
+        of the history length rather than with it. See :mod:`wrgl.blame`.
+
+        :param str branch: the name of the branch
+        :param list keys: primary keys, each either a list of values of the primary key columns
+            or a string for single-column keys
+        :param str index_dir: optional, directory of index files. Defaults to :func:`wrgl.pkindex.default_index_dir`.
+        :param int batch_size: number of rows fetched by each request when locating keys
+
+        :return: the commit of each key, or None if the key is not in the head table
+        :rtype: list[CommitRecord or None]
+        """
+        return blame.blame(self, branch, keys, index_dir, batch_size)
+
+    def changes(
+        self,
+        from_commit: str,
+        to_commit: str,
+        columns: typing.List[str] = None,
+        workers: int = 4,
+        fetch_size: int = 100,
+    ) -> Iterator["changes.ChangeEvent"]:
+        """Iterates over row-level changes made after `from_commit` up to `to_commit`, e.g.::
+
+            for event in repo.changes(last_synced, "heads/main"):
+                if event.op == "insert":
+                    ...
+
+        Consecutive commits of the first-parent history are diffed on up to `workers` threads
+        ahead of the events being read, so memory stays bounded however long the history is.
+        See :mod:`wrgl.changes`.
+
+        :param str from_commit: checksum or reference of the commit to start from, whose own changes
+            are not included. It must be a first-parent ancestor of `to_commit`.
+        :param str to_commit: checksum or reference of the last commit
+        :param list[str] columns: optional, only read these columns of changed rows. Primary key
+            columns are always read.
+        :param int workers: number of commits diffed ahead of the one being read
+        :param int fetch_size: number of rows to fetch for each batch
+
+        :rtype: typing.Iterator[ChangeEvent]
+        """
+        return changes.changes(
+            self,
+            self._resolve_commit(from_commit),
+            self._resolve_commit(to_commit),
+            columns,
+            workers,
+            fetch_size,
         )
-        for row in csv.reader(io.StringIO(r.text), dialect="unix"):
-            yield row
 
     def diff(self, sum1: str, sum2: str) -> DiffResult:
         """Compares two commits and returns their differences.
@@ -236,7 +1155,11 @@ class Repository(object):
         return json_loads(r.content, DiffResult)
 
     def diff_reader(
-        self, sum1: str, sum2: str, fetch_size: int = 100
+        self,
+        sum1: str,
+        sum2: str,
+        fetch_size: int = 100,
+        columns: typing.List[str] = None,
     ) -> diffreader.DiffReader:
         """Compares two commits and interpret their differences.
 
@@ -245,7 +1168,10 @@ class Repository(object):
 
         :param str sum1: checksum of the first commit
         :param str sum2: checksum of the second commit
+        :param int fetch_size: number of rows to fetch for each batch
+        :param list[str] columns: optional, only read these columns of changed rows. Primary key
+            columns are always read.
 
         :rtype: DiffReader
         """
-        return diffreader.DiffReader(self, sum1, sum2, fetch_size)
+        return diffreader.DiffReader(self, sum1, sum2, fetch_size, columns)
@@ -11,9 +11,12 @@ import tempfile
 import socket
 import os
 import csv
+import gzip
 
 from wrgl.diffreader import ColumnChanges
-from wrgl.repository import Repository
+from wrgl.fakeserver_test import FakeWrgld, _to_csv, synthetic_rows
+from wrgl.repository import Repository, BLOCK_SIZE, _iter_projected
+from wrgl.retry import RetryPolicy
 from wrgl import tar
 from wrgl.vcr_test import use_vcr
 
@@ -209,3 +212,138 @@ class RepositoryTestCase(TestCase):
         self.assertIsNone(dr.added_rows)
         self.assertIsNone(dr.removed_rows)
         self.assertIsNone(dr.modified_rows)
+
+
+class DownloadBlocksRawTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = FakeWrgld().start()
+        self.addCleanup(self.server.stop)
+        self.columns, self.rows = synthetic_rows(BLOCK_SIZE * 3 + 10, 4)
+        self.sum = self.server.add_commit("main", self.columns, ["id"], self.rows)
+        self.repo = Repository(
+            self.server.uri,
+            "my-client",
+            "secret",
+            retry_policy=RetryPolicy(backoff_factor=0),
+        )
+
+    def test_download(self):
+        buf = io.BytesIO()
+        n = self.repo.download_blocks_raw("heads/main", buf)
+        self.assertEqual(buf.getvalue(), _to_csv([self.columns] + self.rows))
+        self.assertEqual(n, len(buf.getvalue()))
+
+        buf = io.BytesIO()
+        self.repo.download_blocks_raw(
+            self.sum, buf, start=1, end=2, with_column_names=False
+        )
+        self.assertEqual(
+            buf.getvalue(), _to_csv(self.rows[BLOCK_SIZE : BLOCK_SIZE * 2])
+        )
+
+    def test_keep_gzip(self):
+        for gzip_level in [6, 0]:
+            self.server.gzip_level = gzip_level
+            with tempfile.TemporaryFile() as f:
+                self.repo.download_blocks_raw(self.sum, f, keep_gzip=True)
+                f.seek(0)
+                self.assertEqual(
+                    gzip.decompress(f.read()),
+                    _to_csv([self.columns] + self.rows),
+                )
+
+    def test_retry_broken_download(self):
+        self.server.fail_next(1, path_prefix="/blocks/", break_after=2000)
+        with tempfile.TemporaryFile() as f:
+            f.write(b"prefix")
+            self.repo.download_blocks_raw(self.sum, f, keep_gzip=True)
+            f.seek(0)
+            self.assertEqual(f.read(6), b"prefix")
+            self.assertEqual(
+                gzip.decompress(f.read()), _to_csv([self.columns] + self.rows)
+            )
+
+
+class ProjectionTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = FakeWrgld().start()
+        self.addCleanup(self.server.stop)
+        self.columns, self.rows = synthetic_rows(BLOCK_SIZE * 2 + 10, 5)
+        self.rows[3][2] = 'quoted, "value"\nover two lines'
+        self.sum = self.server.add_commit("main", self.columns, ["id"], self.rows)
+        self.table_sum = self.server.commits[self.sum]["table"]
+        self.repo = Repository(
+            self.server.uri,
+            "my-client",
+            "secret",
+            retry_policy=RetryPolicy(backoff_factor=0),
+        )
+
+    def test_iter_projected(self):
+        lines = iter(['a,b,c,d\n', '1,"x,\n', 'y",3,4\n', "\n", "5,6,7,8"])
+        self.assertEqual(
+            list(_iter_projected(lines, [2, 0])),
+            [["c", "a"], ["3", "1"], ["7", "5"]],
+        )
+
+    def test_get_blocks(self):
+        self.assertEqual(
+            list(self.repo.get_blocks(self.sum, columns=["col_2", "id"])),
+            [["col_2", "id"]] + [[r[2], r[0]] for r in self.rows],
+        )
+        self.assertEqual(
+            list(
+                self.repo.get_table_blocks(
+                    self.table_sum, with_column_names=False, columns=["col_3"]
+                )
+            ),
+            [[r[3]] for r in self.rows],
+        )
+        self.assertEqual(
+            list(self.repo.get_blocks(self.sum, start=1, end=2, columns=[4, 0])),
+            [["col_4", "id"]]
+            + [[r[4], r[0]] for r in self.rows[BLOCK_SIZE : BLOCK_SIZE * 2]],
+        )
+        with self.assertRaises(ValueError):
+            list(self.repo.get_blocks(self.sum, columns=["nope"]))
+
+    def test_resume_projected_blocks(self):
+        self.server.fail_next(1, path_prefix="/blocks/", break_after=8000)
+        self.server.gzip_level = 0
+        self.assertEqual(
+            list(
+                self.repo.get_blocks(
+                    self.sum, with_column_names=False, columns=["col_1"]
+                )
+            ),
+            [[r[1]] for r in self.rows],
+        )
+
+    def test_get_rows(self):
+        offsets = [3, 0, BLOCK_SIZE + 1]
+        self.assertEqual(
+            list(self.repo.get_rows("heads/main", offsets, columns=["col_2"])),
+            [[self.rows[i][2]] for i in offsets],
+        )
+        self.assertEqual(
+            list(self.repo.get_table_rows(self.table_sum, offsets, columns=[1, 0])),
+            [[self.rows[i][1], self.rows[i][0]] for i in offsets],
+        )
+
+    def test_diff_reader(self):
+        new_columns = self.columns[:2] + ["extra"] + self.columns[2:]
+        new_rows = [r[:2] + ["e" + r[0]] + r[2:] for r in self.rows]
+        new_rows[5][1] = "changed"
+        sum2 = self.server.add_commit("main", new_columns, ["id"], new_rows)
+        dr = self.repo.diff_reader(sum2, self.sum, columns=["col_1", "extra"])
+        self.assertEqual(dr.column_changes.added, {"extra"})
+        self.assertEqual(dr.modified_rows.columns, ["id", "col_1", "extra"])
+        modified = {row[0][0]: row for row in dr.modified_rows}
+        self.assertEqual(len(modified), len(self.rows))
+        self.assertEqual(
+            modified["5"], [("5", "5"), ("changed", self.rows[5][1]), ("e5", None)]
+        )
+        with self.assertRaises(ValueError):
+            self.repo.diff_reader(sum2, self.sum, columns=["nope"])
@@ -0,0 +1,194 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022 Wrangle Ltd
+
+import datetime
+import email.utils
+import random
+import threading
+import time
+import typing
+
+import requests
+import urllib3
+
+# errors that indicate a transient transport failure, either while sending a
+# request or while reading a streamed response body
+TRANSIENT_ERRORS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+    urllib3.exceptions.ProtocolError,
+    urllib3.exceptions.ReadTimeoutError,
+)
+
+
+class RetryBudget(object):
+    """Caps retries to a fraction of all requests so that retries cannot multiply
+    the load on a server that is already struggling. Thread-safe.
+
+    A retry is allowed while `retries < min_retries + ratio * requests`.
+    """
+
+    ratio: float
+    min_retries: int
+
+    def __init__(self, ratio: float = 0.2, min_retries: int = 10) -> None:
+        """
+        :param float ratio: fraction of requests that may be retried
+        :param int min_retries: number of retries that are always allowed
+        """
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self._requests = 0
+        self._retries = 0
+        self._lock = threading.Lock()
+
+    def record_request(self) -> None:
+        """Records that a request was made"""
+        with self._lock:
+            self._requests += 1
+
+    def withdraw(self) -> bool:
+        """Withdraws a retry from the budget
+
+        :return: False if the budget is exhausted
+        :rtype: bool
+        """
+        with self._lock:
+            if self._retries >= self.min_retries + self.ratio * self._requests:
+                return False
+            self._retries += 1
+            return True
+
+
+class RetryPolicy(object):
+    """Decides whether and when a failed request is retried.
+
+    Retries happen on transient transport errors and on responses whose status is in
+    `statuses`. The delay before retry `n` (starting from 0) is
+    `min(max_backoff, backoff_factor * 2 ** n)`, reduced by a random fraction of up to
+    `jitter`. If the response carries a `Retry-After` header, the delay is at least that
+    long, and the request is not retried if the server asks to wait longer than `max_backoff`.
+    """
+
+    max_attempts: int
+    backoff_factor: float
+    max_backoff: float
+    jitter: float
+    statuses: typing.FrozenSet[int]
+    methods: typing.FrozenSet[str]
+    budget: typing.Union[RetryBudget, None]
+
+    def __init__(
+        self,
+        max_attempts: int = 5,
+        backoff_factor: float = 0.5,
+        max_backoff: float = 60.0,
+        jitter: float = 1.0,
+        statuses: typing.Iterable[int] = (429, 500, 502, 503, 504),
+        methods: typing.Iterable[str] = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE"),
+        budget: typing.Union[RetryBudget, None] = None,
+    ) -> None:
+        """
+        :param int max_attempts: maximum number of attempts, including the first one. 1 disables retries.
+        :param float backoff_factor: delay in seconds before the first retry
+        :param float max_backoff: maximum delay in seconds between two attempts
+        :param float jitter: fraction of the delay that is randomized, between 0 and 1
+        :param list[int] statuses: response statuses that are retried
+        :param list[str] methods: HTTP methods that are retried by default. Other methods are only retried when
+            the request explicitly opts in, e.g. :func:`wrgl.repository.Repository.commit` with `retry=True`.
+        :param RetryBudget budget: optional, limits retries across all requests. A new :class:`RetryBudget` is created if not given.
+        """
+        self.max_attempts = max_attempts
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.statuses = frozenset(statuses)
+        self.methods = frozenset(m.upper() for m in methods)
+        self.budget = budget if budget is not None else RetryBudget()
+
+    def allows_method(self, method: str, retry: typing.Union[bool, None] = None) -> bool:
+        """Returns whether requests with the given method can be retried
+
+        :param str method: HTTP verb
+        :param bool retry: optional, overrides the default decision based on `methods`
+
+        :rtype: bool
+        """
+        if retry is not None:
+            return retry
+        return method.upper() in self.methods
+
+    def backoff(self, attempt: int) -> float:
+        """Returns the delay in seconds before retrying after the given attempt
+
+        :param int attempt: zero-based index of the failed attempt
+
+        :rtype: float
+        """
+        delay = min(self.max_backoff, self.backoff_factor * (2**attempt))
+        return delay - random.uniform(0, self.jitter * delay)
+
+    @staticmethod
+    def retry_after(resp: typing.Union[requests.Response, None]) -> typing.Union[float, None]:
+        """Parses the `Retry-After` header of a response
+
+        :param requests.Response resp: the response
+
+        :return: number of seconds to wait, or None if the header is absent or malformed
+        :rtype: float
+        """
+        if resp is None:
+            return None
+        value = resp.headers.get("Retry-After", None)
+        if not value:
+            return None
+        value = value.strip()
+        if value.isdigit():
+            return float(value)
+        try:
+            when = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if when is None:
+            return None
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=datetime.timezone.utc)
+        return max(
+            0.0,
+            (when - datetime.datetime.now(datetime.timezone.utc)).total_seconds(),
+        )
+
+    def is_retryable_response(self, resp: requests.Response) -> bool:
+        """Returns whether the status of a response warrants a retry
+
+        :param requests.Response resp: the response
+
+        :rtype: bool
+        """
+        return resp.status_code in self.statuses
+
+    def wait(
+        self, attempt: int, resp: typing.Union[requests.Response, None] = None
+    ) -> bool:
+        """Sleeps before the next attempt if another attempt is allowed
+
+        :param int attempt: zero-based index of the failed attempt
+        :param requests.Response resp: optional, the response of the failed attempt
+
+        :return: False if the request should not be retried
+        :rtype: bool
+        """
+        if attempt + 1 >= self.max_attempts:
+            return False
+        delay = self.backoff(attempt)
+        retry_after = self.retry_after(resp)
+        if retry_after is not None:
+            if retry_after > self.max_backoff:
+                return False
+            delay = max(delay, retry_after)
+        if self.budget is not None and not self.budget.withdraw():
+            return False
+        if delay > 0:
+            time.sleep(delay)
+        return True
@@ -0,0 +1,204 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022 Wrangle Ltd
+
+import email.utils
+import io
+import time
+from unittest import TestCase
+
+import requests
+import urllib3
+
+from wrgl.fakeserver_test import FakeWrgld, synthetic_rows
+from wrgl.repository import Repository, BLOCK_SIZE
+from wrgl.retry import RetryBudget, RetryPolicy
+
+
+class FakeHeaders(dict):
+    pass
+
+
+class FakeResponse(object):
+    def __init__(self, status_code=200, headers=None):
+        self.status_code = status_code
+        self.headers = FakeHeaders(headers or {})
+
+
+class RetryPolicyTestCase(TestCase):
+    def test_backoff(self):
+        policy = RetryPolicy(backoff_factor=1, max_backoff=5, jitter=0)
+        self.assertEqual([policy.backoff(i) for i in range(5)], [1, 2, 4, 5, 5])
+        policy = RetryPolicy(backoff_factor=1, max_backoff=5, jitter=0.5)
+        for i in range(20):
+            self.assertGreaterEqual(policy.backoff(2), 2)
+            self.assertLessEqual(policy.backoff(2), 4)
+
+    def test_allows_method(self):
+        policy = RetryPolicy()
+        self.assertTrue(policy.allows_method("get"))
+        self.assertFalse(policy.allows_method("POST"))
+        self.assertTrue(policy.allows_method("POST", True))
+        self.assertFalse(policy.allows_method("GET", False))
+
+    def test_retry_after(self):
+        self.assertIsNone(RetryPolicy.retry_after(FakeResponse()))
+        self.assertEqual(
+            RetryPolicy.retry_after(FakeResponse(headers={"Retry-After": "3"})), 3
+        )
+        date = email.utils.formatdate(time.time() + 30, usegmt=True)
+        delay = RetryPolicy.retry_after(FakeResponse(headers={"Retry-After": date}))
+        self.assertGreater(delay, 25)
+        self.assertLessEqual(delay, 30)
+        self.assertIsNone(
+            RetryPolicy.retry_after(FakeResponse(headers={"Retry-After": "soon"}))
+        )
+
+    def test_wait(self):
+        policy = RetryPolicy(max_attempts=3, backoff_factor=0, max_backoff=10)
+        self.assertTrue(policy.wait(0))
+        self.assertTrue(policy.wait(1))
+        self.assertFalse(policy.wait(2))
+        self.assertFalse(
+            policy.wait(0, FakeResponse(503, headers={"Retry-After": "11"}))
+        )
+
+    def test_budget(self):
+        budget = RetryBudget(ratio=0.5, min_retries=1)
+        self.assertTrue(budget.withdraw())
+        self.assertFalse(budget.withdraw())
+        budget.record_request()
+        budget.record_request()
+        self.assertTrue(budget.withdraw())
+        self.assertFalse(budget.withdraw())
+
+
+class BrokenStream(io.RawIOBase):
+    """Serves data then raises a protocol error after `fail_after` bytes"""
+
+    def __init__(self, data: bytes, fail_after: int = None):
+        self._buf = io.BytesIO(data)
+        self._fail_after = fail_after
+        self.decode_content = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self._fail_after is not None and self._buf.tell() >= self._fail_after:
+            raise urllib3.exceptions.ProtocolError("connection reset")
+        n = len(b)
+        if self._fail_after is not None:
+            n = min(n, self._fail_after - self._buf.tell())
+        data = self._buf.read(n)
+        b[: len(data)] = data
+        return len(data)
+
+
+class StreamResponse(object):
+    def __init__(self, raw):
+        self.raw = raw
+
+    def iter_content(self, chunk_size=1):
+        while True:
+            chunk = self.raw.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class FakeClient(object):
+    def __init__(self, serve):
+        self.retry_policy = RetryPolicy(backoff_factor=0)
+        self.calls = []
+        self._serve = serve
+
+    def get(self, path, params=None, stream=False):
+        self.calls.append(params)
+        return StreamResponse(self._serve(len(self.calls), params))
+
+
+class ResumeTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.repo = Repository("http://localhost:8081", "my-client", "secret")
+
+    def test_resume_rows(self):
+        rows = {i: "%d,v%d\n" % (i, i) for i in range(10)}
+
+        def serve(n, params):
+            offsets = [int(v) for v in params["offsets"].split(",")]
+            data = "".join(rows[i] for i in offsets).encode("utf8")
+            # the first response breaks in the middle of the fourth row
+            return BrokenStream(data, 3 * 5 + 2 if n == 1 else None)
+
+        self.repo._client = FakeClient(serve)
+        self.assertEqual(
+            list(self.repo.get_table_rows("abc", list(range(10)))),
+            [[str(i), "v%d" % i] for i in range(10)],
+        )
+        self.assertEqual(self.repo._client.calls[1]["offsets"], "3,4,5,6,7,8,9")
+
+    def test_resume_blocks(self):
+        n_rows = BLOCK_SIZE * 2 + 10
+        lines = ["%d,v\n" % i for i in range(n_rows)]
+
+        def serve(n, params):
+            data = "".join(lines[params["start"] * BLOCK_SIZE :])
+            if params["columns"] == "true":
+                data = "a,b\n" + data
+            data = data.encode("utf8")
+            # the first response breaks half way through the second block
+            fail_after = None
+            if n == 1:
+                fail_after = len("".join(lines[: BLOCK_SIZE + 100])) + 4 + 1
+            return BrokenStream(data, fail_after)
+
+        self.repo._client = FakeClient(serve)
+        result = list(self.repo.get_table_blocks("abc"))
+        self.assertEqual(result[0], ["a", "b"])
+        self.assertEqual(result[1:], [[str(i), "v"] for i in range(n_rows)])
+        self.assertEqual(self.repo._client.calls[1]["start"], 1)
+        self.assertEqual(self.repo._client.calls[1]["columns"], "false")
+
+
+class FakeServerRetryTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = FakeWrgld().start()
+        columns, rows = synthetic_rows(BLOCK_SIZE * 3, 4)
+        self.rows = rows
+        self.server.add_commit("main", columns, ["id"], rows)
+        self.repo = Repository(
+            self.server.uri,
+            "my-client",
+            "secret",
+            retry_policy=RetryPolicy(backoff_factor=0),
+        )
+
+    def tearDown(self):
+        self.server.stop()
+        super().tearDown()
+
+    def test_retry_status(self):
+        self.server.fail_next(2, 503, "/refs/", retry_after="0")
+        self.assertIn("heads/main", self.repo.get_refs())
+        self.server.fail_next(5, 503, "/refs/")
+        with self.assertRaises(requests.exceptions.HTTPError):
+            self.repo.get_refs()
+
+    def test_resume_broken_stream(self):
+        self.server.fail_next(1, 200, "/blocks/", break_after=5000)
+        self.assertEqual(
+            list(self.repo.get_blocks("heads/main", with_column_names=False)),
+            self.rows,
+        )
+        self.assertEqual(
+            [p for _, p in self.server.request_log if p.startswith("/blocks/")][-1],
+            "/blocks/?head=heads%2Fmain&start=1&columns=false",
+        )
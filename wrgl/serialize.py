@@ -1,12 +1,19 @@
 # SPDX-License-Identifier: Apache-2.0
 # Copyright © 2022 Wrangle Ltd
 
+import datetime
 import json
 import re
 import typing
 
 import attr
 
+# optional, a faster parser and encoder installed with: pip install wrgl[json]
+try:
+    import orjson as _orjson
+except ImportError:
+    _orjson = None
+
 
 def to_camel_case(s):
     components = s.split("_")
@@ -27,26 +34,53 @@ def none_field_transformer(cls, fields):
     ]
 
 
+# attrs builds a new class when slots=True, so fields that refer to their own class are
+# resolved to the discarded original. Maps such originals to the module namespace and name
+# under which the final class is found.
+_self_references: typing.Dict[type, typing.Tuple[typing.Dict, str]] = dict()
+
+
+def _final_class(cls):
+    ref = _self_references.get(cls, None)
+    return cls if ref is None else ref[0][ref[1]]
+
+
+def _instance_of(cls, owner):
+    if cls is not owner:
+        return attr.validators.instance_of(cls)
+
+    def validate(inst, attribute, value):
+        final = _final_class(owner)
+        if not isinstance(value, final):
+            raise TypeError(
+                "'%s' must be %r (got %r that is a %r)."
+                % (attribute.name, final, value, value.__class__)
+            )
+
+    return validate
+
+
 def field_transformer(namespace):
     def transform(cls, fields):
         results = []
         attr.resolve_types(
             cls, globalns=namespace, localns={cls.__name__: cls}, attribs=fields
         )
+        _self_references[cls] = (namespace, cls.__name__)
         for field in fields:
             original_type = getattr(field.type, "__origin__", None)
             if type(field.type) is str and field.type == cls.__name__:
                 field = field.evolve(type=cls)
             if type(field.type) is type:
-                validator = attr.validators.instance_of(field.type)
+                validator = _instance_of(field.type, cls)
             elif original_type is list or original_type is typing.List:
                 validator = attr.validators.deep_iterable(
-                    member_validator=attr.validators.instance_of(field.type.__args__[0])
+                    member_validator=_instance_of(field.type.__args__[0], cls)
                 )
             elif original_type is dict or original_type is typing.Dict:
                 validator = attr.validators.deep_mapping(
-                    key_validator=attr.validators.instance_of(field.type.__args__[0]),
-                    value_validator=attr.validators.instance_of(field.type.__args__[1]),
+                    key_validator=_instance_of(field.type.__args__[0], cls),
+                    value_validator=_instance_of(field.type.__args__[1], cls),
                 )
             else:
                 raise TypeError(
@@ -65,16 +99,38 @@ def field_transformer(namespace):
     return transform
 
 
-class _JSONEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if attr.has(obj.__class__):
-            fields = attr.fields(obj.__class__)
-            return {
-                to_camel_case(field.name): getattr(obj, field.name)
-                for field in fields
-                if getattr(obj, field.name) is not None
-            }
-        return super().default(obj)
+# number of keys per class whose snake case name is remembered, bounds memory if a server
+# sends arbitrary keys
+_MAX_KEYS = 1024
+
+# class -> list of (attribute name, JSON key), see _default
+_encoded_fields: typing.Dict[type, typing.List[typing.Tuple[str, str]]] = dict()
+
+# class -> JSON key -> (attribute name, converter or None), see _deserialize
+_decoded_fields: typing.Dict[type, typing.Dict[str, typing.Tuple]] = dict()
+
+
+def _default(obj):
+    """Encodes attrs instances and datetimes, as the default hook of either JSON backend"""
+    cls = obj.__class__
+    fields = _encoded_fields.get(cls, None)
+    if fields is None:
+        if isinstance(obj, datetime.datetime):
+            # same as orjson, which encodes datetimes itself
+            return obj.isoformat()
+        if not attr.has(cls):
+            raise TypeError(
+                "Object of type %s is not JSON serializable" % cls.__name__
+            )
+        fields = _encoded_fields[cls] = [
+            (field.name, to_camel_case(field.name)) for field in attr.fields(cls)
+        ]
+    result = dict()
+    for name, key in fields:
+        value = getattr(obj, name)
+        if value is not None:
+            result[key] = value
+    return result
 
 
 def json_dumps(
@@ -89,65 +145,135 @@ def json_dumps(
     sort_keys=False,
     **kwargs
 ):
+    """Serializes attrs instances with the standard library, accepting the arguments of
+    :func:`json.dumps`. See :func:`json_dumpb` for a faster, compact form.
+    """
     return json.dumps(
         inst,
         skipkeys=skipkeys,
         ensure_ascii=ensure_ascii,
         check_circular=check_circular,
         allow_nan=allow_nan,
-        cls=_JSONEncoder,
         indent=indent,
         separators=separators,
-        default=default,
+        default=_default if default is None else default,
         sort_keys=sort_keys,
         **kwargs
     )
 
 
-def json_loads(s, serializer_cls):
-    data = json.loads(s)
+def json_dumpb(inst) -> bytes:
+    """Serializes attrs instances to compact UTF-8 JSON, with orjson if it is installed
+
+    :rtype: bytes
+    """
+    if _orjson is not None:
+        try:
+            return _orjson.dumps(inst, default=_default)
+        except _orjson.JSONEncodeError:
+            # orjson gives up beyond 254 nested objects, which deep commit trees exceed
+            pass
+    return json.dumps(
+        inst, default=_default, separators=(",", ":"), ensure_ascii=False
+    ).encode("utf8")
+
+
+def json_loads(s, serializer_cls=None):
+    """Parses JSON, with orjson if it is installed, into an instance of `serializer_cls`
+
+    :param s: JSON document as str or bytes
+    :param serializer_cls: optional, attrs class to deserialize into. The parsed value is
+        returned as is if not given.
+    """
+    data = _orjson.loads(s) if _orjson is not None else json.loads(s)
+    if serializer_cls is None:
+        return data
     return _deserialize(data, serializer_cls)
 
 
-def _deserialize(data, serializer_cls):
+# how the JSON value of a field is decoded, see _plan
+_KEEP, _OBJECT, _LIST, _DICT = range(4)
+
+
+def _plan(typ):
+    """Returns how the JSON value of a field of type `typ` is decoded, as (kind, class of the
+    value or of its elements, whether that class is an attrs class)"""
+    if type(typ) is type:
+        cls = _final_class(typ)
+        if attr.has(cls):
+            return _OBJECT, cls, True
+        return _KEEP, cls, False
+    origin = getattr(typ, "__origin__", None)
+    if origin is list or origin is typing.List:
+        el_cls = _final_class(typ.__args__[0])
+        return _LIST, el_cls, attr.has(el_cls)
+    if origin is dict or origin is typing.Dict:
+        el_cls = _final_class(typ.__args__[1])
+        return _DICT, el_cls, attr.has(el_cls)
+    raise TypeError("unanticipated field type %s" % typ)
+
+
+def _frame(serializer_cls, data, container, key):
+    """Decodes the fields of one object whose values are kept as is. Nested objects are
+    returned as pending (container, key, class, data) to be decoded later.
+    """
+    fields = _decoded_fields.get(serializer_cls, None)
+    if fields is None:
+        fields = _decoded_fields[serializer_cls] = dict()
     kwargs = dict()
-    fields_dict = attr.fields_dict(serializer_cls)
-    data = [(to_snake_case(k), v) for k, v in data.items()]
-    data_stack = [
-        (kwargs, k, fields_dict[k], v)
-        for k, v in data
-        if k in fields_dict and k != "meta"
-    ]
-    while len(data_stack) > 0:
-        parent, name, field, value = data_stack.pop()
-        if value is None:
-            parent[name] = None
-            continue
-        if type(field.type) is type:
-            if attr.has(field.type):
-                parent[name] = _deserialize(value, field.type)
+    pending = []
+    for k, value in data.items():
+        field = fields.get(k, None)
+        if field is None:
+            name = to_snake_case(k)
+            field = attr.fields_dict(serializer_cls).get(name, None)
+            if field is None or name == "meta":
+                field = (None, _KEEP, None, False)
             else:
-                parent[name] = value
-        elif field.type.__origin__ is list or field.type.__origin__ is typing.List:
-            el_cls = field.type.__args__[0]
+                field = (name,) + _plan(field.type)
+            if len(fields) < _MAX_KEYS:
+                fields[k] = field
+        name, kind, el_cls, is_attrs = field
+        if name is None:
+            continue
+        if value is None or kind == _KEEP:
+            kwargs[name] = value
+        elif kind == _OBJECT:
+            pending.append((kwargs, name, el_cls, value))
+        elif kind == _LIST:
             if type(value) is not list:
                 raise TypeError(
                     'keyword argument "%s" should be a list of %s' % (name, el_cls)
                 )
-            if attr.has(el_cls):
-                parent[name] = [_deserialize(e, el_cls) for e in value]
+            if is_attrs:
+                items = kwargs[name] = [None] * len(value)
+                pending.extend((items, i, el_cls, e) for i, e in enumerate(value))
             else:
-                parent[name] = value
-        elif field.type.__origin__ is dict or field.type.__origin__ is typing.Dict:
-            el_cls = field.type.__args__[1]
+                kwargs[name] = value
+        else:
             if type(value) is not dict:
                 raise TypeError(
                     'keyword argument "%s" should be a dict of %s' % (name, el_cls)
                 )
-            if attr.has(el_cls):
-                parent[name] = {k: _deserialize(e, el_cls) for k, e in value.items()}
+            if is_attrs:
+                items = kwargs[name] = dict.fromkeys(value)
+                pending.extend((items, i, el_cls, e) for i, e in value.items())
             else:
-                parent[name] = value
+                kwargs[name] = value
+    return serializer_cls, kwargs, pending, container, key
+
+
+def _deserialize(data, serializer_cls):
+    # nested objects are decoded from an explicit stack rather than by recursion, because
+    # commit trees nest one level per commit
+    result = [None]
+    stack = [_frame(serializer_cls, data, result, 0)]
+    while stack:
+        cls, kwargs, pending, container, key = stack[-1]
+        if pending:
+            parent, k, el_cls, value = pending.pop()
+            stack.append(_frame(el_cls, value, parent, k))
         else:
-            raise TypeError("unanticipated field type %s" % field.type)
-    return serializer_cls(**kwargs)
+            stack.pop()
+            container[key] = cls(**kwargs)
+    return result[0]
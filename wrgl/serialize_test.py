@@ -2,11 +2,13 @@
 # Copyright © 2022 Wrangle Ltd
 
 import typing
-from unittest import TestCase
+from unittest import TestCase, mock
 
 import attr
 
-from wrgl.serialize import json_loads, json_dumps, field_transformer
+from wrgl import serialize
+from wrgl.commit import CommitTree
+from wrgl.serialize import json_loads, json_dumps, json_dumpb, field_transformer
 
 
 @attr.s(auto_attribs=True, field_transformer=field_transformer(globals()))
@@ -40,6 +42,24 @@ class Receive(object):
     deny_deletes: bool
 
 
+@attr.s(auto_attribs=True, slots=True, field_transformer=field_transformer(globals()))
+class Tree(object):
+    name: str
+    children: "typing.Dict[str, Tree]"
+    parents: "typing.List[Tree]"
+
+
+@attr.s(
+    auto_attribs=True,
+    slots=True,
+    frozen=True,
+    field_transformer=field_transformer(globals()),
+)
+class Point(object):
+    x: int
+    y: int
+
+
 class JSONTestCase(TestCase):
     def test_loads_simple(self):
         obj1 = Person(
@@ -112,3 +132,74 @@ class JSONTestCase(TestCase):
     def test_loads_ignore_empty(self):
         obj = json_loads('{"denyNonFastForwards": true}', Receive)
         self.assertEqual(obj, Receive(deny_non_fast_forwards=True))
+
+    def test_slotted_self_reference(self):
+        obj1 = Tree(
+            name="root",
+            children={"a": Tree(name="a", children={"b": Tree(name="b")})},
+            parents=[Tree(name="p")],
+        )
+        self.assertFalse(hasattr(obj1, "__dict__"))
+        obj2 = json_loads(json_dumps(obj1), Tree)
+        self.assertEqual(obj1, obj2)
+        self.assertIs(type(obj2.children["a"].children["b"]), Tree)
+        with self.assertRaises(TypeError):
+            Tree(name="root", children={"a": "not a tree"})
+
+    def test_frozen(self):
+        p = json_loads('{"x": 1, "y": 2}', Point)
+        self.assertEqual(p, Point(x=1, y=2))
+        self.assertEqual(len({p, Point(x=1, y=2)}), 1)
+        self.assertEqual(json_dumps(p), '{"x": 1, "y": 2}')
+
+    def test_dumpb(self):
+        obj1 = Config(
+            user=Person(name="Jöhn Doe", height=170, scores=[7, 8, 9]),
+            branch={"main": Branch(fetch="refs/heads/main")},
+        )
+        expected = (
+            '{"user":{"name":"Jöhn Doe","height":170,"scores":[7,8,9]},'
+            '"branch":{"main":{"fetch":"refs/heads/main"}}}'
+        ).encode("utf8")
+        for backend in [serialize._orjson, None]:
+            with mock.patch.object(serialize, "_orjson", backend):
+                self.assertEqual(json_dumpb(obj1), expected)
+                self.assertEqual(json_loads(expected, Config), obj1)
+                self.assertEqual(json_loads(b'{"a": [1]}'), {"a": [1]})
+                with self.assertRaises(TypeError):
+                    json_dumpb(object())
+
+    def test_dumpb_deeply_nested(self):
+        obj1 = Tree(name="0")
+        for i in range(1, 300):
+            obj1 = Tree(name=str(i), children={"c": obj1})
+        data = json_dumpb(obj1)
+        obj2 = json_loads(data, Tree)
+        self.assertEqual(json_dumpb(obj2), data)
+        for i in range(299, 0, -1):
+            self.assertEqual(obj2.name, str(i))
+            obj2 = obj2.children["c"]
+        self.assertEqual(obj2, Tree(name="0"))
+
+    def test_loads_deep_commit_tree(self):
+        # commit trees nest one level per commit, decoding must not recurse per level
+        n = 400
+        head = "".join(
+            '{"message": "commit %d", "parents": ["%032x"], "parentCommits": {"%032x": '
+            % (i, i - 1, i - 1)
+            for i in range(n - 1, 0, -1)
+        )
+        data = '{"sum": "%032x", "root": %s{"message": "commit 0"}%s}' % (
+            n - 1,
+            head,
+            "}}" * (n - 1),
+        )
+        for backend in [serialize._orjson, None]:
+            with mock.patch.object(serialize, "_orjson", backend):
+                tree = json_loads(data, CommitTree)
+            com = tree.root
+            for i in range(n - 1, 0, -1):
+                self.assertEqual(com.message, "commit %d" % i)
+                com = com.parent_commits["%032x" % (i - 1)]
+            self.assertEqual(com.message, "commit 0")
+            self.assertIsNone(com.parent_commits)
@@ -0,0 +1,100 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022 Wrangle Ltd
+
+import json
+import os
+import tempfile
+import typing
+
+
+class TokenStore(object):
+    """Base class of token stores. A token store persists the tokens acquired by
+    :class:`wrgl.uma.UMAClient` so that they can be reused by later processes.
+
+    Tokens are keyed by resource URI and client id.
+    """
+
+    def load(self, rsc_uri: str, client_id: str) -> typing.Dict[str, str]:
+        """Returns previously saved tokens, or an empty dict if there is none
+
+        :param str rsc_uri: the URI of the UMA resource
+        :param str client_id: Keycloak client id
+
+        :rtype: dict[str, str]
+        """
+        raise NotImplementedError()
+
+    def save(
+        self, rsc_uri: str, client_id: str, tokens: typing.Dict[str, str]
+    ) -> None:
+        """Saves tokens
+
+        :param str rsc_uri: the URI of the UMA resource
+        :param str client_id: Keycloak client id
+        :param dict[str, str] tokens: tokens to save
+        """
+        raise NotImplementedError()
+
+
+def default_token_path() -> str:
+    """Returns the default location of the token file, which is
+    `$XDG_CACHE_HOME/wrgl/tokens.json` or `~/.cache/wrgl/tokens.json`
+
+    :rtype: str
+    """
+    cache_dir = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(cache_dir, "wrgl", "tokens.json")
+
+
+class FileTokenStore(TokenStore):
+    """Stores tokens in a JSON file that is only readable and writable by the
+    current user. Writes are atomic so concurrent processes never observe a
+    partially written file.
+    """
+
+    path: str
+
+    def __init__(self, path: str = None) -> None:
+        """
+        :param str path: optional, location of the token file. Defaults to :func:`default_token_path`.
+        """
+        self.path = path or default_token_path()
+
+    @staticmethod
+    def _key(rsc_uri: str, client_id: str) -> str:
+        return "%s %s" % (rsc_uri.rstrip("/"), client_id)
+
+    def _read(self) -> typing.Dict[str, typing.Dict[str, str]]:
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return dict()
+        if type(data) is not dict:
+            return dict()
+        return data
+
+    def load(self, rsc_uri: str, client_id: str) -> typing.Dict[str, str]:
+        tokens = self._read().get(self._key(rsc_uri, client_id), None)
+        if type(tokens) is not dict:
+            return dict()
+        return tokens
+
+    def save(
+        self, rsc_uri: str, client_id: str, tokens: typing.Dict[str, str]
+    ) -> None:
+        data = self._read()
+        data[self._key(rsc_uri, client_id)] = {k: v for k, v in tokens.items() if v}
+        dir_name = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(dir_name, mode=0o700, exist_ok=True)
+        # mkstemp creates the file with mode 0o600
+        fd, tmp_path = tempfile.mkstemp(dir=dir_name, prefix=".tokens-")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
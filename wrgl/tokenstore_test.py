@@ -0,0 +1,59 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022 Wrangle Ltd
+
+import os
+import stat
+import tempfile
+from unittest import TestCase
+
+from wrgl.tokenstore import FileTokenStore
+from wrgl.uma import UMAClient
+
+
+class FileTokenStoreTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "wrgl", "tokens.json")
+        self.store = FileTokenStore(self.path)
+
+    def tearDown(self):
+        self.dir.cleanup()
+        super().tearDown()
+
+    def test_load_missing(self):
+        self.assertEqual(self.store.load("http://localhost:8081", "my-client"), {})
+
+    def test_save_load(self):
+        self.store.save(
+            "http://localhost:8081/", "my-client", {"access_token": "a", "rpt": "b"}
+        )
+        self.store.save("http://localhost:8082", "my-client", {"access_token": "c"})
+        self.assertEqual(
+            self.store.load("http://localhost:8081", "my-client"),
+            {"access_token": "a", "rpt": "b"},
+        )
+        self.assertEqual(
+            self.store.load("http://localhost:8082", "my-client"),
+            {"access_token": "c"},
+        )
+        self.assertEqual(self.store.load("http://localhost:8081", "other"), {})
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0o600)
+
+    def test_load_corrupted(self):
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, "w") as f:
+            f.write("{not json")
+        self.assertEqual(self.store.load("http://localhost:8081", "my-client"), {})
+
+    def test_client_reads_tokens(self):
+        self.store.save(
+            "http://localhost:8081",
+            "my-client",
+            {"token_endpoint": "http://keycloak/token", "access_token": "a", "rpt": "b"},
+        )
+        client = UMAClient(
+            "http://localhost:8081/", "my-client", "secret", token_store=self.store
+        )
+        self.assertEqual(client.rpt, "b")
+        self.assertEqual(client._access_token, "a")
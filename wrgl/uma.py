@@ -1,34 +1,318 @@
 import re
+import threading
+import time
 from typing import Union, Dict, Tuple, Callable
 
+import attr
 import requests
+from requests.adapters import HTTPAdapter
 from requests.exceptions import HTTPError
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
 
+from wrgl.instrument import Instrumentation, RequestEvent, endpoint_template
+from wrgl.ratelimit import RequestScheduler
+from wrgl.retry import RetryPolicy, TRANSIENT_ERRORS
 from wrgl.serialize import json_dumps
+from wrgl.tokenstore import TokenStore
+
+
+def _on_close(resp: requests.Response, callback: Callable[[], None]) -> None:
+    close = resp.close
+
+    def close_and_callback():
+        try:
+            close()
+        finally:
+            callback()
+
+    resp.close = close_and_callback
+
+
+# seconds spent opening the latest connection of the current thread
+_connect_timing = threading.local()
+
+
+# connection class -> subclass that records the duration of connect()
+_timed_connection_classes: Dict[type, type] = dict()
+
+
+def _timed_connection_cls(base: type) -> type:
+    cls = _timed_connection_classes.get(base, None)
+    if cls is None:
+
+        class TimedConnection(base):
+            def connect(self, *args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return super().connect(*args, **kwargs)
+                finally:
+                    _connect_timing.value = time.perf_counter() - start
+
+        TimedConnection.__name__ = "Timed" + base.__name__
+        cls = _timed_connection_classes[base] = TimedConnection
+    return cls
+
+
+class _TimedPoolMixin(object):
+    # derived from the connection class of the base pool when a connection is made, so
+    # that a connection class patched onto the base pool, e.g. by vcrpy, is still used
+    @property
+    def ConnectionCls(self):
+        return _timed_connection_cls(super().ConnectionCls)
+
+
+class _TimedHTTPConnectionPool(_TimedPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class _TimedHTTPSConnectionPool(_TimedPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+class _TimedHTTPAdapter(HTTPAdapter):
+    """Records how long it takes to open new connections"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool,
+        }
+
+
+@attr.s(auto_attribs=True)
+class _Timing(object):
+    start: float = None
+    connect: float = None
+    headers: float = None
+    done: float = None
+
+    def bytes_in(self, resp: requests.Response) -> Union[int, None]:
+        try:
+            return resp.raw.tell()
+        except (AttributeError, OSError):
+            return None
+
+
+class UMAContext:
+    """Holds credentials and connections that can be shared by many :class:`UMAClient`
+    (and therefore many :class:`wrgl.repository.Repository`). All methods are thread-safe.
+
+    - UMA configurations are discovered once per authorization server.
+    - Access tokens are fetched once per (token endpoint, client id).
+    - RPTs are kept per (resource URI, client id).
+    - Requests go through a single connection pool.
+    """
+
+    session: requests.Session
+
+    def __init__(
+        self,
+        session: Union[requests.Session, None] = None,
+        pool_connections: int = 10,
+        pool_maxsize: int = 10,
+    ) -> None:
+        """
+        :param requests.Session session: optional, session to send requests with. A new session is created if not given.
+        :param int pool_connections: number of hosts to keep connection pools for. Ignored if session is given.
+        :param int pool_maxsize: maximum number of connections to keep per host. Ignored if session is given.
+        """
+        if session is None:
+            session = requests.Session()
+            adapter = _TimedHTTPAdapter(
+                pool_connections=pool_connections, pool_maxsize=pool_maxsize
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        self.session = session
+        self._lock = threading.Lock()
+        self._key_locks: Dict[Tuple, threading.Lock] = dict()
+        self._uma_configs: Dict[str, Dict] = dict()
+        self._access_tokens: Dict[Tuple[str, str], str] = dict()
+        self._rpts: Dict[Tuple[str, str], str] = dict()
+
+    def _key_lock(self, key: Tuple) -> threading.Lock:
+        with self._lock:
+            if key not in self._key_locks:
+                self._key_locks[key] = threading.Lock()
+            return self._key_locks[key]
+
+    def get_uma_config(self, as_uri: str) -> Dict:
+        """Returns UMA configuration of an authorization server, discovering it on first use
+
+        :param str as_uri: URI of the authorization server
+
+        :rtype: dict
+        """
+        as_uri = as_uri.rstrip("/")
+        with self._key_lock(("uma_config", as_uri)):
+            if as_uri not in self._uma_configs:
+                resp = self.session.get(as_uri + "/.well-known/uma2-configuration")
+                resp.raise_for_status()
+                self._uma_configs[as_uri] = resp.json()
+            return self._uma_configs[as_uri]
+
+    def get_access_token(
+        self,
+        token_endpoint: str,
+        client_id: str,
+        client_secret: str,
+        stale_token: Union[str, None] = None,
+    ) -> str:
+        """Returns the access token of a client, fetching it with client credentials if needed
+
+        :param str token_endpoint: token endpoint of the authorization server
+        :param str client_id: Keycloak client id
+        :param str client_secret: Keycloak client secret
+        :param str stale_token: optional, a token that was rejected. If it is still the
+            current token, a new one is fetched. Otherwise the token refreshed by
+            another thread is returned.
+
+        :rtype: str
+        """
+        key = (token_endpoint, client_id)
+        with self._key_lock(("access_token",) + key):
+            token = self._access_tokens.get(key, "")
+            if not token or token == stale_token:
+                resp = self.session.post(
+                    token_endpoint,
+                    data={
+                        "grant_type": "client_credentials",
+                        "client_id": client_id,
+                        "client_secret": client_secret,
+                    },
+                )
+                resp.raise_for_status()
+                token = resp.json()["access_token"]
+                self._access_tokens[key] = token
+            return token
+
+    def set_access_token(self, token_endpoint: str, client_id: str, token: str) -> None:
+        """Records an access token acquired elsewhere, e.g. loaded from a :class:`wrgl.tokenstore.TokenStore`
+
+        :param str token_endpoint: token endpoint of the authorization server
+        :param str client_id: Keycloak client id
+        :param str token: the access token
+        """
+        with self._lock:
+            self._access_tokens.setdefault((token_endpoint, client_id), token)
+
+    def get_rpt(self, rsc_uri: str, client_id: str) -> str:
+        """Returns the RPT of a client for a resource, or an empty string
+
+        :param str rsc_uri: the URI of the UMA resource
+        :param str client_id: Keycloak client id
+
+        :rtype: str
+        """
+        with self._lock:
+            return self._rpts.get((rsc_uri, client_id), "")
+
+    def set_rpt(self, rsc_uri: str, client_id: str, rpt: str) -> None:
+        """Records the RPT of a client for a resource
+
+        :param str rsc_uri: the URI of the UMA resource
+        :param str client_id: Keycloak client id
+        :param str rpt: the RPT
+        """
+        with self._lock:
+            self._rpts[(rsc_uri, client_id)] = rpt
 
 
 class UMAClient:
     _rsc_uri: str = ""
     _client_id: str = ""
     _client_secret: str = ""
-    _access_token: str = ""
-    rpt: str = ""
+    _token_endpoint: str = ""
+    _token_store: Union[TokenStore, None] = None
+    _context: UMAContext
+    retry_policy: RetryPolicy
+    scheduler: Union[RequestScheduler, None] = None
+    instrumentation: Instrumentation
 
-    def __init__(self, rsc_uri: str, client_id: str, client_secret: str) -> None:
+    def __init__(
+        self,
+        rsc_uri: str,
+        client_id: str,
+        client_secret: str,
+        token_store: Union[TokenStore, None] = None,
+        context: Union[UMAContext, None] = None,
+        retry_policy: Union[RetryPolicy, None] = None,
+        scheduler: Union[RequestScheduler, None] = None,
+        instrumentation: Union[Instrumentation, None] = None,
+        accept_encoding: Union[str, None] = None,
+    ) -> None:
         """
         :param str rsc_uri: the URI of the UMA resource
         :param str client_id: Keycloak client id
         :param str client_secret: Keycloak client secret
+        :param TokenStore token_store: optional, if given, tokens are read from this store on startup and saved to it whenever they are refreshed
+        :param UMAContext context: optional, credentials and connections shared with other clients. A private context is created if not given.
+        :param RetryPolicy retry_policy: optional, how transient failures are retried. Defaults to :class:`wrgl.retry.RetryPolicy` with default arguments.
+        :param RequestScheduler scheduler: optional, limits request rate and concurrency. Can be shared with other clients.
+        :param Instrumentation instrumentation: optional, receives a :class:`wrgl.instrument.RequestEvent` for every request
+        :param str accept_encoding: optional, overrides the Accept-Encoding header of get requests, e.g. "identity"
+            to disable compression. The session's default header is sent if not given.
         """
         self._rsc_uri = rsc_uri.rstrip("/")
         self._client_id = client_id
         self._client_secret = client_secret
+        self._token_store = token_store
+        self._context = context if context is not None else UMAContext()
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.scheduler = scheduler
+        self.accept_encoding = accept_encoding
+        self.instrumentation = (
+            instrumentation if instrumentation is not None else Instrumentation()
+        )
+        if token_store is not None:
+            tokens = token_store.load(self._rsc_uri, self._client_id)
+            self._token_endpoint = tokens.get("token_endpoint", "")
+            if self._token_endpoint and tokens.get("access_token", ""):
+                self._context.set_access_token(
+                    self._token_endpoint, self._client_id, tokens["access_token"]
+                )
+            if tokens.get("rpt", "") and not self.rpt:
+                self.rpt = tokens["rpt"]
+
+    @property
+    def rpt(self) -> str:
+        """The current RPT, an empty string if none has been acquired yet
+
+        :rtype: str
+        """
+        return self._context.get_rpt(self._rsc_uri, self._client_id)
+
+    @rpt.setter
+    def rpt(self, value: str) -> None:
+        self._context.set_rpt(self._rsc_uri, self._client_id, value)
+
+    @property
+    def _access_token(self) -> str:
+        if not self._token_endpoint:
+            return ""
+        return self._context._access_tokens.get(
+            (self._token_endpoint, self._client_id), ""
+        )
+
+    def _save_tokens(self) -> None:
+        if self._token_store is not None:
+            self._token_store.save(
+                self._rsc_uri,
+                self._client_id,
+                {
+                    "token_endpoint": self._token_endpoint,
+                    "access_token": self._access_token,
+                    "rpt": self.rpt,
+                },
+            )
 
     def _headers(self, headers=None) -> Union[Dict, None]:
-        if self.rpt:
+        rpt = self.rpt
+        if rpt:
             if headers is None:
                 headers = dict()
-            headers["Authorization"] = "Bearer " + self.rpt
+            headers["Authorization"] = "Bearer " + rpt
         return headers
 
     def _extract_uma_ticket(
@@ -44,33 +328,14 @@ class UMAClient:
             return values.get("as_uri", None), values.get("ticket", None)
         return None, None
 
-    def _discover_uma_config(self, as_uri: str) -> Dict:
-        resp = requests.get(as_uri.rstrip("/") + "/.well-known/uma2-configuration")
-        resp.raise_for_status()
-        return resp.json()
-
-    def _fetch_access_token(self, token_endpoint: str) -> None:
-        resp = requests.post(
-            token_endpoint,
-            data={
-                "grant_type": "client_credentials",
-                "client_id": self._client_id,
-                "client_secret": self._client_secret,
-            },
-        )
-        resp.raise_for_status()
-        resp_data = resp.json()
-        self._access_token = resp_data["access_token"]
-        return
-
-    def _fetch_rpt(self, token_endpoint: str, uma_ticket: str) -> None:
-        resp = requests.post(
+    def _fetch_rpt(self, token_endpoint: str, access_token: str, uma_ticket: str) -> None:
+        resp = self._context.session.post(
             token_endpoint,
             data={
                 "grant_type": "urn:ietf:params:oauth:grant-type:uma-ticket",
                 "ticket": uma_ticket,
             },
-            headers={"Authorization": "Bearer " + self._access_token},
+            headers={"Authorization": "Bearer " + access_token},
         )
         resp.raise_for_status()
         resp_data = resp.json()
@@ -78,18 +343,25 @@ class UMAClient:
         return
 
     def _ensure_rpt(self, as_uri: str, uma_ticket: str) -> None:
-        uma_config = self._discover_uma_config(as_uri)
-        token_endpoint = uma_config["token_endpoint"]
-        if not self._access_token:
-            self._fetch_access_token(token_endpoint)
+        uma_config = self._context.get_uma_config(as_uri)
+        self._token_endpoint = uma_config["token_endpoint"]
+        access_token = self._context.get_access_token(
+            self._token_endpoint, self._client_id, self._client_secret
+        )
         try:
-            self._fetch_rpt(token_endpoint, uma_ticket)
+            self._fetch_rpt(self._token_endpoint, access_token, uma_ticket)
         except HTTPError as e:
             if e.response.status_code == 401:
-                self._fetch_access_token(token_endpoint)
-                self._fetch_rpt(token_endpoint, uma_ticket)
+                access_token = self._context.get_access_token(
+                    self._token_endpoint,
+                    self._client_id,
+                    self._client_secret,
+                    stale_token=access_token,
+                )
+                self._fetch_rpt(self._token_endpoint, access_token, uma_ticket)
             else:
                 raise
+        self._save_tokens()
 
     def _do_request(
         self,
@@ -98,18 +370,117 @@ class UMAClient:
         params=None,
         headers=None,
         create_request_args: Union[Callable[..., Dict], None] = None,
+        timing: Union[_Timing, None] = None,
         *args,
         **kwargs
     ) -> requests.Response:
         if create_request_args is not None:
-            args_dict = create_request_args()
-            args_dict["headers"] = self._headers(args_dict.get("headers", None))
-            return requests.request(method, url, **args_dict)
-        if params is not None:
-            params = {k: v for k, v in params.items() if v}
-        return requests.request(
-            method, url, params=params, headers=self._headers(headers), *args, **kwargs
+            kwargs = create_request_args()
+            kwargs["headers"] = self._headers(kwargs.get("headers", None))
+            args = ()
+        else:
+            if params is not None:
+                params = {k: v for k, v in params.items() if v}
+            kwargs = dict(kwargs, params=params, headers=self._headers(headers))
+        stream = kwargs.get("stream", False)
+        release = None
+        if self.scheduler is not None:
+            release = self.scheduler.acquire(url[len(self._rsc_uri) :])
+        _connect_timing.value = None
+        start = time.perf_counter()
+        try:
+            resp = self._context.session.request(method, url, *args, **kwargs)
+        except BaseException:
+            if release is not None:
+                release()
+            raise
+        if timing is not None:
+            timing.start = start
+            timing.connect = _connect_timing.value
+            timing.headers = start + resp.elapsed.total_seconds()
+            timing.done = None if stream else time.perf_counter()
+        if release is not None:
+            if stream:
+                # a streamed response occupies its slot until it is closed
+                _on_close(resp, release)
+            else:
+                release()
+        return resp
+
+    def _send(
+        self,
+        method: str,
+        url: str,
+        params=None,
+        headers=None,
+        create_request_args: Union[Callable[..., Dict], None] = None,
+        rpt_only=False,
+        timing: Union[_Timing, None] = None,
+        *args,
+        **kwargs
+    ) -> Tuple[requests.Response, bool]:
+        resp = self._do_request(
+            method, url, params, headers, create_request_args, timing, *args, **kwargs
+        )
+        if resp.status_code == 401:
+            as_uri, uma_ticket = self._extract_uma_ticket(resp)
+            if uma_ticket is not None:
+                self._ensure_rpt(as_uri, uma_ticket)
+                if rpt_only:
+                    return resp, True
+                resp.close()
+                resp = self._do_request(
+                    method,
+                    url,
+                    params,
+                    headers,
+                    create_request_args,
+                    timing,
+                    *args,
+                    **kwargs
+                )
+                return resp, True
+        return resp, False
+
+    def _report(
+        self,
+        method: str,
+        path: str,
+        resp: Union[requests.Response, None],
+        timing: _Timing,
+        retries: int,
+        auth_refreshes: int,
+        error: Union[BaseException, None] = None,
+    ) -> None:
+        event = RequestEvent(
+            method=method,
+            endpoint=endpoint_template(path),
+            retries=retries,
+            auth_refreshes=auth_refreshes,
+            error=None if error is None else type(error).__name__,
         )
+        if resp is None:
+            self.instrumentation.on_request(event)
+            return
+        event.status = resp.status_code
+        content_length = resp.request.headers.get("Content-Length", None)
+        if content_length is not None:
+            event.bytes_out = int(content_length)
+        if timing.start is not None:
+            event.connect = timing.connect
+            event.ttfb = timing.headers - timing.start - (timing.connect or 0)
+
+        def finish():
+            if timing.start is not None:
+                event.transfer = (timing.done or time.perf_counter()) - timing.headers
+            event.bytes_in = timing.bytes_in(resp)
+            self.instrumentation.on_request(event)
+
+        if timing.done is None and timing.start is not None:
+            # streamed response, measure the transfer once it is closed
+            _on_close(resp, finish)
+        else:
+            finish()
 
     def request(
         self,
@@ -119,38 +490,87 @@ class UMAClient:
         headers=None,
         create_request_args: Union[Callable[..., Dict], None] = None,
         rpt_only=False,
+        retry: Union[bool, None] = None,
         *args,
         **kwargs
     ) -> requests.Response:
         """Make a request
 
+        Transient failures are retried according to the client's :class:`wrgl.retry.RetryPolicy`.
+
         :param str method: HTTP verb
         :param str path: path relative to rsc_uri
         :param dict params: optional, query parameters
         :param dict headers: optional, HTTP headers
         :param func create_request_args: optional. If defined, this function is called to generate request arguments. Useful when request need to be retried.
         :param bool rpt_only: optional, stop when an RPT is acquired. Useful when the RPT is all that is needed.
+        :param bool retry: optional, whether this request can be retried. Defaults to retrying idempotent methods only.
+            Requests with a body should only opt in if they also define create_request_args.
         :param list args: extra positional arguments passed to requests.request. Ignored if create_request_args is defined.
         :param dict kwargs: extra keyword arguments passed to requests.request. Ignored if create_request_args is defined.
 
         :rtype: requests.Response
         """
         url = self._rsc_uri + path
-        resp = self._do_request(
-            method, url, params, headers, create_request_args, *args, **kwargs
-        )
-        if resp.status_code == 401:
-            as_uri, uma_ticket = self._extract_uma_ticket(resp)
-            if uma_ticket is not None:
-                self._ensure_rpt(as_uri, uma_ticket)
-                if rpt_only:
-                    return resp
-                resp = self._do_request(
-                    method, url, params, headers, create_request_args, *args, **kwargs
+        policy = self.retry_policy
+        retryable = policy.allows_method(method, retry)
+        timing = _Timing()
+        attempt = 0
+        auth_refreshes = 0
+        while True:
+            if policy.budget is not None:
+                policy.budget.record_request()
+            try:
+                resp, refreshed = self._send(
+                    method,
+                    url,
+                    params,
+                    headers,
+                    create_request_args,
+                    rpt_only,
+                    timing,
+                    *args,
+                    **kwargs
                 )
-        resp.raise_for_status()
+            except TRANSIENT_ERRORS as e:
+                if retryable and policy.wait(attempt):
+                    attempt += 1
+                    continue
+                self._report(method, path, None, timing, attempt, auth_refreshes, e)
+                raise
+            auth_refreshes += int(refreshed)
+            if (
+                retryable
+                and policy.is_retryable_response(resp)
+                and policy.wait(attempt, resp)
+            ):
+                resp.close()
+                attempt += 1
+                continue
+            break
+        self._report(method, path, resp, timing, attempt, auth_refreshes)
+        if rpt_only and resp.status_code == 401:
+            _, uma_ticket = self._extract_uma_ticket(resp)
+            if uma_ticket is not None:
+                return resp
+        try:
+            resp.raise_for_status()
+        except HTTPError:
+            if timing.done is None:
+                # read the error body of a streamed response then release it
+                resp.content
+                resp.close()
+            raise
         return resp
 
+    def span(self, name: str, **attributes):
+        """Wraps a higher-level operation in a span of the client's instrumentation
+
+        :param str name: name of the operation
+        :param dict attributes: attributes of the operation
+        """
+        return self.instrumentation.span(name, **attributes)
+
     def get(
         self, path: str, params=None, headers=None, *args, **kwargs
     ) -> requests.Response:
@@ -164,6 +584,9 @@ class UMAClient:
 
         :rtype: requests.Response
         """
+        if self.accept_encoding:
+            headers = dict(headers or dict())
+            headers.setdefault("Accept-Encoding", self.accept_encoding)
         return self.request(
             "GET", path, params=params, headers=headers, *args, **kwargs
         )
@@ -175,6 +598,7 @@ class UMAClient:
         headers=None,
         create_request_args: Union[Callable[..., Dict], None] = None,
         rpt_only=False,
+        retry: Union[bool, None] = None,
         *args,
         **kwargs
     ) -> requests.Response:
@@ -185,6 +609,7 @@ class UMAClient:
         :param dict headers: optional, HTTP headers
         :param func create_request_args: optional. If defined, this function is called to generate request arguments. Useful when request need to be retried.
         :param bool rpt_only: optional, stop when an RPT is acquired. Useful when the RPT is all that is needed.
+        :param bool retry: optional, opt in to retrying this request. Only safe if create_request_args is defined.
         :param list args: extra positional arguments passed to requests.request. Ignored if create_request_args is defined.
         :param dict kwargs: extra keyword arguments passed to requests.request. Ignored if create_request_args is defined.
 
@@ -197,6 +622,7 @@ class UMAClient:
             headers=headers,
             create_request_args=create_request_args,
             rpt_only=rpt_only,
+            retry=retry,
             *args,
             **kwargs
         )
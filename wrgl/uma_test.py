@@ -0,0 +1,101 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022 Wrangle Ltd
+
+import threading
+from unittest import TestCase
+
+from wrgl.fakeserver_test import FakeWrgld, _to_csv, synthetic_rows
+from wrgl.uma import UMAClient, UMAContext
+
+
+class FakeResponse(object):
+    def __init__(self, data):
+        self._data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self._data
+
+
+class FakeSession(object):
+    def __init__(self):
+        self.posts = []
+        self._lock = threading.Lock()
+
+    def post(self, url, data=None, headers=None):
+        with self._lock:
+            self.posts.append(data)
+            return FakeResponse({"access_token": "token-%d" % len(self.posts)})
+
+
+class UMAContextTestCase(TestCase):
+    def test_share_access_token(self):
+        session = FakeSession()
+        ctx = UMAContext(session=session)
+        threads = [
+            threading.Thread(
+                target=ctx.get_access_token,
+                args=("http://keycloak/token", "my-client", "secret"),
+            )
+            for _ in range(8)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(session.posts), 1)
+        self.assertEqual(
+            ctx.get_access_token("http://keycloak/token", "my-client", "secret"),
+            "token-1",
+        )
+        self.assertEqual(
+            ctx.get_access_token("http://keycloak/token", "other", "secret"),
+            "token-2",
+        )
+
+    def test_refresh_stale_access_token(self):
+        session = FakeSession()
+        ctx = UMAContext(session=session)
+        token = ctx.get_access_token("http://keycloak/token", "my-client", "secret")
+        new_token = ctx.get_access_token(
+            "http://keycloak/token", "my-client", "secret", stale_token=token
+        )
+        self.assertNotEqual(token, new_token)
+        # a token that was already replaced does not trigger another fetch
+        self.assertEqual(
+            ctx.get_access_token(
+                "http://keycloak/token", "my-client", "secret", stale_token=token
+            ),
+            new_token,
+        )
+        self.assertEqual(len(session.posts), 2)
+
+    def test_rpt_per_resource(self):
+        ctx = UMAContext(session=FakeSession())
+        client1 = UMAClient("http://localhost:8081/", "my-client", "secret", context=ctx)
+        client2 = UMAClient("http://localhost:8081", "my-client", "secret", context=ctx)
+        client3 = UMAClient("http://localhost:8082", "my-client", "secret", context=ctx)
+        client1.rpt = "abc"
+        self.assertEqual(client2.rpt, "abc")
+        self.assertEqual(client3.rpt, "")
+
+
+class AcceptEncodingTestCase(TestCase):
+    def test_negotiate_compression(self):
+        with FakeWrgld(auth=False) as server:
+            columns, rows = synthetic_rows(10, 2)
+            server.add_commit("main", columns, ["id"], rows)
+            client = UMAClient(server.uri, "my-client", "secret")
+            r = client.get("/blocks/", params={"head": "heads/main"})
+            self.assertIn("gzip", r.request.headers["Accept-Encoding"])
+            self.assertEqual(r.headers.get("Content-Encoding"), "gzip")
+            self.assertEqual(r.content, _to_csv(rows))
+
+            client = UMAClient(
+                server.uri, "my-client", "secret", accept_encoding="identity"
+            )
+            r = client.get("/blocks/", params={"head": "heads/main"})
+            self.assertNotIn("Content-Encoding", r.headers)
+            self.assertEqual(r.content, _to_csv(rows))
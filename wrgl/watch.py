@@ -0,0 +1,221 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022 Wrangle Ltd
+
+"""Watches references of many repositories and reports the ones that moved.
+
+A single :class:`RefWatcher` polls any number of repositories from one thread, or from an
+asyncio loop. Each poll is a conditional request, so a server that supports entity tags
+answers unchanged references with an empty response. Otherwise the returned references are
+compared with the previous ones. Callbacks only see references whose checksum changed.
+"""
+
+import asyncio
+import heapq
+import inspect
+import itertools
+import random
+import threading
+import time
+import typing
+
+import attr
+
+from wrgl import repository
+
+
+@attr.s(auto_attribs=True)
+class RefChange(object):
+    """A reference that moved between two polls
+
+    :ivar Repository repo: the repository of the reference
+    :ivar str ref: name of the reference, e.g. "heads/main"
+    :ivar str old: checksum of the previous commit, None if the reference was created
+    :ivar str new: checksum of the current commit, None if the reference was deleted
+    """
+
+    repo: "repository.Repository"
+    ref: str
+    old: typing.Union[str, None]
+    new: typing.Union[str, None]
+
+
+@attr.s(auto_attribs=True, eq=False)
+class _Watch(object):
+    repo: "repository.Repository"
+    callback: typing.Callable[[RefChange], typing.Any]
+    refs: typing.Union[typing.Set[str], None]
+    interval: float
+    etag: typing.Union[str, None] = None
+    known: typing.Union[typing.Dict[str, str], None] = None
+    failures: int = 0
+
+
+class RefWatcher(object):
+    """Polls references of repositories and calls back when they move, e.g.::
+
+        watcher = RefWatcher(interval=5)
+        watcher.add(repo, lambda change: print(change.ref, change.new), refs=["heads/main"])
+        watcher.run()
+
+    The first poll of a repository records its references without calling back. Poll
+    intervals are randomized by up to `jitter` so that many repositories do not poll in
+    lockstep. After a failed poll the interval doubles, up to `max_backoff`, until a poll
+    succeeds again.
+    """
+
+    interval: float
+    jitter: float
+    max_backoff: float
+
+    def __init__(
+        self,
+        interval: float = 5.0,
+        jitter: float = 0.1,
+        max_backoff: float = 300.0,
+        on_error: typing.Callable[["repository.Repository", Exception], typing.Any] = None,
+    ) -> None:
+        """
+        :param float interval: default number of seconds between two polls of a repository
+        :param float jitter: fraction of the interval that is randomized, between 0 and 1
+        :param float max_backoff: maximum number of seconds between polls of a failing repository
+        :param on_error: optional, called with the repository and the exception when a poll fails.
+            Failed polls are otherwise only retried.
+        """
+        self.interval = interval
+        self.jitter = jitter
+        self.max_backoff = max_backoff
+        self._on_error = on_error
+        self._queue: typing.List[typing.Tuple[float, int, _Watch]] = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def add(
+        self,
+        repo: "repository.Repository",
+        callback: typing.Callable[[RefChange], typing.Any],
+        refs: typing.Iterable[str] = None,
+        interval: float = None,
+    ) -> None:
+        """Starts watching a repository. The first poll is due within one jittered interval.
+
+        :param Repository repo: the repository to watch
+        :param callback: called with a :class:`RefChange` for each reference that moved. With
+            :func:`RefWatcher.run_async`, it may also be a coroutine function.
+        :param list[str] refs: optional, names of the references to report, e.g. "heads/main".
+            All references are reported if not set.
+        :param float interval: optional, overrides the interval of the watcher for this repository
+        """
+        w = _Watch(
+            repo=repo,
+            callback=callback,
+            refs=None if refs is None else set(refs),
+            interval=self.interval if interval is None else interval,
+        )
+        self._schedule(w, random.uniform(0, self.jitter * w.interval))
+
+    def remove(self, repo: "repository.Repository") -> None:
+        """Stops watching a repository"""
+        with self._lock:
+            self._queue = [item for item in self._queue if item[2].repo is not repo]
+            heapq.heapify(self._queue)
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def _schedule(self, w: _Watch, delay: float) -> None:
+        with self._lock:
+            heapq.heappush(self._queue, (time.monotonic() + delay, next(self._seq), w))
+
+    def _pop_due(self) -> typing.List[_Watch]:
+        now = time.monotonic()
+        due = []
+        with self._lock:
+            while self._queue and self._queue[0][0] <= now:
+                due.append(heapq.heappop(self._queue)[2])
+        return due
+
+    def _next_delay(self) -> float:
+        with self._lock:
+            if not self._queue:
+                return self.interval
+            return max(0.0, self._queue[0][0] - time.monotonic())
+
+    def _fetch(self, w: _Watch) -> typing.List[RefChange]:
+        """Polls one repository and returns the changes, updating its state"""
+        try:
+            refs, w.etag = w.repo.poll_refs(w.etag)
+        except Exception as e:
+            w.failures += 1
+            if self._on_error is not None:
+                self._on_error(w.repo, e)
+            return []
+        w.failures = 0
+        if refs is None:
+            return []
+        old, w.known = w.known, refs
+        if old is None:
+            return []
+        names = set(old) | set(refs)
+        if w.refs is not None:
+            names &= w.refs
+        return [
+            RefChange(w.repo, name, old.get(name), refs.get(name))
+            for name in sorted(names)
+            if old.get(name) != refs.get(name)
+        ]
+
+    def _reschedule(self, w: _Watch) -> None:
+        delay = w.interval
+        if w.failures:
+            delay = min(self.max_backoff, delay * 2**w.failures)
+        self._schedule(w, delay * (1 + random.uniform(-self.jitter, self.jitter)))
+
+    def poll(self) -> float:
+        """Polls the repositories that are due and calls back for their moved references
+
+        :return: number of seconds until the next poll is due
+        :rtype: float
+        """
+        results = []
+        for w in self._pop_due():
+            results.append((w, self._fetch(w)))
+            self._reschedule(w)
+        for w, changes in results:
+            for change in changes:
+                w.callback(change)
+        return self._next_delay()
+
+    def run(self, stop: threading.Event = None) -> None:
+        """Polls on the calling thread until `stop` is set
+
+        :param threading.Event stop: optional, ends the loop once set. Runs forever if not given.
+        """
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            stop.wait(self.poll())
+
+    async def run_async(self, stop: asyncio.Event = None) -> None:
+        """Polls from the running asyncio loop until `stop` is set. Requests of repositories
+        that are due together run concurrently in the loop's default executor, and callbacks
+        run on the loop.
+
+        :param asyncio.Event stop: optional, ends the loop once set. Runs forever if not given.
+        """
+        loop = asyncio.get_running_loop()
+        stop = stop or asyncio.Event()
+        while not stop.is_set():
+            due = self._pop_due()
+            results = await asyncio.gather(
+                *[loop.run_in_executor(None, self._fetch, w) for w in due]
+            )
+            for w in due:
+                self._reschedule(w)
+            for w, changes in zip(due, results):
+                for change in changes:
+                    result = w.callback(change)
+                    if inspect.isawaitable(result):
+                        await result
+            try:
+                await asyncio.wait_for(stop.wait(), self._next_delay())
+            except asyncio.TimeoutError:
+                pass
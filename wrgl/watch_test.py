@@ -0,0 +1,135 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022 Wrangle Ltd
+
+import asyncio
+import threading
+from unittest import TestCase
+
+from wrgl.fakeserver_test import FakeWrgld
+from wrgl.repository import Repository
+from wrgl.retry import RetryPolicy
+from wrgl.watch import RefChange, RefWatcher
+
+
+class PollRefsTestCase(TestCase):
+    def test_etag(self):
+        server = FakeWrgld().start()
+        self.addCleanup(server.stop)
+        repo = Repository(server.uri, "my-client", "secret")
+        com_sum = server.add_commit("main", ["id"], ["id"], [["1"]])
+        refs, etag = repo.poll_refs()
+        self.assertEqual(refs, {"heads/main": com_sum})
+        self.assertIsNotNone(etag)
+        self.assertEqual(repo.poll_refs(etag), (None, etag))
+        com_sum = server.add_commit("main", ["id"], ["id"], [["2"]])
+        refs, new_etag = repo.poll_refs(etag)
+        self.assertEqual(refs, {"heads/main": com_sum})
+        self.assertNotEqual(new_etag, etag)
+
+    def test_without_etag(self):
+        server = FakeWrgld(etags=False).start()
+        self.addCleanup(server.stop)
+        repo = Repository(server.uri, "my-client", "secret")
+        com_sum = server.add_commit("main", ["id"], ["id"], [["1"]])
+        self.assertEqual(repo.poll_refs(), ({"heads/main": com_sum}, None))
+
+
+class RefWatcherTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.servers = []
+        self.repos = []
+        for etags in (True, False):
+            server = FakeWrgld(etags=etags).start()
+            self.addCleanup(server.stop)
+            self.servers.append(server)
+            self.repos.append(
+                Repository(
+                    server.uri,
+                    "my-client",
+                    "secret",
+                    retry_policy=RetryPolicy(max_attempts=1),
+                )
+            )
+        self.changes = []
+        self.watcher = RefWatcher(interval=0, jitter=0)
+
+    def commit(self, i, branch="main"):
+        return self.servers[i].add_commit(branch, ["id"], ["id"], [["1"]])
+
+    def test_poll(self):
+        old = [self.commit(0), self.commit(1)]
+        self.watcher.add(self.repos[0], self.changes.append)
+        self.watcher.add(self.repos[1], self.changes.append, refs=["heads/main"])
+        self.watcher.poll()
+        self.assertEqual(self.changes, [])
+        new = [self.commit(0), self.commit(1)]
+        self.commit(1, "other")
+        feature = self.commit(0, "feature")
+        self.watcher.poll()
+        self.assertEqual(
+            self.changes,
+            [
+                RefChange(self.repos[0], "heads/feature", None, feature),
+                RefChange(self.repos[0], "heads/main", old[0], new[0]),
+                RefChange(self.repos[1], "heads/main", old[1], new[1]),
+            ],
+        )
+        self.changes.clear()
+        self.watcher.poll()
+        self.assertEqual(self.changes, [])
+
+    def test_backoff(self):
+        errors = []
+        watcher = RefWatcher(interval=1, jitter=0, on_error=lambda repo, e: errors.append(e))
+        watcher.add(self.repos[0], self.changes.append)
+        self.servers[0].fail_next(2, 503)
+        watcher._queue[0] = (0, 0, watcher._queue[0][2])
+        self.assertAlmostEqual(watcher.poll(), 2, places=1)
+        watcher._queue[0] = (0, 0, watcher._queue[0][2])
+        self.assertAlmostEqual(watcher.poll(), 4, places=1)
+        watcher._queue[0] = (0, 0, watcher._queue[0][2])
+        self.assertAlmostEqual(watcher.poll(), 1, places=1)
+        self.assertEqual(len(errors), 2)
+
+    def test_run(self):
+        self.commit(0)
+        stop = threading.Event()
+
+        def callback(change):
+            self.changes.append(change)
+            stop.set()
+
+        self.watcher.add(self.repos[0], callback, interval=0.01)
+        # the first poll records references
+        self.watcher.poll()
+        thread = threading.Thread(target=self.watcher.run, args=(stop,))
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(stop.set)
+        new = self.commit(0)
+        self.assertTrue(stop.wait(5))
+        self.assertEqual([c.new for c in self.changes], [new])
+
+    def test_run_async(self):
+        self.commit(0)
+        self.commit(1)
+
+        async def main():
+            stop = asyncio.Event()
+
+            async def callback(change):
+                self.changes.append(change)
+                if len(self.changes) == 2:
+                    stop.set()
+
+            for repo in self.repos:
+                self.watcher.add(repo, callback, interval=0.01)
+            self.watcher.poll()
+            task = asyncio.ensure_future(self.watcher.run_async(stop))
+            new = [self.commit(0), self.commit(1)]
+            await asyncio.wait_for(task, 5)
+            return new
+
+        new = asyncio.run(main())
+        self.assertEqual(sorted(c.new for c in self.changes), sorted(new))